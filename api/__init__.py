@@ -0,0 +1,5 @@
+import time
+
+# start of the imports of the process, the first import of the api package, for
+# the startup timings of the API workers
+IMPORTS_STARTED_AT = time.perf_counter()
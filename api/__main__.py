@@ -1,3 +1,4 @@
+import argparse
 import logging
 import os
 import sys
@@ -59,8 +60,8 @@ def setup_logging():
     )
 
 
-def main() -> None:
-    """Entrypoint of the application."""
+def serve() -> None:
+    """Runs the API server."""
     server = Server(
         Config(
             "api.web.application:get_app",
@@ -76,5 +77,258 @@ def main() -> None:
     server.run()
 
 
+def migrate() -> None:
+    """Creates the extension, the tables and the indexes of the database."""
+    from sqlalchemy import create_engine
+
+    from api.infra.db.migration import migrate
+
+    setup_logging()
+    engine = create_engine(str(settings.db_url))
+    migrate(engine)
+    engine.dispose()
+
+
+def work() -> None:
+    """Runs an ingestion worker."""
+    from api.worker import run_worker
+
+    setup_logging()
+    logger.info("Starting ingestion worker...")
+    run_worker()
+
+
+def quantization_report(sample_size: int, k: int) -> None:
+    """Prints the recall and latency of the vector index storage precisions."""
+    from api.quantization_report import (
+        format_quantization_report,
+        run_quantization_report,
+    )
+
+    setup_logging()
+    rows = run_quantization_report(sample_size=sample_size, k=k)
+    print(format_quantization_report(rows, k))
+
+
+def build_vector_store() -> None:
+    """Rebuilds the vector store with the chunk embeddings of the database."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from api.infra.db.model.file import FileChunk
+    from api.infra.db.repository.file import VectorStoreFileChunkRepository
+    from api.infra.vector_store import get_vector_store
+
+    setup_logging()
+    engine = create_engine(str(settings.db_url))
+    with Session(engine) as session:
+        VectorStoreFileChunkRepository(
+            FileChunk,
+            session,
+            get_vector_store(),
+        ).rebuild_vector_store()
+    engine.dispose()
+
+
+def hash_chunks() -> None:
+    """Computes the content hash of the chunks stored before chunk hashes existed."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from api.infra.db.model.file import FileChunk
+    from api.infra.db.repository.file import FileChunkRepository
+
+    setup_logging()
+    engine = create_engine(str(settings.db_url))
+    with Session(engine) as session:
+        updated = FileChunkRepository(FileChunk, session).backfill_content_hashes()
+    engine.dispose()
+    logger.info(f"Hashed the content of {updated} chunks")
+
+
+def partition_file_chunks() -> None:
+    """Converts a file_chunk table created before the collections into partitions."""
+    from sqlalchemy import create_engine
+
+    from api.infra.db.migration import migrate
+    from api.infra.db.model import load_all_models
+    from api.infra.db.partition import partition_file_chunk_table
+
+    setup_logging()
+    load_all_models()
+    engine = create_engine(str(settings.db_url))
+    with engine.begin() as connection:
+        copied = partition_file_chunk_table(connection)
+    logger.info(f"Copied {copied} chunks to the partitions of their collection")
+    # the vector and full-text indexes of the partitions
+    migrate(engine)
+    engine.dispose()
+
+
+def ingest(directory: str, collection: str) -> None:
+    """Ingests the files of a directory and its subdirectories into a collection."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from api.infra.db.model.collection import Collection
+    from api.infra.db.repository.collection import CollectionRepository
+    from api.web.service.bulk_ingestion import (
+        BulkIngestionPipeline,
+        find_ingestible_files,
+    )
+
+    setup_logging()
+    engine = create_engine(str(settings.db_url))
+    session_factory = sessionmaker(engine, expire_on_commit=False)
+    with session_factory() as session:
+        collection_repository = CollectionRepository(Collection, session)
+        if collection_repository.get_by_name(collection) is None:
+            collection_repository.create_collection(collection)
+    report = BulkIngestionPipeline(session_factory, collection=collection).run(
+        find_ingestible_files(directory),
+    )
+    engine.dispose()
+    print(report.to_dict())
+
+
+def benchmark(
+    file_sizes: list[int],
+    corpus_sizes: list[int],
+    repeat: int,
+    database: bool,
+    output: str,
+    baseline: str | None,
+    tolerance: float,
+) -> None:
+    """Benchmarks the ingestion and search hot paths, fails on regressions."""
+    import json
+
+    from api.benchmarks.suite import (
+        compare_benchmarks,
+        format_benchmarks,
+        run_benchmarks,
+        write_benchmarks,
+    )
+
+    setup_logging()
+    report = run_benchmarks(file_sizes, corpus_sizes, repeat, database)
+    write_benchmarks(report, output)
+    print(format_benchmarks(report))
+    if baseline is None:
+        return
+    with open(baseline) as f:
+        regressions = compare_benchmarks(json.load(f), report, tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+def _sizes(value: str) -> list[int]:
+    return [int(size) for size in value.split(",")]
+
+
+def main() -> None:
+    """Entrypoint of the application."""
+    parser = argparse.ArgumentParser(prog="python -m api")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("serve", help="run the API server (default)")
+    subparsers.add_parser(
+        "migrate",
+        help="create the extension, tables and indexes of the database, run it once "
+        "before starting the API and the workers, and after each upgrade",
+    )
+    subparsers.add_parser(
+        "worker",
+        help="run an ingestion worker creating the chunks embeddings of the uploaded files",
+    )
+    report_parser = subparsers.add_parser(
+        "quantization-report",
+        help="compare the recall and latency of the full, half and binary vector indexes",
+    )
+    report_parser.add_argument("--sample-size", type=int, default=100)
+    report_parser.add_argument("-k", type=int, default=10)
+    subparsers.add_parser(
+        "build-vector-store",
+        help="rebuild the vector store with the chunk embeddings of the database",
+    )
+    subparsers.add_parser(
+        "hash-chunks",
+        help="compute the content hash of the chunks stored without one, so that "
+        "their embeddings are reused",
+    )
+    subparsers.add_parser(
+        "partition-file-chunks",
+        help="convert a file_chunk table created before the collections into a table "
+        "partitioned by collection, the API and the workers must be stopped",
+    )
+    ingest_parser = subparsers.add_parser(
+        "ingest",
+        help="parse, embed and insert the files of a directory, with pipelined stages",
+    )
+    ingest_parser.add_argument("directory")
+    ingest_parser.add_argument(
+        "--collection",
+        default="default",
+        help="collection of the files, created if it does not exist",
+    )
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="time the parsing, chunking, token counting, insert and search on a "
+        "synthetic corpus and write the results to a JSON file",
+    )
+    benchmark_parser.add_argument(
+        "--file-sizes",
+        type=_sizes,
+        default=[1000, 10000, 100000],
+        help="comma-separated numbers of words of the parsed files",
+    )
+    benchmark_parser.add_argument(
+        "--corpus-sizes",
+        type=_sizes,
+        default=[1000, 10000],
+        help="comma-separated numbers of chunks in the database",
+    )
+    benchmark_parser.add_argument("--repeat", type=int, default=5)
+    benchmark_parser.add_argument(
+        "--no-database",
+        action="store_true",
+        help="skip the benchmarks needing the database",
+    )
+    benchmark_parser.add_argument("--output", default="benchmark.json")
+    benchmark_parser.add_argument(
+        "--baseline",
+        help="JSON results of a previous run, slower medians are reported",
+    )
+    benchmark_parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    if args.command == "worker":
+        work()
+    elif args.command == "migrate":
+        migrate()
+    elif args.command == "build-vector-store":
+        build_vector_store()
+    elif args.command == "benchmark":
+        benchmark(
+            args.file_sizes,
+            args.corpus_sizes,
+            args.repeat,
+            not args.no_database,
+            args.output,
+            args.baseline,
+            args.tolerance,
+        )
+    elif args.command == "hash-chunks":
+        hash_chunks()
+    elif args.command == "partition-file-chunks":
+        partition_file_chunks()
+    elif args.command == "ingest":
+        ingest(args.directory, args.collection)
+    elif args.command == "quantization-report":
+        quantization_report(args.sample_size, args.k)
+    else:
+        serve()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import random
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from api.web.service.embedding_provider import EmbeddingProvider
+
+# words of the synthetic texts, drawn with a fixed seed so that every run parses,
+# chunks and embeds the same corpus
+VOCABULARY = (
+    "the of and to in is that for it as was with be by on not he this are or his "
+    "from at which but have an they you were her she there been one all we their "
+    "search vector embedding index document chunk query database token model file "
+    "semantic similarity distance cosine latency throughput cluster partition page "
+    "ingestion pipeline worker process thread memory cache batch request response "
+    "postgres table column row transaction commit schema tensor matrix float score"
+).split()
+WORDS_PER_LINE = 12
+# words written on a page of a synthetic PDF, about the density of a text page
+WORDS_PER_PDF_PAGE = 400
+
+
+def generate_text(words: int, seed: int = 0) -> str:
+    """
+    Generates a deterministic text of random words from a fixed vocabulary
+    :param words: The number of words
+    :param seed: The seed of the random words
+    :return: The text, in lines of WORDS_PER_LINE words
+    """
+    rng = random.Random(seed)
+    drawn = rng.choices(VOCABULARY, k=words)
+    return "\n".join(
+        " ".join(drawn[i : i + WORDS_PER_LINE])
+        for i in range(0, len(drawn), WORDS_PER_LINE)
+    )
+
+
+def write_txt_file(directory: str, words: int, seed: int = 0) -> str:
+    """
+    Writes a synthetic TXT file
+    :param directory: The directory of the file
+    :param words: The number of words of the file
+    :param seed: The seed of the random words
+    :return: The file path
+    """
+    path = os.path.join(directory, f"synthetic-{words}-{seed}.txt")
+    with open(path, "w") as f:
+        f.write(generate_text(words, seed))
+    return path
+
+
+def write_pdf_file(directory: str, words: int, seed: int = 0) -> str:
+    """
+    Writes a synthetic PDF file with a text layer, WORDS_PER_PDF_PAGE words per page
+    :param directory: The directory of the file
+    :param words: The number of words of the file
+    :param seed: The seed of the random words
+    :return: The file path
+    """
+    path = os.path.join(directory, f"synthetic-{words}-{seed}.pdf")
+    text = generate_text(words, seed).split("\n")
+    lines_per_page = WORDS_PER_PDF_PAGE // WORDS_PER_LINE
+    with fitz.open() as document:
+        for i in range(0, len(text), lines_per_page):
+            page = document.new_page()
+            page.insert_textbox(
+                page.rect + (36, 36, -36, -36),
+                "\n".join(text[i : i + lines_per_page]),
+                fontsize=8,
+            )
+        document.save(path)
+    return path
+
+
+class SyntheticEmbeddingProvider(EmbeddingProvider):
+    """
+    Stands in for a real embedding provider in the benchmarks, a text is embedded
+    as a random unit vector seeded by its hash, without any network call.
+    """
+
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+
+    @property
+    def model_name(self) -> str:
+        return f"synthetic-{self.dimensions}"
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed(text).tolist() for text in texts]
+
+    def embed(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        embedding = np.random.default_rng(seed).standard_normal(
+            self.dimensions,
+            dtype=np.float32,
+        )
+        return embedding / np.linalg.norm(embedding)
@@ -0,0 +1,318 @@
+import datetime
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+from fastapi_pagination import Params
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from api.benchmarks.corpus import (
+    SyntheticEmbeddingProvider,
+    generate_text,
+    write_pdf_file,
+    write_txt_file,
+)
+from api.infra.db.model.file import File, FileChunk
+from api.infra.db.repository.file import FileChunkRepository
+from api.settings import settings
+from api.web.service.chunker import chunk_content_hash
+from api.web.service.file_chunk import FileChunkService
+from api.web.service.file_parser import FileParser
+
+# chunks of a synthetic file of the repository benchmarks, the searches rank files
+CHUNKS_PER_FILE = 10
+
+
+@dataclass
+class BenchmarkResult:
+    """Timings of a benchmarked function at a corpus size."""
+
+    name: str
+    # words of the parsed or chunked text, or chunks in the database
+    size: int
+    repeat: int
+    min_ms: float
+    median_ms: float
+    mean_ms: float
+
+
+def measure(
+    name: str,
+    size: int,
+    function: Callable[[], Any],
+    repeat: int,
+) -> BenchmarkResult:
+    """
+    Times the calls of a function, after a first call warming up the caches
+    :param name: The benchmark name
+    :param size: The corpus size
+    :param function: The function, called without arguments
+    :param repeat: The number of timed calls
+    :return: The timings
+    """
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    result = BenchmarkResult(
+        name=name,
+        size=size,
+        repeat=repeat,
+        min_ms=min(timings),
+        median_ms=statistics.median(timings),
+        mean_ms=statistics.fmean(timings),
+    )
+    logger.info(f"{name} at size {size}: {result.median_ms:.3f} ms")
+    return result
+
+
+def run_text_benchmarks(file_sizes: list[int], repeat: int) -> list[BenchmarkResult]:
+    """
+    Benchmarks the parsing of TXT and PDF files, the chunking and the token counting
+    of their texts
+    :param file_sizes: The numbers of words of the synthetic files
+    :param repeat: The number of timed calls of each function
+    :return: The timings
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for words in file_sizes:
+            txt_path = write_txt_file(directory, words)
+            pdf_path = write_pdf_file(directory, words)
+            text = generate_text(words)
+            results += [
+                measure(
+                    "file_parser.parse.txt",
+                    words,
+                    FileParser(txt_path).parse,
+                    repeat,
+                ),
+                measure(
+                    "file_parser.parse.pdf",
+                    words,
+                    FileParser(pdf_path).parse,
+                    repeat,
+                ),
+                measure(
+                    "file_chunk_service.split_text_into_chunks",
+                    words,
+                    lambda: FileChunkService.split_text_into_chunks(text),
+                    repeat,
+                ),
+                measure(
+                    "file_chunk_service.num_tokens_from_string",
+                    words,
+                    lambda: FileChunkService.num_tokens_from_string(text),
+                    repeat,
+                ),
+            ]
+    return results
+
+
+def run_repository_benchmarks(
+    corpus_sizes: list[int],
+    repeat: int,
+) -> list[BenchmarkResult]:
+    """
+    Benchmarks the insert of a chunk and the similarity search on growing numbers of
+    synthetic chunks. The chunks are inserted in a transaction rolled back at the end,
+    the database is left unchanged but must be migrated, with its indexes.
+    :param corpus_sizes: The numbers of chunks in the database
+    :param repeat: The number of timed calls of each function
+    :return: The timings
+    """
+    embedding_provider = SyntheticEmbeddingProvider()
+    questions = itertools.cycle(
+        embedding_provider.embed_batch([f"question {i}" for i in range(repeat + 1)]),
+    )
+    results = []
+    engine = create_engine(str(settings.db_url))
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        # the commits of the repositories only release savepoints of the transaction
+        session = Session(bind=connection, join_transaction_mode="create_savepoint")
+        file_chunk_repository = FileChunkRepository(FileChunk, session)
+        loaded, file_id = 0, None
+        try:
+            for size in sorted(set(corpus_sizes)):
+                files = _load_synthetic_chunks(
+                    session,
+                    embedding_provider,
+                    loaded,
+                    size,
+                )
+                loaded = size
+                file_id = file_id or files[0].id
+                chunk_text = generate_text(100, seed=size)
+                embedding = embedding_provider.embed(chunk_text).tolist()
+                results += [
+                    measure(
+                        "file_chunk_repository.create",
+                        size,
+                        lambda: file_chunk_repository.create(
+                            FileChunk(
+                                file_id=file_id,
+                                chunk_text=chunk_text,
+                                embedding_vector=embedding,
+                                embedding_model=embedding_provider.model_name,
+                            ),
+                        ),
+                        repeat,
+                    ),
+                    measure(
+                        "file_chunk_repository.find_similar_file_chunks",
+                        size,
+                        lambda: file_chunk_repository.find_similar_file_chunks(
+                            next(questions),
+                            Params(page=1, size=10),
+                        ),
+                        repeat,
+                    ),
+                ]
+        finally:
+            session.close()
+            transaction.rollback()
+    engine.dispose()
+    return results
+
+
+def _load_synthetic_chunks(
+    session: Session,
+    embedding_provider: SyntheticEmbeddingProvider,
+    start: int,
+    stop: int,
+) -> list[File]:
+    files = [
+        File(
+            name=f"synthetic-{i}.txt",
+            path=f"synthetic-{i}.txt",
+            size=0,
+            content_hash=f"{i:064x}",
+            content="",
+        )
+        for i in range(start // CHUNKS_PER_FILE, -(-stop // CHUNKS_PER_FILE))
+    ]
+    session.add_all(files)
+    session.flush()
+    chunk_texts = [generate_text(100, seed=i) for i in range(start, stop)]
+    FileChunkRepository(FileChunk, session).copy_in(
+        [
+            (
+                files[i // CHUNKS_PER_FILE - start // CHUNKS_PER_FILE].id,
+                chunk_text,
+                chunk_content_hash(chunk_text),
+                embedding,
+            )
+            for i, chunk_text, embedding in zip(
+                range(start, stop),
+                chunk_texts,
+                embedding_provider.embed_batch(chunk_texts),
+            )
+        ],
+        embedding_provider.model_name,
+    )
+    return files
+
+
+def run_benchmarks(
+    file_sizes: list[int],
+    corpus_sizes: list[int],
+    repeat: int = 5,
+    database: bool = True,
+) -> dict[str, Any]:
+    """
+    Runs the benchmarks of the ingestion and search hot paths
+    :param file_sizes: The numbers of words of the parsed and chunked texts
+    :param corpus_sizes: The numbers of chunks in the database
+    :param repeat: The number of timed calls of each function
+    :param database: Whether to run the repository benchmarks, which need the database
+    :return: The report, serializable to JSON
+    """
+    results = run_text_benchmarks(file_sizes, repeat)
+    if database:
+        results += run_repository_benchmarks(corpus_sizes, repeat)
+    return {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "settings": {
+            "chunk_size_tokens": settings.chunk_size_tokens,
+            "embedding_storage": settings.embedding_storage.value,
+            "hnsw_ef_search": settings.hnsw_ef_search,
+            "pdf_workers": settings.pdf_workers,
+        },
+        "results": [asdict(result) for result in results],
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_benchmarks(
+    baseline: dict[str, Any],
+    report: dict[str, Any],
+    tolerance: float,
+) -> list[str]:
+    """
+    Compares the median timings of a report with the ones of a baseline report
+    :param baseline: The baseline report, usually of a previous commit
+    :param report: The report
+    :param tolerance: The accepted slowdown, 0.25 accepts medians 25% slower
+    :return: The description of each regression
+    """
+    baseline_medians = {
+        (result["name"], result["size"]): result["median_ms"]
+        for result in baseline["results"]
+    }
+    regressions = []
+    for result in report["results"]:
+        baseline_median = baseline_medians.get((result["name"], result["size"]))
+        if not baseline_median:
+            continue
+        ratio = result["median_ms"] / baseline_median
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{result['name']} at size {result['size']}: "
+                f"{baseline_median:.3f} ms -> {result['median_ms']:.3f} ms "
+                f"(x{ratio:.2f})",
+            )
+    return regressions
+
+
+def format_benchmarks(report: dict[str, Any]) -> str:
+    """
+    Formats the results of a report as a text table
+    :param report: The report
+    :return: The table
+    """
+    lines = [f"{'benchmark':<48} {'size':>8} {'median ms':>10} {'min ms':>10}"]
+    for result in report["results"]:
+        lines.append(
+            f"{result['name']:<48} {result['size']:>8} "
+            f"{result['median_ms']:>10.3f} {result['min_ms']:>10.3f}",
+        )
+    return "\n".join(lines)
+
+
+def write_benchmarks(report: dict[str, Any], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
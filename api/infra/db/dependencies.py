@@ -1,5 +1,6 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette.requests import Request
 
@@ -18,3 +19,21 @@ async def get_db_session(request: Request) -> Generator[Session, None, None]:
     finally:
         session.commit()
         session.close()
+
+
+async def get_async_db_session(
+    request: Request,
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Create and get asynchronous database session.
+
+    :param request: current request.
+    :yield: asynchronous database session.
+    """
+    session: AsyncSession = request.app.state.db_async_session_factory()
+
+    try:  # noqa: WPS501
+        yield session
+    finally:
+        await session.commit()
+        await session.close()
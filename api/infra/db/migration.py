@@ -0,0 +1,127 @@
+import time
+
+from loguru import logger
+from sqlalchemy import Connection, Engine, text
+
+from api.infra.db.meta import meta
+from api.infra.db.model import load_all_models
+from api.infra.db.model.collection import DEFAULT_COLLECTION
+from api.infra.db.model.file import FILE_EXTENSION_PATTERN, TEXT_SEARCH_CONFIG
+from api.infra.db.partition import create_collection_partitions
+from api.infra.db.quantization import create_index_statement
+from api.settings import EmbeddingStorage, settings
+
+
+def migrate(engine: Engine) -> None:  # pragma: no cover
+    """
+    Creates the extension, the tables, the missing columns and the indexes of the
+    database, run once by `python -m api migrate` instead of by every worker start.
+    Every statement is idempotent, the migration is run again after an upgrade.
+
+    :param engine: database engine.
+    """
+    start = time.perf_counter()
+    load_all_models()
+    with engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        if settings.embedding_storage != EmbeddingStorage.FULL:
+            # halfvec and binary_quantize come with pgvector 0.7
+            connection.execute(text("ALTER EXTENSION vector UPDATE"))
+    with engine.begin() as connection:
+        meta.create_all(connection, checkfirst=True)
+        _add_missing_columns(connection)
+        # the indexes created on file_chunk below are created on each partition
+        create_collection_partitions(connection)
+        # the collections of all the files exist once their partitions are created
+        _add_missing_foreign_keys(connection)
+        # the index must use the same distance operator as the search queries,
+        # replace an index built with another operator class
+        if _index_uses_operator_class(connection, "idx_vector", "vector_l2_ops"):
+            connection.execute(text("DROP INDEX idx_vector"))
+        # create index on vector column, or on its quantized expression
+        connection.execute(text(create_index_statement(settings.embedding_storage)))
+        # create the full-text index of the lexical searches
+        connection.execute(
+            text(
+                """
+                CREATE INDEX IF NOT EXISTS idx_chunk_tsv ON file_chunk USING gin (chunk_tsv);
+                """,
+            ),
+        )
+    logger.info(f"Migrated the database in {time.perf_counter() - start:.2f}s")
+
+
+def _add_missing_columns(connection: Connection) -> None:  # pragma: no cover
+    """
+    Adds the columns created after the tables, create_all only creates missing tables.
+
+    :param connection: database connection.
+    """
+    connection.execute(
+        text(
+            f"""
+            ALTER TABLE file ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+            ALTER TABLE file ADD COLUMN IF NOT EXISTS text_path VARCHAR;
+            ALTER TABLE file ADD COLUMN IF NOT EXISTS collection VARCHAR(48)
+                NOT NULL DEFAULT '{DEFAULT_COLLECTION}';
+            CREATE INDEX IF NOT EXISTS ix_file_collection ON file (collection);
+            ALTER TABLE file_chunk ADD COLUMN IF NOT EXISTS collection VARCHAR(48)
+                NOT NULL DEFAULT '{DEFAULT_COLLECTION}';
+            CREATE INDEX IF NOT EXISTS ix_file_content_hash ON file (content_hash);
+            ALTER TABLE file_chunk ADD COLUMN IF NOT EXISTS chunk_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(chunk_text, ''))) STORED;
+            ALTER TABLE file_chunk ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+            ALTER TABLE file_chunk ADD COLUMN IF NOT EXISTS embedding_model VARCHAR;
+            CREATE INDEX IF NOT EXISTS ix_file_chunk_content_hash ON file_chunk (content_hash);
+            CREATE INDEX IF NOT EXISTS ix_file_chunk_file_id ON file_chunk (file_id);
+            CREATE INDEX IF NOT EXISTS ix_file_created_at ON file (created_at);
+            CREATE INDEX IF NOT EXISTS ix_file_size ON file (size);
+            CREATE INDEX IF NOT EXISTS ix_file_extension
+                ON file (lower(substring(name FROM '{FILE_EXTENSION_PATTERN}')));
+            """,
+        ),
+    )
+
+
+def _add_missing_foreign_keys(connection: Connection) -> None:  # pragma: no cover
+    """
+    Adds the foreign keys created after the tables, PostgreSQL has no
+    ADD CONSTRAINT IF NOT EXISTS.
+
+    :param connection: database connection.
+    """
+    connection.execute(
+        text(
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT FROM pg_constraint WHERE conname = 'file_collection_fkey'
+                ) THEN
+                    ALTER TABLE file ADD CONSTRAINT file_collection_fkey
+                        FOREIGN KEY (collection) REFERENCES collection (name);
+                END IF;
+            END $$;
+            """,
+        ),
+    )
+
+
+def _index_uses_operator_class(
+    connection: Connection,
+    index_name: str,
+    operator_class: str,
+) -> bool:  # pragma: no cover
+    """
+    Checks if an existing index is built with an operator class.
+
+    :param connection: database connection.
+    :param index_name: name of the index.
+    :param operator_class: name of the operator class.
+    :return: True if the index exists and uses the operator class.
+    """
+    index_definition = connection.execute(
+        text("SELECT indexdef FROM pg_indexes WHERE indexname = :index_name"),
+        {"index_name": index_name},
+    ).scalar()
+    return index_definition is not None and operator_class in index_definition
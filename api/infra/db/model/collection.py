@@ -0,0 +1,20 @@
+from pydantic import ConfigDict
+from sqlalchemy import Column, DateTime, Integer, String, func
+
+from api.infra.db.model.base import Base
+
+# collection of the files uploaded without one
+DEFAULT_COLLECTION = "default"
+# the name of a collection is part of the name of its chunk partition
+COLLECTION_NAME_PATTERN = r"^[a-z][a-z0-9_]{0,47}$"
+
+
+class Collection(Base):
+    """Collection model, a namespace of files whose chunks have their own partition."""
+
+    __tablename__ = "collection"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(48), nullable=False, unique=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,12 @@
+from sqlalchemy import BigInteger, Column, Integer
+
+from api.infra.db.model.base import Base
+
+
+class CorpusGeneration(Base):
+    """Counter of the changes of the searched chunks, a single row."""
+
+    __tablename__ = "corpus_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(BigInteger, nullable=False)
@@ -0,0 +1,15 @@
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, DateTime, String, func
+
+from api.infra.db.model.base import Base
+
+
+class QuestionEmbedding(Base):
+    """Question embedding cache model, shared by all the workers."""
+
+    __tablename__ = "question_embedding_cache"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    embedding_vector = Column(Vector(1536), nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
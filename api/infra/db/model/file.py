@@ -1,9 +1,39 @@
 from pgvector.sqlalchemy import Vector
 from pydantic import ConfigDict
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column,
+    Computed,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    Text,
+    func,
+    literal_column,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.sql.elements import ColumnElement
 
 from api.infra.db.model.base import Base
+from api.infra.db.model.collection import DEFAULT_COLLECTION
+
+# text search configuration of the full-text index of the chunks
+TEXT_SEARCH_CONFIG = "english"
+# regular expression capturing the extension of a file name
+FILE_EXTENSION_PATTERN = r"\.([^.]+)$"
+
+
+def file_extension(name: ColumnElement[str]) -> ColumnElement[str]:
+    """
+    Makes the lower case extension of file names, without the dot
+    :param name: The file name column
+    :return: The extension expression, matching the indexed one
+    """
+    # the pattern is inlined, the expression index ix_file_extension is only used by
+    # the queries with the same constant
+    pattern = literal_column(f"'{FILE_EXTENSION_PATTERN}'")
+    return func.lower(func.substring(name, pattern))
 
 
 class File(Base):
@@ -13,10 +43,28 @@ class File(Base):
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
+    # the files can not be added to a collection deleted since it was checked
+    collection = Column(
+        String(48),
+        ForeignKey("collection.name"),
+        nullable=False,
+        server_default=DEFAULT_COLLECTION,
+        index=True,
+    )
     path = Column(String, nullable=False)
-    size = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False, index=True)
+    # hexadecimal SHA-256 of the file bytes
+    content_hash = Column(String(64), index=True)
+    # beginning of the text of the file, the whole text is read from the file, or
+    # from its gzip-compressed text file for the formats which are not plain text
     content = Column(Text)
-    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    text_path = Column(String)
+    created_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+        index=True,
+    )
     updated_at = Column(
         DateTime,
         nullable=False,
@@ -28,13 +76,37 @@ class File(Base):
 
 
 class FileChunk(Base):
-    """FileChunk model."""
+    """FileChunk model, partitioned by the collection of its file."""
 
     __tablename__ = "file_chunk"
+    # the chunks of each collection are stored in their own partition, with their own
+    # indexes, the partitions are created with the collections
+    __table_args__ = {"postgresql_partition_by": "LIST (collection)"}
 
-    id = Column(Integer, primary_key=True)
-    file_id = Column(Integer, ForeignKey("file.id", ondelete="CASCADE"))
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # copy of the collection of the file, the primary key of a partitioned table must
+    # include the partition key
+    collection = Column(String(48), primary_key=True)
+    file_id = Column(Integer, ForeignKey("file.id", ondelete="CASCADE"), index=True)
     file = relationship("File", uselist=False, back_populates="chunks")
     chunk_text = Column(Text)
+    # hexadecimal SHA-256 of the chunk text with collapsed whitespace, the embedding
+    # of a chunk is reused by the chunks with the same hash
+    content_hash = Column(String(64), index=True)
+    # lexemes of the chunk text, computed by the database for the full-text index,
+    # neither loaded with the chunks nor returned by their inserts
+    chunk_tsv = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(chunk_text, ''))",
+                persisted=True,
+            ),
+        ),
+    )
     embedding_vector = Column(Vector(1536))
+    # model of the embedding, a stored embedding is only reused for the chunks
+    # embedded with the same model
+    embedding_model = Column(String)
     model_config = ConfigDict(from_attributes=True)
+    __mapper_args__ = {"eager_defaults": False}
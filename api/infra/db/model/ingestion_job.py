@@ -0,0 +1,46 @@
+import enum
+
+from pydantic import ConfigDict
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy.orm import relationship
+
+from api.infra.db.model.base import Base
+
+
+class IngestionStatus(str, enum.Enum):  # noqa: WPS600
+    """Possible states of a file ingestion."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class IngestionJob(Base):
+    """Ingestion job model, the queue of files waiting to be chunked and embedded."""
+
+    __tablename__ = "ingestion_job"
+    __table_args__ = (Index("idx_ingestion_job_status", "status", "available_at"),)
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(
+        Integer,
+        ForeignKey("file.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    file = relationship("File", uselist=False)
+    status = Column(String, nullable=False, default=IngestionStatus.PENDING.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    # the job can not be claimed before this time, used to delay the retries
+    available_at = Column(DateTime, nullable=False, server_default=func.now())
+    locked_at = Column(DateTime)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+    model_config = ConfigDict(from_attributes=True)
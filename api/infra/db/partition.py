@@ -0,0 +1,167 @@
+import re
+
+from sqlalchemy import Connection, text
+from sqlalchemy.orm import Session
+
+from api.infra.db.model.collection import COLLECTION_NAME_PATTERN, DEFAULT_COLLECTION
+from api.infra.db.model.file import FileChunk
+
+# name of the file_chunk table being converted by partition_file_chunk_table
+UNPARTITIONED_TABLE = "file_chunk_unpartitioned"
+
+
+def partition_name(collection: str) -> str:
+    """
+    Makes the name of the file_chunk partition of a collection
+    :param collection: The collection name
+    :return: The partition table name
+    """
+    # the name is inlined in the DDL statements, which take no bound parameters
+    if not re.match(COLLECTION_NAME_PATTERN, collection):
+        raise ValueError(f"Invalid collection name: {collection!r}")
+    return f"file_chunk_{collection}"
+
+
+def create_partition_statement(collection: str) -> str:
+    """
+    Makes the statement creating the file_chunk partition of a collection, the
+    partition gets the indexes of file_chunk, its own HNSW and full-text indexes
+    :param collection: The collection name
+    :return: The CREATE TABLE statement
+    """
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(collection)} "
+        f"PARTITION OF file_chunk FOR VALUES IN ('{collection}')"
+    )
+
+
+def detach_partition_statement(collection: str, finalize: bool = False) -> str:
+    """
+    Makes the statement detaching the file_chunk partition of a collection without
+    blocking the queries on file_chunk, or completing an interrupted detach
+    :param collection: The collection name
+    :param finalize: Whether to complete a detach which was interrupted
+    :return: The ALTER TABLE statement, which can not run in a transaction block
+    """
+    mode = "FINALIZE" if finalize else "CONCURRENTLY"
+    return (
+        f"ALTER TABLE file_chunk DETACH PARTITION {partition_name(collection)} {mode}"
+    )
+
+
+def detach_partition(connection: Connection, collection: str) -> None:
+    """
+    Detaches the file_chunk partition of a collection, if it is attached. Unlike
+    dropping an attached partition, the detach does not lock file_chunk, so the
+    searches and ingestions of the other collections go on.
+    :param connection: A database connection in autocommit mode
+    :param collection: The collection name
+    """
+    detach_pending = connection.execute(
+        text(
+            "SELECT inhdetachpending FROM pg_inherits "
+            "WHERE inhrelid = to_regclass(:partition) "
+            "AND inhparent = to_regclass('file_chunk')",
+        ),
+        {"partition": partition_name(collection)},
+    ).scalar()
+    if detach_pending is None:
+        return
+    connection.execute(text(detach_partition_statement(collection, detach_pending)))
+
+
+def drop_partition_statement(collection: str) -> str:
+    """
+    Makes the statement dropping the file_chunk partition of a collection
+    :param collection: The collection name
+    :return: The DROP TABLE statement
+    """
+    return f"DROP TABLE IF EXISTS {partition_name(collection)}"
+
+
+def is_file_chunk_partitioned(connection: Connection | Session) -> bool:
+    """
+    Checks if file_chunk is partitioned by collection, the tables created before the
+    collections are not until `python -m api partition-file-chunks` converts them
+    :param connection: The database connection or session
+    :return: True if file_chunk is a partitioned table
+    """
+    query = text(
+        "SELECT EXISTS (SELECT FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('file_chunk'))",
+    )
+    return bool(connection.execute(query).scalar())
+
+
+def create_collection_partitions(connection: Connection) -> None:
+    """
+    Creates the collections of the files, the default one included, and the
+    file_chunk partitions of the collections which have none
+    :param connection: The database connection
+    """
+    connection.execute(
+        text(
+            "INSERT INTO collection (name) SELECT :name "
+            "UNION SELECT DISTINCT collection FROM file "
+            "ON CONFLICT (name) DO NOTHING",
+        ),
+        {"name": DEFAULT_COLLECTION},
+    )
+    if not is_file_chunk_partitioned(connection):
+        return
+    for name in connection.execute(text("SELECT name FROM collection")).scalars():
+        connection.execute(text(create_partition_statement(name)))
+
+
+def partition_file_chunk_table(connection: Connection) -> int:
+    """
+    Converts a file_chunk table created before the collections into a table
+    partitioned by collection, in the transaction of the connection. The chunks are
+    copied to the partition of the collection of their file, the ids are kept. The
+    vector and full-text indexes are created afterwards, once for all the chunks.
+    :param connection: The database connection
+    :return: The number of copied chunks, 0 if file_chunk was already partitioned
+    """
+    if is_file_chunk_partitioned(connection):
+        return 0
+    connection.execute(text(f"ALTER TABLE file_chunk RENAME TO {UNPARTITIONED_TABLE}"))
+    # the index names are unique in a schema, the ones of the old table are dropped
+    # and its primary key renamed before file_chunk is created again
+    index_names = connection.execute(
+        text(
+            "SELECT indexname FROM pg_indexes "
+            "WHERE tablename = :table AND indexname <> 'file_chunk_pkey'",
+        ),
+        {"table": UNPARTITIONED_TABLE},
+    ).scalars()
+    for index_name in list(index_names):
+        connection.execute(text(f'DROP INDEX "{index_name}"'))
+    connection.execute(
+        text(
+            f"ALTER TABLE {UNPARTITIONED_TABLE} "
+            f"RENAME CONSTRAINT file_chunk_pkey TO {UNPARTITIONED_TABLE}_pkey",
+        ),
+    )
+    FileChunk.__table__.create(connection)
+    create_collection_partitions(connection)
+    copied = connection.execute(
+        text(
+            f"""
+            INSERT INTO file_chunk
+                (id, collection, file_id, chunk_text, content_hash, embedding_vector,
+                embedding_model)
+            SELECT c.id, coalesce(f.collection, '{DEFAULT_COLLECTION}'), c.file_id,
+                c.chunk_text, c.content_hash, c.embedding_vector, c.embedding_model
+            FROM {UNPARTITIONED_TABLE} c LEFT JOIN file f ON f.id = c.file_id
+            """,
+        ),
+    ).rowcount
+    # the sequence of the new table continues after the copied ids
+    connection.execute(
+        text(
+            "SELECT setval(pg_get_serial_sequence('file_chunk', 'id'), "
+            "(SELECT coalesce(max(id), 0) + 1 FROM file_chunk), false)",
+        ),
+    )
+    connection.execute(text(f"DROP TABLE {UNPARTITIONED_TABLE}"))
+    return copied
@@ -0,0 +1,101 @@
+from typing import Any
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Float, cast, func
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.types import UserDefinedType
+
+from api.infra.db.model.file import FileChunk
+from api.settings import EmbeddingStorage
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+class HalfVector(UserDefinedType):
+    """The halfvec type of pgvector, vectors of float16 components."""
+
+    cache_ok = True
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def get_col_spec(self, **kw: Any) -> str:
+        return f"halfvec({self.dimensions})"
+
+
+class Bit(UserDefinedType):
+    """The bit type of PostgreSQL, a fixed length string of bits."""
+
+    cache_ok = True
+
+    def __init__(self, length: int = EMBEDDING_DIMENSIONS):
+        self.length = length
+
+    def get_col_spec(self, **kw: Any) -> str:
+        return f"bit({self.length})"
+
+
+# The chunk embeddings are always stored as float32 vectors, the storage precision
+# only selects the expression indexed by HNSW. The half and binary indexes are 2 and
+# 32 times smaller than the float32 one, the exact distances are computed from the
+# float32 vectors of the candidates found with them.
+INDEXES: dict[EmbeddingStorage, tuple[str, str]] = {
+    EmbeddingStorage.FULL: (
+        "idx_vector",
+        "embedding_vector vector_cosine_ops",
+    ),
+    EmbeddingStorage.HALF: (
+        "idx_vector_halfvec",
+        f"(embedding_vector::halfvec({EMBEDDING_DIMENSIONS})) halfvec_cosine_ops",
+    ),
+    EmbeddingStorage.BINARY: (
+        "idx_vector_binary",
+        f"(binary_quantize(embedding_vector)::bit({EMBEDDING_DIMENSIONS})) bit_hamming_ops",
+    ),
+}
+
+
+def create_index_statement(storage: EmbeddingStorage) -> str:
+    """
+    Makes the statement creating the HNSW index of a storage precision
+    :param storage: The storage precision
+    :return: The CREATE INDEX statement
+    """
+    index_name, indexed_expression = INDEXES[storage]
+    return f"CREATE INDEX IF NOT EXISTS {index_name} ON file_chunk USING hnsw ({indexed_expression})"
+
+
+def exact_distance(
+    question_embedding: list[float] | ColumnElement[Any],
+) -> ColumnElement[float]:
+    """
+    Makes the cosine distance between the float32 chunk embeddings and a question embedding
+    :param question_embedding: The question embedding, or a column of embeddings
+    :return: The distance expression
+    """
+    return FileChunk.embedding_vector.cosine_distance(question_embedding)
+
+
+def index_distance(
+    question_embedding: list[float] | ColumnElement[Any],
+    storage: EmbeddingStorage,
+) -> ColumnElement[float]:
+    """
+    Makes the distance ordering the scan of the HNSW index of a storage precision,
+    the expression must match the indexed one to be served by the index
+    :param question_embedding: The question embedding, or a column of embeddings
+    :param storage: The storage precision
+    :return: The distance expression, a cosine distance for the full and half
+    precisions and a Hamming distance for the binary one
+    """
+    if storage == EmbeddingStorage.FULL:
+        return exact_distance(question_embedding)
+    # typed as a vector, binary_quantize is overloaded for vector and halfvec
+    question_vector = cast(question_embedding, Vector(EMBEDDING_DIMENSIONS))
+    if storage == EmbeddingStorage.HALF:
+        chunk_half_vector = cast(FileChunk.embedding_vector, HalfVector())
+        question_half_vector = cast(question_vector, HalfVector())
+        return chunk_half_vector.op("<=>", return_type=Float)(question_half_vector)
+    chunk_bits = cast(func.binary_quantize(FileChunk.embedding_vector), Bit())
+    question_bits = cast(func.binary_quantize(question_vector), Bit())
+    return chunk_bits.op("<~>", return_type=Float)(question_bits)
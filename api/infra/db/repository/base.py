@@ -1,10 +1,13 @@
 from typing import Any, Generic, Type, TypeVar
 
-from fastapi_pagination import Page, Params, paginate
+from fastapi_pagination import Page, Params
+from fastapi_pagination.ext.sqlalchemy import paginate
 from fastapi_pagination.utils import disable_installed_extensions_check
 from sqlalchemy.engine.result import Result
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 
 from api.infra.db.model.base import Base
 
@@ -19,11 +22,23 @@ class BaseRepository(Generic[T]):
         self.model = model
         self.session = session
 
-    def _query(self, *criterion: Any, order_by: Any = None, **kwargs: Any) -> Result:
-        query = select(self.model).filter(*criterion)
+    def _build_query(
+        self,
+        *criterion: Any,
+        columns: tuple[Any, ...] = (),
+        order_by: Any = None,
+        **kwargs: Any,
+    ) -> Select:
+        query = select(*columns) if columns else select(self.model)
+        query = query.filter(*criterion)
         if order_by is not None:
             query = query.order_by(order_by)
-        return self.session.execute(query)
+        return query
+
+    def _query(self, *criterion: Any, order_by: Any = None, **kwargs: Any) -> Result:
+        return self.session.execute(
+            self._build_query(*criterion, order_by=order_by, **kwargs),
+        )
 
     def get(self, *criterion: Any, order_by: Any = None, **kwargs: Any) -> T | None:
         result = self._query(*criterion, order_by=order_by, **kwargs)
@@ -33,12 +48,28 @@ class BaseRepository(Generic[T]):
         self,
         *criterion: Any,
         params: Params = Params(),
+        columns: tuple[Any, ...] = (),
         order_by: Any = None,
         **kwargs: Any,
     ) -> Page[T]:
-        result = self._query(*criterion, order_by=order_by, **kwargs)
-        items = result.scalars().all()
-        return paginate(items, params=params)
+        """
+        Gets a page of entities, LIMIT/OFFSET and the total count are computed by the database
+        :param criterion: The filter criteria
+        :param params: The pagination params
+        :param columns: The columns to select instead of the whole entity
+        :param order_by: The order of the entities, defaults to the primary key
+        :return: The page of entities, or of rows when columns are given
+        """
+        if order_by is None:
+            # a stable order is needed for LIMIT/OFFSET pagination
+            order_by = self.model.id
+        query = self._build_query(
+            *criterion,
+            columns=columns,
+            order_by=order_by,
+            **kwargs,
+        )
+        return paginate(self.session, query, params)
 
     def create(self, obj_in: dict[str, Any] | T) -> T:
         if isinstance(obj_in, dict):
@@ -53,8 +84,16 @@ class BaseRepository(Generic[T]):
     def _create_from_model(self, obj_in: T) -> T:
         return add_and_commit(self.session, obj_in)
 
+    def create_many(self, objs_in: list[T]) -> list[T]:
+        """
+        Adds all the objects to the session and commits them in a single transaction
+        :param objs_in: The objects to be created
+        :return: The created objects
+        """
+        return add_all_and_commit(self.session, objs_in)
+
     def get_by_id(self, id: int) -> T | None:
-        return self.get(id=id)
+        return self.get(self.model.id == id)
 
     def update(self, obj_in: T) -> T:
         self.session.commit()
@@ -77,6 +116,70 @@ class BaseRepository(Generic[T]):
         self.session.commit()
 
 
+class AsyncBaseRepository(Generic[T]):
+    """Variant of BaseRepository running its queries on an AsyncSession."""
+
+    def __init__(self, model: Type[T], session: AsyncSession):
+        self.model = model
+        self.session = session
+
+    _build_query = BaseRepository._build_query
+
+    async def get(
+        self,
+        *criterion: Any,
+        order_by: Any = None,
+        **kwargs: Any,
+    ) -> T | None:
+        result = await self.session.execute(
+            self._build_query(*criterion, order_by=order_by, **kwargs),
+        )
+        return result.scalars().first()
+
+    async def get_many(
+        self,
+        *criterion: Any,
+        params: Params = Params(),
+        columns: tuple[Any, ...] = (),
+        order_by: Any = None,
+        **kwargs: Any,
+    ) -> Page[T]:
+        """
+        Gets a page of entities, LIMIT/OFFSET and the total count are computed by the database
+        :param criterion: The filter criteria
+        :param params: The pagination params
+        :param columns: The columns to select instead of the whole entity
+        :param order_by: The order of the entities, defaults to the primary key
+        :return: The page of entities, or of rows when columns are given
+        """
+        if order_by is None:
+            order_by = self.model.id
+        query = self._build_query(
+            *criterion,
+            columns=columns,
+            order_by=order_by,
+            **kwargs,
+        )
+        return await paginate(self.session, query, params)
+
+    async def create(self, obj_in: T) -> T:
+        return (await self.create_many([obj_in]))[0]
+
+    async def create_many(self, objs_in: list[T]) -> list[T]:
+        try:
+            self.session.add_all(objs_in)  # type: ignore
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise RepositoryError(
+                f"Error while adding {len(objs_in)} objects to session: {str(e)}",
+            ) from e
+        return objs_in
+
+    async def get_by_id(self, id: int) -> T | None:
+        return await self.get(self.model.id == id)
+
+
 class RepositoryError(Exception):
     pass
 
@@ -91,3 +194,15 @@ def add_and_commit(session: Session, obj: T) -> T:
             f"Error while adding {obj} to session: {str(e)}",
         ) from e
     return obj
+
+
+def add_all_and_commit(session: Session, objs: list[T]) -> list[T]:
+    try:
+        session.add_all(objs)  # type: ignore
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise RepositoryError(
+            f"Error while adding {len(objs)} objects to session: {str(e)}",
+        ) from e
+    return objs
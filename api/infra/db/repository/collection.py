@@ -0,0 +1,86 @@
+from fastapi import Depends
+from fastapi_pagination import Page, Params
+from sqlalchemy import Row, delete, select, text
+from sqlalchemy.orm import Session
+
+from api.infra.db.dependencies import get_db_session
+from api.infra.db.model.collection import Collection
+from api.infra.db.model.corpus_generation import CorpusGeneration
+from api.infra.db.model.file import File, FileChunk
+from api.infra.db.partition import (
+    create_partition_statement,
+    detach_partition,
+    drop_partition_statement,
+    is_file_chunk_partitioned,
+)
+from api.infra.db.repository.base import BaseRepository
+from api.infra.db.repository.corpus_generation import CorpusGenerationRepository
+
+
+class CollectionRepository(BaseRepository[Collection]):
+    def get_by_name(self, name: str) -> Collection | None:
+        """
+        Gets a collection by name
+        :param name: The collection name
+        :return: The collection, or None if there is none
+        """
+        return self.get(self.model.name == name)
+
+    def get_collections(self, params: Params = Params()) -> Page[Collection]:
+        """
+        Gets a page of collections
+        :param params: The pagination params
+        :return: The page of collections ordered by name
+        """
+        return self.get_many(params=params, order_by=self.model.name)
+
+    def create_collection(self, name: str) -> Collection:
+        """
+        Creates a collection and the file_chunk partition of its chunks in a single
+        transaction, the partition gets its own vector and full-text indexes
+        :param name: The collection name
+        :return: The created collection
+        """
+        collection = self.model(name=name)
+        self.session.add(collection)
+        if is_file_chunk_partitioned(self.session):
+            self.session.execute(text(create_partition_statement(name)))
+        self.session.commit()
+        self.session.refresh(collection)
+        return collection
+
+    def drop_collection(self, collection: Collection) -> list[Row]:
+        """
+        Deletes a collection and its files. Its chunks are dropped with their
+        partition, instead of being deleted row by row. The partition is detached
+        first, outside of any transaction, dropping it while attached would lock
+        file_chunk and block the searches and ingestions of all the collections.
+        :param collection: The collection
+        :return: The (id, path, text_path) rows of the deleted files
+        """
+        name = collection.name
+        if is_file_chunk_partitioned(self.session):
+            # the detach waits for the transactions using file_chunk, this one too
+            self.session.commit()
+            with self.session.get_bind().connect() as connection:
+                detach_partition(
+                    connection.execution_options(isolation_level="AUTOCOMMIT"),
+                    name,
+                )
+            self.session.execute(text(drop_partition_statement(name)))
+        else:
+            self.session.execute(delete(FileChunk).where(FileChunk.collection == name))
+        files = self.session.execute(
+            select(File.id, File.path, File.text_path).where(File.collection == name),
+        ).all()
+        self.session.execute(delete(File).where(File.collection == name))
+        self.session.delete(collection)
+        CorpusGenerationRepository(CorpusGeneration, self.session).bump()
+        self.session.commit()
+        return files
+
+
+def get_collection_repository(
+    session: Session = Depends(get_db_session),
+) -> CollectionRepository:
+    return CollectionRepository(Collection, session)
@@ -0,0 +1,64 @@
+from fastapi import Depends
+from sqlalchemy import Insert, Select, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from api.infra.db.dependencies import get_async_db_session, get_db_session
+from api.infra.db.model.corpus_generation import CorpusGeneration
+from api.infra.db.repository.base import AsyncBaseRepository, BaseRepository
+
+CORPUS_GENERATION_ID = 1
+
+
+class CorpusGenerationRepository(BaseRepository[CorpusGeneration]):
+    def get_generation(self) -> int:
+        """
+        Gets the corpus generation
+        :return: The generation, 0 until the chunks are changed
+        """
+        return self.session.execute(_get_generation_query()).scalar() or 0
+
+    def bump(self) -> None:
+        """
+        Increments the corpus generation, the increment is committed with the next
+        commit so that it becomes visible with the changes of the chunks. The row
+        stays locked until then, the callers commit right after.
+        """
+        self.session.execute(_bump_query())
+
+
+class AsyncCorpusGenerationRepository(AsyncBaseRepository[CorpusGeneration]):
+    async def get_generation(self) -> int:
+        """
+        Gets the corpus generation
+        :return: The generation, 0 until the chunks are changed
+        """
+        result = await self.session.execute(_get_generation_query())
+        return result.scalar() or 0
+
+
+def _get_generation_query() -> Select:
+    return select(CorpusGeneration.generation).where(
+        CorpusGeneration.id == CORPUS_GENERATION_ID,
+    )
+
+
+def _bump_query() -> Insert:
+    query = insert(CorpusGeneration).values(id=CORPUS_GENERATION_ID, generation=1)
+    return query.on_conflict_do_update(
+        index_elements=[CorpusGeneration.id],
+        set_={"generation": CorpusGeneration.generation + 1},
+    )
+
+
+def get_corpus_generation_repository(
+    session: Session = Depends(get_db_session),
+) -> CorpusGenerationRepository:
+    return CorpusGenerationRepository(CorpusGeneration, session)
+
+
+def get_async_corpus_generation_repository(
+    session: AsyncSession = Depends(get_async_db_session),
+) -> AsyncCorpusGenerationRepository:
+    return AsyncCorpusGenerationRepository(CorpusGeneration, session)
@@ -0,0 +1,95 @@
+import datetime
+
+from fastapi import Depends
+from sqlalchemy import Insert, Select, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from api.infra.db.dependencies import get_async_db_session, get_db_session
+from api.infra.db.model.embedding_cache import QuestionEmbedding
+from api.infra.db.repository.base import AsyncBaseRepository, BaseRepository
+
+
+class EmbeddingCacheRepository(BaseRepository[QuestionEmbedding]):
+    def get_embedding(self, key: str, max_age: int) -> list[float] | None:
+        """
+        Gets a cached embedding
+        :param key: The cache key
+        :param max_age: The maximum age of the cached embedding in seconds
+        :return: The embedding float list, or None if it is not cached or expired
+        """
+        embedding = self.session.execute(_get_embedding_query(key, max_age)).scalar()
+        return None if embedding is None else embedding.tolist()
+
+    def save_embedding(self, key: str, model: str, embedding: list[float]) -> None:
+        """
+        Saves an embedding, replacing the one cached with the same key
+        :param key: The cache key
+        :param model: The embedding model name
+        :param embedding: The embedding float list
+        """
+        self.session.execute(_save_embedding_query(key, model, embedding))
+        self.session.commit()
+
+
+class AsyncEmbeddingCacheRepository(AsyncBaseRepository[QuestionEmbedding]):
+    async def get_embedding(self, key: str, max_age: int) -> list[float] | None:
+        """
+        Gets a cached embedding
+        :param key: The cache key
+        :param max_age: The maximum age of the cached embedding in seconds
+        :return: The embedding float list, or None if it is not cached or expired
+        """
+        result = await self.session.execute(_get_embedding_query(key, max_age))
+        embedding = result.scalar()
+        return None if embedding is None else embedding.tolist()
+
+    async def save_embedding(
+        self,
+        key: str,
+        model: str,
+        embedding: list[float],
+    ) -> None:
+        """
+        Saves an embedding, replacing the one cached with the same key
+        :param key: The cache key
+        :param model: The embedding model name
+        :param embedding: The embedding float list
+        """
+        await self.session.execute(_save_embedding_query(key, model, embedding))
+        await self.session.commit()
+
+
+def _get_embedding_query(key: str, max_age: int) -> Select:
+    return select(QuestionEmbedding.embedding_vector).where(
+        QuestionEmbedding.key == key,
+        QuestionEmbedding.created_at > func.now() - datetime.timedelta(seconds=max_age),
+    )
+
+
+def _save_embedding_query(key: str, model: str, embedding: list[float]) -> Insert:
+    query = insert(QuestionEmbedding).values(
+        key=key,
+        model=model,
+        embedding_vector=embedding,
+    )
+    return query.on_conflict_do_update(
+        index_elements=[QuestionEmbedding.key],
+        set_={
+            "embedding_vector": query.excluded.embedding_vector,
+            "created_at": func.now(),
+        },
+    )
+
+
+def get_embedding_cache_repository(
+    session: Session = Depends(get_db_session),
+) -> EmbeddingCacheRepository:
+    return EmbeddingCacheRepository(QuestionEmbedding, session)
+
+
+def get_async_embedding_cache_repository(
+    session: AsyncSession = Depends(get_async_db_session),
+) -> AsyncEmbeddingCacheRepository:
+    return AsyncEmbeddingCacheRepository(QuestionEmbedding, session)
@@ -1,62 +1,1446 @@
+import asyncio
+import csv
+import datetime
+import io
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator
+
+import numpy as np
 from fastapi import Depends
-from fastapi_pagination import Page, Params, paginate
-from sqlalchemy import Row, func, select
-from sqlalchemy.orm import Session, aliased
+from fastapi_pagination import Page, Params, create_page, paginate
+from loguru import logger
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import (
+    Integer,
+    Row,
+    Select,
+    and_,
+    cast,
+    column,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    true,
+    update,
+    values,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Subquery
+
+from api.infra.db.dependencies import get_async_db_session, get_db_session
+from api.infra.db.model.corpus_generation import CorpusGeneration
+from api.infra.db.model.file import (
+    TEXT_SEARCH_CONFIG,
+    File,
+    FileChunk,
+    file_extension,
+)
+from api.infra.db.model.ingestion_job import IngestionJob, IngestionStatus
+from api.infra.db.quantization import (
+    EMBEDDING_DIMENSIONS,
+    exact_distance,
+    index_distance,
+)
+from api.infra.db.repository.base import AsyncBaseRepository, BaseRepository
+from api.infra.db.repository.corpus_generation import CorpusGenerationRepository
+from api.infra.vector_store import VectorSearchResult, VectorStore, get_vector_store
+from api.settings import (
+    EmbeddingStorage,
+    SearchBackendName,
+    VectorStoreMode,
+    settings,
+)
+
+# maximum value of the hnsw.ef_search parameter of pgvector
+HNSW_MAX_EF_SEARCH = 1000
+
+
+@dataclass(slots=True, frozen=True)
+class SimilarFileChunk:
+    """Best chunk of a file for a question, without the chunk embedding nor the file content."""
 
-from api.infra.db.dependencies import get_db_session
-from api.infra.db.model.file import File, FileChunk
-from api.infra.db.repository.base import BaseRepository
+    file_id: int
+    file_name: str
+    file_chunk_id: int
+    chunk_text: str
+    # cosine distance of the chunk, None when it was only found by a lexical search
+    distance: float | None = None
+    # ranking score of lexical and hybrid searches, the higher the better
+    score: float | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class SearchFilter:
+    """Criteria on the files of a search, the chunks of the other files are ignored."""
+
+    # collection of the files, the chunks of the other collections are in other
+    # partitions which are not scanned
+    collection: str | None = None
+    file_ids: tuple[int, ...] | None = None
+    # file name extension, without the dot
+    extension: str | None = None
+    # inclusive lower bound of the file creation date
+    created_after: datetime.datetime | None = None
+    # exclusive upper bound of the file creation date
+    created_before: datetime.datetime | None = None
+    # inclusive bounds of the file size in bytes
+    min_size: int | None = None
+    max_size: int | None = None
+
+    def file_conditions(self) -> list[ColumnElement[bool]]:
+        """
+        Makes the conditions on the file table of the criteria, each one is served by
+        an index of the file table
+        :return: The conditions of the criteria which are set
+        """
+        conditions = []
+        if self.collection is not None:
+            conditions.append(File.collection == self.collection)
+        if self.file_ids is not None:
+            conditions.append(File.id.in_(self.file_ids))
+        if self.extension is not None:
+            conditions.append(
+                file_extension(File.name) == self.extension.lower().lstrip("."),
+            )
+        if self.created_after is not None:
+            conditions.append(File.created_at >= self.created_after)
+        if self.created_before is not None:
+            conditions.append(File.created_at < self.created_before)
+        if self.min_size is not None:
+            conditions.append(File.size >= self.min_size)
+        if self.max_size is not None:
+            conditions.append(File.size <= self.max_size)
+        return conditions
+
+    @property
+    def selects_files(self) -> bool:
+        """
+        Checks if the criteria select some files of the collection, the nearest chunks
+        of the scanned partitions then belong to other files too
+        :return: True if a criterion other than the collection is set
+        """
+        return any(
+            criterion is not None
+            for criterion in (
+                self.file_ids,
+                self.extension,
+                self.created_after,
+                self.created_before,
+                self.min_size,
+                self.max_size,
+            )
+        )
+
+    def chunk_conditions(self) -> list[ColumnElement[bool]]:
+        """
+        Makes the conditions on the file_chunk table of the criteria, the one on the
+        collection restricts the scans to its partition
+        :return: The conditions of the criteria which are set
+        """
+        conditions = []
+        if self.collection is not None:
+            conditions.append(FileChunk.collection == self.collection)
+        if self.selects_files:
+            conditions.append(
+                FileChunk.file_id.in_(select(File.id).where(*self.file_conditions())),
+            )
+        return conditions
 
 
 class FileRepository(BaseRepository[File]):
-    pass
+    def get_by_content_hash(self, content_hash: str) -> File | None:
+        """
+        Gets a file with the same bytes as an uploaded one
+        :param content_hash: The hexadecimal SHA-256 of the file bytes
+        :return: The oldest file with this hash, or None if there is none
+        """
+        return self.get(self.model.content_hash == content_hash, order_by=self.model.id)
+
+    def find_ingested_duplicate(self, file: File) -> File | None:
+        """
+        Finds another file with the same bytes whose chunks embeddings are created
+        :param file: The file
+        :return: The duplicate file, or None if there is none
+        """
+        if file.content_hash is None:
+            return None
+        return self.get(
+            self.model.content_hash == file.content_hash,
+            self.model.id != file.id,
+            self.model.id.in_(
+                select(IngestionJob.file_id).where(
+                    IngestionJob.status == IngestionStatus.DONE.value,
+                ),
+            ),
+            order_by=self.model.id,
+        )
+
+    def get_ingested_by_content_hash(self, content_hash: str) -> File | None:
+        """
+        Gets a file with the same bytes whose chunks embeddings are created
+        :param content_hash: The hexadecimal SHA-256 of the file bytes
+        :return: The oldest ingested file with this hash, or None if there is none
+        """
+        return self.get(
+            self.model.content_hash == content_hash,
+            self.model.id.in_(
+                select(IngestionJob.file_id).where(
+                    IngestionJob.status == IngestionStatus.DONE.value,
+                ),
+            ),
+            order_by=self.model.id,
+        )
+
+    def get_used_paths(self, paths: set[str]) -> set[str]:
+        """
+        Gets the paths still stored by a file, the files with the same bytes share
+        their content-addressed path
+        :param paths: The file paths
+        :return: The paths of the given ones which are used by a file
+        """
+        if not paths:
+            return set()
+        return set(
+            self.session.scalars(
+                select(self.model.path)
+                .where(self.model.path.in_(sorted(paths)))
+                .distinct(),
+            ),
+        )
+
+    def get_files_overview(
+        self,
+        params: Params = Params(),
+        collection: str | None = None,
+    ) -> Page[Row]:
+        """
+        Gets a page of files without loading their whole content
+        :param params: The pagination params
+        :param collection: The collection of the files, all the collections if None
+        :return: The page of rows with the file columns and the first 200 characters of the content
+        """
+        return self.get_many(
+            *_collection_conditions(collection),
+            params=params,
+            columns=_files_overview_columns(),
+        )
 
 
 class FileChunkRepository(BaseRepository[FileChunk]):
+    def create_many(self, objs_in: list[FileChunk]) -> list[FileChunk]:
+        """
+        Adds chunks and bumps the corpus generation in a single transaction
+        :param objs_in: The chunks to be created
+        :return: The created chunks
+        """
+        self._set_collections(objs_in)
+        self.bump_corpus_generation()
+        return super().create_many(objs_in)
+
+    def _create_from_dict(self, obj_in: dict[str, Any]) -> FileChunk:
+        return self._create_from_model(self.model(**obj_in))
+
+    def _create_from_model(self, obj_in: FileChunk) -> FileChunk:
+        self._set_collections([obj_in])
+        return super()._create_from_model(obj_in)
+
+    def _set_collections(self, file_chunks: list[FileChunk]) -> None:
+        """
+        Copies the collection of their file to the chunks created without one, it
+        selects the partition of the chunks
+        :param file_chunks: The chunks
+        """
+        file_ids = {chunk.file_id for chunk in file_chunks if chunk.collection is None}
+        if not file_ids:
+            return
+        collections = self.get_file_collections(file_ids)
+        for chunk in file_chunks:
+            if chunk.collection is None:
+                chunk.collection = collections[chunk.file_id]
+
+    def get_file_collections(self, file_ids: set[int]) -> dict[int, str]:
+        """
+        Gets the collection of files, in a single query
+        :param file_ids: The file ids
+        :return: The collection name by file id
+        """
+        rows = self.session.execute(
+            select(File.id, File.collection).where(File.id.in_(sorted(file_ids))),
+        )
+        return {file_id: collection for file_id, collection in rows}
+
+    def bump_corpus_generation(self) -> None:
+        """
+        Invalidates the cached search results, the bump is committed with the next
+        commit, the one of the changes of the chunks
+        """
+        CorpusGenerationRepository(CorpusGeneration, self.session).bump()
+
+    def delete_by_file_id(self, file_id: int) -> None:
+        """
+        Deletes the chunks of a file, the deletion is committed with the next commit
+        :param file_id: The file id
+        """
+        self.session.execute(delete(self.model).where(self.model.file_id == file_id))
+
+    def copy_file_chunks(self, source_file_id: int, file_id: int) -> None:
+        """
+        Copies the chunks and their embeddings from a file to another in the database,
+        the copy is committed with the next commit
+        :param source_file_id: The id of the file whose chunks are copied
+        :param file_id: The id of the file receiving the chunks
+        """
+        # the file may belong to another collection than the source file
+        collection = select(File.collection).where(File.id == file_id).scalar_subquery()
+        source_chunks = select(
+            literal(file_id),
+            collection,
+            self.model.chunk_text,
+            self.model.content_hash,
+            self.model.embedding_vector,
+            self.model.embedding_model,
+        ).where(self.model.file_id == source_file_id)
+        self.session.execute(
+            insert(self.model).from_select(
+                [
+                    "file_id",
+                    "collection",
+                    "chunk_text",
+                    "content_hash",
+                    "embedding_vector",
+                    "embedding_model",
+                ],
+                source_chunks,
+            ),
+        )
+        self.bump_corpus_generation()
+
+    def get_embeddings_by_content_hash(
+        self,
+        content_hashes: set[str],
+        embedding_model: str,
+    ) -> dict[str, np.ndarray]:
+        """
+        Gets a stored embedding for each chunk content hash, in a single query
+        :param content_hashes: The chunk content hashes
+        :param embedding_model: The model of the embeddings, the ones of the other
+        models are not returned
+        :return: The embedding of a chunk by content hash, for the hashes found
+        """
+        if not content_hashes:
+            return {}
+        rows = self.session.execute(
+            select(self.model.content_hash, self.model.embedding_vector)
+            .where(
+                self.model.content_hash.in_(sorted(content_hashes)),
+                self.model.embedding_model == embedding_model,
+            )
+            .distinct(self.model.content_hash),
+        )
+        return {content_hash: embedding for content_hash, embedding in rows}
+
+    def backfill_content_hashes(self, batch_size: int = 10000) -> int:
+        """
+        Computes in the database the content hash of the chunks stored without one,
+        by batches committed one by one. The whitespace is collapsed like
+        chunk_content_hash does for ASCII whitespace.
+        :param batch_size: The number of chunks updated per transaction
+        :return: The number of updated chunks
+        """
+        normalized_text = func.btrim(
+            func.regexp_replace(
+                func.coalesce(self.model.chunk_text, ""),
+                r"\s+",
+                " ",
+                "g",
+            ),
+        )
+        content_hash = func.encode(
+            func.sha256(func.convert_to(normalized_text, "UTF8")),
+            "hex",
+        )
+        updated = 0
+        while True:
+            batch_ids = (
+                select(self.model.id)
+                .where(self.model.content_hash.is_(None))
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = self.session.execute(
+                update(self.model)
+                .where(self.model.id.in_(batch_ids))
+                .values(content_hash=content_hash)
+                .execution_options(synchronize_session=False),
+            )
+            self.session.commit()
+            if not result.rowcount:
+                return updated
+            updated += result.rowcount
+            logger.info(f"Hashed the content of {updated} chunks")
+
+    def copy_in(
+        self,
+        file_chunks: list[tuple[int, str, str, list[float]]],
+        embedding_model: str,
+    ) -> None:
+        """
+        Inserts chunks with COPY, much faster than INSERT statements for bulk loads,
+        the insert is committed with the next commit
+        :param file_chunks: The (file_id, chunk_text, content_hash, embedding_vector)
+        of each chunk
+        :param embedding_model: The model of the embeddings of the chunks
+        """
+        if not file_chunks:
+            return
+        collections = self.get_file_collections({chunk[0] for chunk in file_chunks})
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for file_id, chunk_text, content_hash, embedding_vector in file_chunks:
+            # PostgreSQL text can not contain NUL characters
+            writer.writerow(
+                [
+                    file_id,
+                    collections[file_id],
+                    chunk_text.replace("\x00", ""),
+                    content_hash,
+                    f"[{','.join(map(str, embedding_vector))}]",
+                    embedding_model,
+                ],
+            )
+        buffer.seek(0)
+        cursor = self.session.connection().connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                "COPY file_chunk "
+                "(file_id, collection, chunk_text, content_hash, embedding_vector, "
+                "embedding_model) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+        self.bump_corpus_generation()
+
+    def find_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        params: Params = Params(),
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Finds similar top k file chunks belonging to different files for a question embedding
+        :param params: The pagination params
+        :param question_embedding: The question embedding
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The similar file chunks
+        """
+        files_needed = params.page * params.size
+        ranking = self.rank_similar_file_chunks(
+            question_embedding,
+            files_needed,
+            search_filter,
+        )
+        # the ranking stops at the requested page, the total counts all the files
+        total = self.session.execute(
+            _similar_files_count_query(question_embedding, search_filter),
+        ).scalar_one()
+        return create_page(_page_items(ranking, params), total=total, params=params)
+
+    def rank_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        """
+        Ranks the files by the cosine distance of their best chunk to a question embedding
+        :param question_embedding: The question embedding
+        :param files_needed: The number of files needed, more files can be returned
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The best chunk of each file, ordered by distance
+        """
+        if search_filter is not None and search_filter.selects_files:
+            return self._rank_filtered_similar_file_chunks(
+                question_embedding,
+                files_needed,
+                search_filter,
+            )
+        limit = _initial_candidates_limit(files_needed)
+        while limit is not None:
+            rows = self._find_best_chunk_per_file(
+                question_embedding,
+                limit,
+                search_filter,
+            )
+            limit = _next_candidates_limit(rows, limit, files_needed)
+        return _to_similar_file_chunks(rows)
+
+    def rank_similar_file_chunks_batch(
+        self,
+        question_embeddings: list[list[float]],
+        files_needed: int,
+        collection: str | None = None,
+    ) -> list[list[SimilarFileChunk]]:
+        """
+        Ranks the files by the cosine distance of their best chunk to several question
+        embeddings with one statement, and one more for the questions whose candidates
+        are widened
+        :param question_embeddings: The question embeddings
+        :param files_needed: The number of files needed per question
+        :param collection: The collection of the files, all the collections if None
+        :return: The best chunk of each file for each question, ordered by distance
+        """
+        rankings: list[list[Row]] = [[] for _ in question_embeddings]
+        pending = list(range(len(question_embeddings)))
+        limit = _initial_candidates_limit(files_needed)
+        while pending:
+            rows = self._find_best_chunk_per_question_and_file(
+                [question_embeddings[index] for index in pending],
+                limit,
+                collection,
+            )
+            pending, limit = _next_pending_questions(
+                pending,
+                rows,
+                rankings,
+                limit,
+                files_needed,
+            )
+        return [_to_similar_file_chunks(rows) for rows in rankings]
+
+    def find_lexical_file_chunks(
+        self,
+        question: str,
+        params: Params = Params(),
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Finds the file chunks matching the words of a question with the full-text
+        index, without any embedding
+        :param question: The question, in the web search syntax of PostgreSQL
+        :param params: The pagination params
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The best matching chunk of each file
+        """
+        files_needed = params.page * params.size
+        return paginate(
+            self.rank_lexical_file_chunks(question, files_needed, search_filter),
+            params=params,
+        )
+
+    def rank_lexical_file_chunks(
+        self,
+        question: str,
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        """
+        Ranks the files by the text rank of their best chunk for a question
+        :param question: The question, in the web search syntax of PostgreSQL
+        :param files_needed: The number of files needed
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The best matching chunk of each file, ordered by decreasing score
+        """
+        query = _best_lexical_chunk_per_file_query(
+            question,
+            _initial_candidates_limit(files_needed),
+            search_filter,
+        )
+        return _to_similar_file_chunks(self.session.execute(query).all())
+
+    def get_file_chunk_rows(self, file_chunk_ids: list[int]) -> list[Row]:
+        """
+        Gets the file names and texts of chunks, without their embeddings
+        :param file_chunk_ids: The chunk ids
+        :return: The rows of file_id, file_name, file_chunk_id and chunk_text, in any order
+        """
+        return list(
+            self.session.execute(_similar_file_chunks_query(file_chunk_ids)).all(),
+        )
+
+    @contextmanager
+    def in_new_session(self) -> Iterator["FileChunkRepository"]:
+        """
+        Opens a repository on a new session of the same engine, for queries running
+        concurrently with the ones of this repository session
+        :return: The repository, its session is closed on exit
+        """
+        with Session(self.session.get_bind(), expire_on_commit=False) as session:
+            yield FileChunkRepository(self.model, session)
+
+    def _rank_filtered_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        files_needed: int,
+        search_filter: SearchFilter,
+    ) -> list[SimilarFileChunk]:
+        """
+        Ranks the files matching the criteria of a search filter by the cosine distance
+        of their best chunk. The chunks of the matching files are all compared to the
+        question when they are few, the nearest chunks are found with the vector index
+        otherwise, oversampled to make up for the chunks of the other files.
+        :param question_embedding: The question embedding
+        :param files_needed: The number of files needed, more files can be returned
+        :param search_filter: The criteria on the files
+        :return: The best chunk of each matching file, ordered by distance
+        """
+        filtered_chunks = self.session.execute(
+            _filtered_chunks_count_query(search_filter),
+        ).scalar_one()
+        if filtered_chunks <= settings.search_exact_scan_max_chunks:
+            query = _exact_best_chunk_per_file_query(question_embedding, search_filter)
+            return _to_similar_file_chunks(self.session.execute(query).all())
+        limit = _initial_candidates_limit(
+            files_needed * settings.search_filter_oversampling,
+        )
+        while limit is not None:
+            rows = self._find_best_chunk_per_file(
+                question_embedding,
+                limit,
+                search_filter,
+            )
+            limit = _next_candidates_limit(rows, limit, files_needed, filtered=True)
+        return _to_similar_file_chunks(rows)
+
+    def _find_best_chunk_per_file(
+        self,
+        question_embedding: list[float],
+        limit: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[Row]:
+        """
+        Finds the best chunk of each file among the nearest chunks of a question embedding
+        :param question_embedding: The question embedding
+        :param limit: The number of nearest chunks fetched from the vector index
+        :param search_filter: The criteria on the files of the nearest chunks
+        :return: The rows of the similar file chunk columns, candidates_count and max_distance
+        """
+        self.session.execute(
+            _ef_search_query(
+                limit,
+                iterative=search_filter is not None and search_filter.selects_files,
+            ),
+        )
+        query = _best_chunk_per_file_query(question_embedding, limit, search_filter)
+        return list(self.session.execute(query).all())
+
+    def _find_best_chunk_per_question_and_file(
+        self,
+        question_embeddings: list[list[float]],
+        limit: int,
+        collection: str | None = None,
+    ) -> list[Row]:
+        """
+        Finds the best chunk of each file among the nearest chunks of several question
+        embeddings
+        :param question_embeddings: The question embeddings
+        :param limit: The number of nearest chunks fetched from the vector index per question
+        :param collection: The collection of the files, all the collections if None
+        :return: The rows of _find_best_chunk_per_file with the index of their question
+        """
+        self.session.execute(_ef_search_query(limit))
+        query = _best_chunk_per_question_and_file_query(
+            question_embeddings,
+            limit,
+            collection,
+        )
+        return list(self.session.execute(query).all())
+
+
+class VectorStoreFileChunkRepository(FileChunkRepository):
+    """FileChunkRepository searching the chunk embeddings in the in-process vector store."""
+
+    def __init__(
+        self,
+        model: type[FileChunk],
+        session: Session,
+        vector_store: VectorStore,
+    ):
+        super().__init__(model, session)
+        self.vector_store = vector_store
+
     def find_similar_file_chunks(
         self,
         question_embedding: list[float],
         params: Params = Params(),
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Finds similar top k file chunks belonging to different files for a question
+        embedding in the vector store, then reads the names and texts of the page
+        :param params: The pagination params
+        :param question_embedding: The question embedding
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The similar file chunks
+        """
+        results = self.vector_store.search(
+            question_embedding,
+            settings.search_similarity_threshold,
+            settings.search_max_candidates,
+            self._get_filtered_file_ids(search_filter),
+        )
+        page_results = _page_items(results, params)
+        rows = self.session.execute(
+            _similar_file_chunks_query(
+                [result.file_chunk_id for result in page_results],
+            ),
+        ).all()
+        return create_page(
+            _to_vector_store_similar_file_chunks(page_results, rows),
+            total=len(results),
+            params=params,
+        )
+
+    def rank_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        results = self.vector_store.search(
+            question_embedding,
+            settings.search_similarity_threshold,
+            files_needed,
+            self._get_filtered_file_ids(search_filter),
+        )
+        rows = self.session.execute(
+            _similar_file_chunks_query([result.file_chunk_id for result in results]),
+        ).all()
+        return _to_vector_store_similar_file_chunks(results, rows)
+
+    def _get_filtered_file_ids(
+        self,
+        search_filter: SearchFilter | None,
+    ) -> list[int] | None:
+        """
+        Gets the ids of the files matching the criteria of a search filter
+        :param search_filter: The criteria on the files
+        :return: The file ids, None if there is no filter
+        """
+        if search_filter is None:
+            return None
+        return list(self.session.scalars(_filtered_file_ids_query(search_filter)))
+
+    def rank_similar_file_chunks_batch(
+        self,
+        question_embeddings: list[list[float]],
+        files_needed: int,
+        collection: str | None = None,
+    ) -> list[list[SimilarFileChunk]]:
+        results = self.vector_store.search_many(
+            question_embeddings,
+            settings.search_similarity_threshold,
+            files_needed,
+            self._get_filtered_file_ids(_collection_filter(collection)),
+        )
+        rows = self.session.execute(
+            _similar_file_chunks_query(
+                [result.file_chunk_id for ranking in results for result in ranking],
+            ),
+        ).all()
+        return [
+            _to_vector_store_similar_file_chunks(ranking, rows) for ranking in results
+        ]
+
+    def sync_file_chunks(self, file_id: int) -> None:
+        """
+        Replaces the chunk embeddings of a file in the vector store with the ones of
+        the database, then invalidates the cached search results
+        :param file_id: The file id
+        """
+        rows = self.session.execute(
+            select(self.model.id, self.model.embedding_vector).where(
+                self.model.file_id == file_id,
+            ),
+        ).all()
+        self.vector_store.delete_file(file_id)
+        self.vector_store.append(
+            [row.id for row in rows],
+            [file_id] * len(rows),
+            np.array([row.embedding_vector for row in rows]),
+        )
+        # the results of the searches run since the chunks were committed are cached
+        # without the ones of this file
+        self.bump_corpus_generation()
+        self.session.commit()
+
+    def rebuild_vector_store(self, batch_size: int = 10_000) -> None:
+        """
+        Rebuilds the vector store with all the chunk embeddings of the database, and
+        trains its ivf lists in the ivf mode
+        :param batch_size: The number of chunks read and appended at once
+        """
+        self.vector_store.reset()
+        query = (
+            select(self.model.id, self.model.file_id, self.model.embedding_vector)
+            .where(self.model.embedding_vector.is_not(None))
+            .order_by(self.model.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for rows in self.session.execute(query).partitions():
+            self.vector_store.append(
+                [row.id for row in rows],
+                [row.file_id for row in rows],
+                np.array([row.embedding_vector for row in rows]),
+            )
+        logger.info(f"Vector store rebuilt with {len(self.vector_store)} chunks")
+        if settings.vector_store_mode == VectorStoreMode.IVF:
+            self.vector_store.train_ivf(settings.ivf_lists)
+        self.bump_corpus_generation()
+        self.session.commit()
+
+
+class AsyncFileRepository(AsyncBaseRepository[File]):
+    async def get_files_overview(
+        self,
+        params: Params = Params(),
+        collection: str | None = None,
     ) -> Page[Row]:
+        """
+        Gets a page of files without loading their whole content
+        :param params: The pagination params
+        :param collection: The collection of the files, all the collections if None
+        :return: The page of rows with the file columns and the first 200 characters of the content
+        """
+        return await self.get_many(
+            *_collection_conditions(collection),
+            params=params,
+            columns=_files_overview_columns(),
+        )
+
+
+class AsyncFileChunkRepository(AsyncBaseRepository[FileChunk]):
+    async def find_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        params: Params = Params(),
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
         """
         Finds similar top k file chunks belonging to different files for a question embedding
         :param params: The pagination params
         :param question_embedding: The question embedding
+        :param search_filter: The criteria on the files, all the files if None
         :return: The similar file chunks
         """
-        # get top_k similar file chunks but having different file_id
-        # Define a threshold for similarity
-        similarity_threshold = 0.25
-        file_chunk_alias = aliased(self.model)
-        subq = (
-            select(
-                file_chunk_alias.file_id.label("file_id"),
-                func.min(
-                    file_chunk_alias.embedding_vector.cosine_distance(
-                        question_embedding,
-                    ),
-                ).label("min_distance"),
-            )
-            .group_by(file_chunk_alias.file_id)
-            .alias()
-        )
-
-        # Main query to get the file chunks with the smallest distance (highest similarity) from each file
-        most_similar_chunks_query = (
-            select(self.model, subq.c.min_distance)
-            .join(subq, self.model.file_id == subq.c.file_id)
-            .where(
-                self.model.embedding_vector.cosine_distance(question_embedding)
-                == subq.c.min_distance,
-                self.model.embedding_vector.cosine_distance(question_embedding)
-                < similarity_threshold,
+        files_needed = params.page * params.size
+        ranking = await self.rank_similar_file_chunks(
+            question_embedding,
+            files_needed,
+            search_filter,
+        )
+        # the ranking stops at the requested page, the total counts all the files
+        total = (
+            await self.session.execute(
+                _similar_files_count_query(question_embedding, search_filter),
             )
-            .order_by(subq.c.min_distance)
+        ).scalar_one()
+        return create_page(_page_items(ranking, params), total=total, params=params)
+
+    async def rank_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        limit = _initial_candidates_limit(files_needed)
+        filtered = search_filter is not None and search_filter.selects_files
+        if filtered:
+            filtered_chunks = (
+                await self.session.execute(_filtered_chunks_count_query(search_filter))
+            ).scalar_one()
+            if filtered_chunks <= settings.search_exact_scan_max_chunks:
+                query = _exact_best_chunk_per_file_query(
+                    question_embedding,
+                    search_filter,
+                )
+                return _to_similar_file_chunks(
+                    (await self.session.execute(query)).all(),
+                )
+            limit = _initial_candidates_limit(
+                files_needed * settings.search_filter_oversampling,
+            )
+        while limit is not None:
+            await self.session.execute(_ef_search_query(limit, iterative=filtered))
+            query = _best_chunk_per_file_query(question_embedding, limit, search_filter)
+            rows = list((await self.session.execute(query)).all())
+            limit = _next_candidates_limit(rows, limit, files_needed, filtered=filtered)
+        return _to_similar_file_chunks(rows)
+
+    async def rank_similar_file_chunks_batch(
+        self,
+        question_embeddings: list[list[float]],
+        files_needed: int,
+        collection: str | None = None,
+    ) -> list[list[SimilarFileChunk]]:
+        rankings: list[list[Row]] = [[] for _ in question_embeddings]
+        pending = list(range(len(question_embeddings)))
+        limit = _initial_candidates_limit(files_needed)
+        while pending:
+            await self.session.execute(_ef_search_query(limit))
+            query = _best_chunk_per_question_and_file_query(
+                [question_embeddings[index] for index in pending],
+                limit,
+                collection,
+            )
+            rows = list((await self.session.execute(query)).all())
+            pending, limit = _next_pending_questions(
+                pending,
+                rows,
+                rankings,
+                limit,
+                files_needed,
+            )
+        return [_to_similar_file_chunks(rows) for rows in rankings]
+
+    async def find_lexical_file_chunks(
+        self,
+        question: str,
+        params: Params = Params(),
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        files_needed = params.page * params.size
+        return paginate(
+            await self.rank_lexical_file_chunks(question, files_needed, search_filter),
+            params=params,
+        )
+
+    async def rank_lexical_file_chunks(
+        self,
+        question: str,
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        query = _best_lexical_chunk_per_file_query(
+            question,
+            _initial_candidates_limit(files_needed),
+            search_filter,
         )
+        return _to_similar_file_chunks((await self.session.execute(query)).all())
+
+    async def get_file_chunk_rows(self, file_chunk_ids: list[int]) -> list[Row]:
+        result = await self.session.execute(_similar_file_chunks_query(file_chunk_ids))
+        return list(result.all())
+
+    @asynccontextmanager
+    async def in_new_session(self) -> AsyncIterator["AsyncFileChunkRepository"]:
+        async with AsyncSession(self.session.bind, expire_on_commit=False) as session:
+            yield AsyncFileChunkRepository(self.model, session)
+
 
-        result = self.session.execute(most_similar_chunks_query)
-        # result contains rows of (file_chunk, min_distance), so we don't use scalars() here
-        return paginate(result.all(), params=params)
+class AsyncVectorStoreFileChunkRepository(AsyncFileChunkRepository):
+    """AsyncFileChunkRepository searching the chunk embeddings in the vector store."""
+
+    def __init__(
+        self,
+        model: type[FileChunk],
+        session: AsyncSession,
+        vector_store: VectorStore,
+    ):
+        super().__init__(model, session)
+        self.vector_store = vector_store
+
+    async def find_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        params: Params = Params(),
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Finds similar top k file chunks belonging to different files for a question
+        embedding in the vector store, then reads the names and texts of the page
+        :param params: The pagination params
+        :param question_embedding: The question embedding
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The similar file chunks
+        """
+        file_ids = await self._get_filtered_file_ids(search_filter)
+        # the scan is CPU bound, NumPy releases the GIL during the matrix products
+        results = await asyncio.to_thread(
+            self.vector_store.search,
+            question_embedding,
+            settings.search_similarity_threshold,
+            settings.search_max_candidates,
+            file_ids,
+        )
+        page_results = _page_items(results, params)
+        rows = (
+            await self.session.execute(
+                _similar_file_chunks_query(
+                    [result.file_chunk_id for result in page_results],
+                ),
+            )
+        ).all()
+        return create_page(
+            _to_vector_store_similar_file_chunks(page_results, rows),
+            total=len(results),
+            params=params,
+        )
+
+    async def rank_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        file_ids = await self._get_filtered_file_ids(search_filter)
+        results = await asyncio.to_thread(
+            self.vector_store.search,
+            question_embedding,
+            settings.search_similarity_threshold,
+            files_needed,
+            file_ids,
+        )
+        rows = (
+            await self.session.execute(
+                _similar_file_chunks_query(
+                    [result.file_chunk_id for result in results],
+                ),
+            )
+        ).all()
+        return _to_vector_store_similar_file_chunks(results, rows)
+
+    async def _get_filtered_file_ids(
+        self,
+        search_filter: SearchFilter | None,
+    ) -> list[int] | None:
+        if search_filter is None:
+            return None
+        return list(
+            await self.session.scalars(_filtered_file_ids_query(search_filter)),
+        )
+
+    async def rank_similar_file_chunks_batch(
+        self,
+        question_embeddings: list[list[float]],
+        files_needed: int,
+        collection: str | None = None,
+    ) -> list[list[SimilarFileChunk]]:
+        file_ids = await self._get_filtered_file_ids(_collection_filter(collection))
+        results = await asyncio.to_thread(
+            self.vector_store.search_many,
+            question_embeddings,
+            settings.search_similarity_threshold,
+            files_needed,
+            file_ids,
+        )
+        rows = (
+            await self.session.execute(
+                _similar_file_chunks_query(
+                    [result.file_chunk_id for ranking in results for result in ranking],
+                ),
+            )
+        ).all()
+        return [
+            _to_vector_store_similar_file_chunks(ranking, rows) for ranking in results
+        ]
+
+
+def _files_overview_columns() -> tuple[Any, ...]:
+    return (
+        File.id,
+        File.name,
+        File.collection,
+        File.size,
+        func.substr(File.content, 1, 200).label("content"),
+        File.created_at,
+        File.updated_at,
+    )
+
+
+def _collection_conditions(collection: str | None) -> list[ColumnElement[bool]]:
+    return [] if collection is None else [File.collection == collection]
+
+
+# The nearest chunks are fetched from the HNSW index, then reduced to the best chunk
+# per file. Several chunks of the same file can be among the nearest ones, so the
+# candidates are oversampled, and their number is doubled while the page is not full
+# and the farthest candidate is still below the similarity threshold.
+def _initial_candidates_limit(files_needed: int) -> int:
+    return min(
+        files_needed * settings.search_candidates_oversampling,
+        settings.search_max_candidates,
+    )
+
+
+def _next_candidates_limit(
+    rows: list[Row],
+    limit: int,
+    files_needed: int,
+    filtered: bool = False,
+) -> int | None:
+    # the index returns fewer candidates than the limit when it has no more chunks,
+    # or when a filter discards the chunks of the other files after the scan, unless
+    # the scan goes on until enough chunks match
+    discarding = filtered and not settings.hnsw_iterative_scan
+    if (
+        len(rows) >= files_needed
+        or limit >= settings.search_max_candidates
+        or (rows and rows[0].max_distance >= settings.search_similarity_threshold)
+        or (not discarding and (not rows or rows[0].candidates_count < limit))
+    ):
+        return None
+    return min(limit * 2, settings.search_max_candidates)
+
+
+def _next_pending_questions(
+    pending: list[int],
+    rows: list[Row],
+    rankings: list[list[Row]],
+    limit: int,
+    files_needed: int,
+) -> tuple[list[int], int]:
+    # the rows of the pending questions replace their previous ranking, the questions
+    # whose candidates must be widened are searched again with the next limit
+    rows_by_position: dict[int, list[Row]] = {}
+    for row in rows:
+        rows_by_position.setdefault(row.question, []).append(row)
+    for position, index in enumerate(pending):
+        rankings[index] = rows_by_position.get(position, [])
+    next_pending = [
+        index
+        for index in pending
+        if _next_candidates_limit(rankings[index], limit, files_needed) is not None
+    ]
+    return next_pending, min(limit * 2, settings.search_max_candidates)
+
+
+def _index_scan_limit(limit: int, storage: EmbeddingStorage) -> int:
+    if storage == EmbeddingStorage.FULL:
+        return limit
+    return limit * settings.search_rerank_oversampling
+
+
+def _ef_search_query(
+    limit: int,
+    storage: EmbeddingStorage | None = None,
+    iterative: bool = False,
+) -> Select:
+    storage = storage or settings.embedding_storage
+    # the index scan returns at most ef_search rows
+    ef_search = max(settings.hnsw_ef_search, _index_scan_limit(limit, storage))
+    parameters = [
+        func.set_config(
+            "hnsw.ef_search",
+            str(min(ef_search, HNSW_MAX_EF_SEARCH)),
+            True,
+        ),
+    ]
+    if iterative and settings.hnsw_iterative_scan:
+        # the candidates are ranked again by distance, their order does not matter
+        parameters.append(
+            func.set_config("hnsw.iterative_scan", "relaxed_order", True),
+        )
+    return select(*parameters)
+
+
+def _candidates_query(
+    question_embedding: list[float] | ColumnElement[Any],
+    limit: int,
+    storage: EmbeddingStorage | None = None,
+    search_filter: SearchFilter | None = None,
+) -> Select:
+    """
+    Makes the query of the nearest chunks of a question embedding
+    :param question_embedding: The question embedding, or a column of embeddings
+    :param limit: The number of nearest chunks
+    :param storage: The precision of the scanned index, defaults to the settings one
+    :param search_filter: The criteria on the files of the chunks scanned in the index
+    :return: The query of (id, collection, file_id, distance) ordered by exact cosine
+    distance
+    """
+    storage = storage or settings.embedding_storage
+    distance = exact_distance(question_embedding)
+    # only the partition of the collection is scanned, the chunks of the other files
+    # are discarded during the index scan
+    conditions = [] if search_filter is None else search_filter.chunk_conditions()
+    if storage == EmbeddingStorage.FULL:
+        return (
+            select(*_candidate_columns(), distance.label("distance"))
+            .where(*conditions)
+            .order_by(distance)
+            .limit(limit)
+        )
+    # two stages: the quantized index is scanned for oversampled candidates,
+    # which are reranked with the float32 embeddings read from the table
+    prefiltered = (
+        select(FileChunk.id)
+        .where(*conditions)
+        .order_by(index_distance(question_embedding, storage))
+        .limit(_index_scan_limit(limit, storage))
+        .subquery()
+    )
+    return (
+        select(*_candidate_columns(), distance.label("distance"))
+        .join(prefiltered, FileChunk.id == prefiltered.c.id)
+        .where(*conditions)
+        .order_by(distance)
+        .limit(limit)
+    )
+
+
+def _candidate_columns() -> tuple[ColumnElement[Any], ...]:
+    # the collection of the candidates prunes the partitions joined to read their text
+    return FileChunk.id, FileChunk.collection, FileChunk.file_id
+
+
+def _collection_filter(collection: str | None) -> SearchFilter | None:
+    return None if collection is None else SearchFilter(collection=collection)
+
+
+def _best_chunk_per_file_query(
+    question_embedding: list[float],
+    limit: int,
+    search_filter: SearchFilter | None = None,
+) -> Select:
+    candidates = _candidates_query(
+        question_embedding,
+        limit,
+        search_filter=search_filter,
+    ).subquery()
+    return _best_chunk_per_file(candidates)
+
+
+def _exact_best_chunk_per_file_query(
+    question_embedding: list[float],
+    search_filter: SearchFilter,
+) -> Select:
+    # without ORDER BY and LIMIT the vector index is not used, the chunks of the
+    # matching files are read with the index on file_id and all compared
+    distance = exact_distance(question_embedding)
+    candidates = (
+        select(*_candidate_columns(), distance.label("distance"))
+        .where(*search_filter.chunk_conditions())
+        .subquery()
+    )
+    return _best_chunk_per_file(candidates)
+
+
+def _filtered_file_ids_query(search_filter: SearchFilter) -> Select:
+    return select(File.id).where(*search_filter.file_conditions())
+
+
+def _filtered_chunks_count_query(search_filter: SearchFilter) -> Select:
+    # the chunks are counted up to the exact scan maximum, it is enough to choose
+    # the scan and it bounds the cost of the count for broad filters
+    filtered_chunks = (
+        select(FileChunk.id)
+        .where(*search_filter.chunk_conditions())
+        .limit(settings.search_exact_scan_max_chunks + 1)
+        .subquery()
+    )
+    return select(func.count()).select_from(filtered_chunks)
+
+
+def _similar_files_count_query(
+    question_embedding: list[float],
+    search_filter: SearchFilter | None = None,
+) -> Select:
+    # every chunk is compared to the question, the count does not depend on the
+    # candidates fetched from the vector index
+    conditions = [] if search_filter is None else search_filter.chunk_conditions()
+    return select(func.count(FileChunk.file_id.distinct())).where(
+        exact_distance(question_embedding) < settings.search_similarity_threshold,
+        *conditions,
+    )
+
+
+def _best_chunk_per_question_and_file_query(
+    question_embeddings: list[list[float]],
+    limit: int,
+    collection: str | None = None,
+) -> Select:
+    """
+    Makes the query of the best chunk of each file for several question embeddings
+    :param question_embeddings: The question embeddings
+    :param limit: The number of nearest chunks of each question
+    :param collection: The collection of the files, all the collections if None
+    :return: The query of the result columns, with the question index of each row
+    """
+    embedding_type = Vector(EMBEDDING_DIMENSIONS)
+    # the values are cast, the parameters of a VALUES list would be typed as text
+    questions = values(
+        column("question", Integer),
+        column("embedding", embedding_type),
+        name="questions",
+    ).data(
+        [
+            (
+                cast(literal(index), Integer),
+                cast(literal(question_embedding, embedding_type), embedding_type),
+            )
+            for index, question_embedding in enumerate(question_embeddings)
+        ],
+    )
+    # the nearest chunks of each question are scanned from the vector index by a
+    # lateral subquery, the statement runs as many index scans as questions
+    question_candidates = _candidates_query(
+        questions.c.embedding,
+        limit,
+        search_filter=_collection_filter(collection),
+    ).lateral()
+    candidates = (
+        select(questions.c.question, question_candidates)
+        .select_from(questions)
+        .join(question_candidates, true())
+        .subquery()
+    )
+    return _best_chunk_per_file(candidates, candidates.c.question)
+
+
+def _best_chunk_per_file(
+    candidates: Subquery,
+    question: ColumnElement[int] | None = None,
+) -> Select:
+    # the candidates of different questions are ranked apart
+    questions = [] if question is None else [question]
+    ranked_candidates = select(
+        candidates,
+        func.row_number()
+        .over(
+            partition_by=[*questions, candidates.c.file_id],
+            order_by=candidates.c.distance,
+        )
+        .label("rank"),
+        func.count().over(partition_by=questions or None).label("candidates_count"),
+        func.max(candidates.c.distance)
+        .over(partition_by=questions or None)
+        .label("max_distance"),
+    ).subquery()
+    ranked_questions = [ranked_candidates.c[column.name] for column in questions]
+
+    # only the columns of the results are selected, the chunk embeddings are neither
+    # sent back nor decoded, and the file names come from the same statement
+    return (
+        select(
+            *ranked_questions,
+            ranked_candidates.c.file_id,
+            File.name.label("file_name"),
+            ranked_candidates.c.id.label("file_chunk_id"),
+            FileChunk.chunk_text,
+            ranked_candidates.c.distance,
+            ranked_candidates.c.candidates_count,
+            ranked_candidates.c.max_distance,
+        )
+        .select_from(ranked_candidates)
+        .join(
+            FileChunk,
+            and_(
+                FileChunk.id == ranked_candidates.c.id,
+                FileChunk.collection == ranked_candidates.c.collection,
+            ),
+        )
+        .join(File, File.id == ranked_candidates.c.file_id)
+        .where(
+            ranked_candidates.c.rank == 1,
+            ranked_candidates.c.distance < settings.search_similarity_threshold,
+        )
+        .order_by(*ranked_questions, ranked_candidates.c.distance)
+    )
+
+
+def _best_lexical_chunk_per_file_query(
+    question: str,
+    limit: int,
+    search_filter: SearchFilter | None = None,
+) -> Select:
+    # the chunks matching the question are found with the GIN index on chunk_tsv
+    ts_query = func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, question)
+    score = func.ts_rank_cd(FileChunk.chunk_tsv, ts_query)
+    conditions = [FileChunk.chunk_tsv.op("@@")(ts_query)]
+    if search_filter is not None:
+        conditions += search_filter.chunk_conditions()
+    candidates = (
+        select(*_candidate_columns(), score.label("score"))
+        .where(*conditions)
+        .order_by(score.desc())
+        .limit(limit)
+        .subquery()
+    )
+    ranked_candidates = select(
+        candidates,
+        func.row_number()
+        .over(partition_by=candidates.c.file_id, order_by=candidates.c.score.desc())
+        .label("rank"),
+    ).subquery()
+
+    return (
+        select(
+            ranked_candidates.c.file_id,
+            File.name.label("file_name"),
+            ranked_candidates.c.id.label("file_chunk_id"),
+            FileChunk.chunk_text,
+            ranked_candidates.c.score,
+        )
+        .select_from(ranked_candidates)
+        .join(
+            FileChunk,
+            and_(
+                FileChunk.id == ranked_candidates.c.id,
+                FileChunk.collection == ranked_candidates.c.collection,
+            ),
+        )
+        .join(File, File.id == ranked_candidates.c.file_id)
+        .where(ranked_candidates.c.rank == 1)
+        .order_by(ranked_candidates.c.score.desc())
+    )
+
+
+def _to_similar_file_chunks(rows: list[Row]) -> list[SimilarFileChunk]:
+    return [
+        SimilarFileChunk(
+            file_id=row.file_id,
+            file_name=row.file_name,
+            file_chunk_id=row.file_chunk_id,
+            chunk_text=row.chunk_text,
+            distance=getattr(row, "distance", None),
+            score=getattr(row, "score", None),
+        )
+        for row in rows
+    ]
+
+
+def _page_items(items: list[Any], params: Params) -> list[Any]:
+    raw_params = params.to_raw_params().as_limit_offset()
+    return items[raw_params.offset : raw_params.offset + raw_params.limit]
+
+
+def _similar_file_chunks_query(file_chunk_ids: list[int]) -> Select:
+    return (
+        select(
+            FileChunk.file_id,
+            File.name.label("file_name"),
+            FileChunk.id.label("file_chunk_id"),
+            FileChunk.chunk_text,
+        )
+        .join(File, File.id == FileChunk.file_id)
+        .where(FileChunk.id.in_(file_chunk_ids))
+    )
+
+
+def _to_vector_store_similar_file_chunks(
+    results: list[VectorSearchResult],
+    rows: list[Row],
+) -> list[SimilarFileChunk]:
+    # chunks deleted from the database since they were found are left out
+    rows_by_id = {row.file_chunk_id: row for row in rows}
+    return [
+        SimilarFileChunk(
+            file_id=result.file_id,
+            file_name=rows_by_id[result.file_chunk_id].file_name,
+            file_chunk_id=result.file_chunk_id,
+            chunk_text=rows_by_id[result.file_chunk_id].chunk_text,
+            distance=result.distance,
+        )
+        for result in results
+        if result.file_chunk_id in rows_by_id
+    ]
 
 
 def get_file_repository(session: Session = Depends(get_db_session)) -> FileRepository:
@@ -66,4 +1450,24 @@ def get_file_repository(session: Session = Depends(get_db_session)) -> FileRepos
 def get_file_chunk_repository(
     session: Session = Depends(get_db_session),
 ) -> FileChunkRepository:
+    if settings.search_backend == SearchBackendName.VECTOR_STORE:
+        return VectorStoreFileChunkRepository(FileChunk, session, get_vector_store())
     return FileChunkRepository(FileChunk, session)
+
+
+def get_async_file_repository(
+    session: AsyncSession = Depends(get_async_db_session),
+) -> AsyncFileRepository:
+    return AsyncFileRepository(File, session)
+
+
+def get_async_file_chunk_repository(
+    session: AsyncSession = Depends(get_async_db_session),
+) -> AsyncFileChunkRepository:
+    if settings.search_backend == SearchBackendName.VECTOR_STORE:
+        return AsyncVectorStoreFileChunkRepository(
+            FileChunk,
+            session,
+            get_vector_store(),
+        )
+    return AsyncFileChunkRepository(FileChunk, session)
@@ -0,0 +1,205 @@
+import datetime
+from typing import Any
+
+from fastapi import Depends
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from api.infra.db.dependencies import get_db_session
+from api.infra.db.model.file import File
+from api.infra.db.model.ingestion_job import IngestionJob, IngestionStatus
+from api.infra.db.repository.base import BaseRepository, add_and_commit
+
+# key of the transaction-level advisory lock serializing the enqueuing transactions
+ENQUEUE_LOCK_KEY = 7_240_001
+
+
+class IngestionJobRepository(BaseRepository[IngestionJob]):
+    def enqueue(self, file: File, max_queue_depth: int) -> IngestionJob | None:
+        """
+        Adds a file and its pending ingestion job in a single transaction, unless the
+        queue is full. The enqueuing transactions are serialized by an advisory lock
+        held until their commit, so that no other one adds a job between the depth
+        check and the insert, the ingestion workers do not take it.
+        :param file: The file, not added yet
+        :param max_queue_depth: The maximum number of jobs waiting or running
+        :return: The created job, or None if the queue is full, nothing is added then
+        """
+        self.session.execute(select(func.pg_advisory_xact_lock(ENQUEUE_LOCK_KEY)))
+        if self.count_unfinished() >= max_queue_depth:
+            self.session.rollback()
+            return None
+        return add_and_commit(
+            self.session,
+            self.model(file=file, status=IngestionStatus.PENDING.value),
+        )
+
+    def add_many(self, file_ids: list[int], status: IngestionStatus) -> None:
+        """
+        Adds the jobs of files ingested or to be ingested, the jobs are committed with
+        the next commit
+        :param file_ids: The file ids
+        :param status: The status of the jobs, done for files ingested by the caller
+        """
+        self.session.add_all(
+            [
+                self.model(
+                    file_id=file_id,
+                    status=status.value,
+                    attempts=int(status == IngestionStatus.DONE),
+                )
+                for file_id in file_ids
+            ],
+        )
+
+    def claim_next(self, lock_timeout: int) -> IngestionJob | None:
+        """
+        Claims the oldest available job, jobs locked by other workers are skipped
+        :param lock_timeout: The seconds after which a running job is considered
+        abandoned by a crashed worker and can be claimed again
+        :return: The claimed job, or None if the queue is empty
+        """
+        query = (
+            select(self.model)
+            .where(
+                or_(
+                    and_(
+                        self.model.status == IngestionStatus.PENDING.value,
+                        self.model.available_at <= func.now(),
+                    ),
+                    and_(
+                        self.model.status == IngestionStatus.RUNNING.value,
+                        self.model.locked_at
+                        < func.now() - datetime.timedelta(seconds=lock_timeout),
+                    ),
+                ),
+            )
+            .order_by(self.model.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = self.session.execute(query).scalars().first()
+        if job is None:
+            self.session.rollback()
+            return None
+        job.status = IngestionStatus.RUNNING.value
+        job.attempts += 1
+        job.locked_at = func.now()
+        self.session.commit()
+        return job
+
+    def extend_lease(self, job: IngestionJob, attempt: int) -> IngestionJob | None:
+        """
+        Renews the lock of a running job, so that it is not claimed again as abandoned
+        while its worker is still processing it
+        :param job: The job
+        :param attempt: The attempt of the claim, the attempts of the job once claimed
+        :return: The updated job, or None if another worker claimed it since
+        """
+        return self._update_claimed(job, attempt, locked_at=func.now())
+
+    def complete(self, job: IngestionJob, attempt: int) -> IngestionJob | None:
+        """
+        Marks a job as done
+        :param job: The job
+        :param attempt: The attempt of the claim, the attempts of the job once claimed
+        :return: The updated job, or None if another worker claimed it since, the job
+        is left unchanged then
+        """
+        return self._update_claimed(
+            job,
+            attempt,
+            status=IngestionStatus.DONE.value,
+            last_error=None,
+            locked_at=None,
+        )
+
+    def fail(
+        self,
+        job: IngestionJob,
+        attempt: int,
+        error: str,
+        max_attempts: int,
+        retry_backoff: int,
+    ) -> IngestionJob | None:
+        """
+        Schedules a retry of a failed job with an exponential backoff, or marks it
+        as failed when it has no attempt left
+        :param job: The job
+        :param attempt: The attempt of the claim, the attempts of the job once claimed
+        :param error: The error message
+        :param max_attempts: The maximum number of attempts of a job
+        :param retry_backoff: The delay in seconds before the first retry
+        :return: The updated job, or None if another worker claimed it since, the job
+        is left unchanged and the changes of the transaction are rolled back then
+        """
+        if attempt >= max_attempts:
+            return self._update_claimed(
+                job,
+                attempt,
+                status=IngestionStatus.FAILED.value,
+                last_error=error,
+                locked_at=None,
+            )
+        delay = retry_backoff * 2 ** (attempt - 1)
+        return self._update_claimed(
+            job,
+            attempt,
+            status=IngestionStatus.PENDING.value,
+            last_error=error,
+            locked_at=None,
+            available_at=func.now() + datetime.timedelta(seconds=delay),
+        )
+
+    def _update_claimed(
+        self,
+        job: IngestionJob,
+        attempt: int,
+        **values: Any,
+    ) -> IngestionJob | None:
+        """
+        Updates a running job and commits, unless it was claimed again since, by the
+        worker of a later attempt
+        :param job: The job
+        :param attempt: The attempt of the claim, passed apart from the job whose
+        attributes are loaded again after a rollback
+        :param values: The new values of the columns
+        :return: The updated job, or None if the job was claimed again, the
+        transaction is rolled back then
+        """
+        result = self.session.execute(
+            update(self.model)
+            .where(
+                self.model.id == job.id,
+                self.model.status == IngestionStatus.RUNNING.value,
+                # the attempts are counted by the claims, they identify the claim
+                self.model.attempts == attempt,
+            )
+            .values(**values),
+        )
+        if result.rowcount != 1:
+            self.session.rollback()
+            return None
+        self.session.commit()
+        return job
+
+    def count_unfinished(self) -> int:
+        """
+        Counts the jobs waiting or being processed
+        :return: The queue depth
+        """
+        query = select(func.count()).where(
+            self.model.status.in_(
+                [IngestionStatus.PENDING.value, IngestionStatus.RUNNING.value],
+            ),
+        )
+        return self.session.execute(query).scalar_one()
+
+    def get_by_file_id(self, file_id: int) -> IngestionJob | None:
+        return self.get(self.model.file_id == file_id)
+
+
+def get_ingestion_job_repository(
+    session: Session = Depends(get_db_session),
+) -> IngestionJobRepository:
+    return IngestionJobRepository(IngestionJob, session)
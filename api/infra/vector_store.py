@@ -0,0 +1,447 @@
+import fcntl
+import functools
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+from loguru import logger
+
+from api.settings import VectorStoreMode, settings
+
+
+@dataclass(slots=True, frozen=True)
+class VectorSearchResult:
+    """Best chunk of a file for a question, as found in the vector store."""
+
+    file_chunk_id: int
+    file_id: int
+    distance: float
+
+
+class VectorStore:
+    """
+    Chunk embeddings held in memory-mapped files, searched in process with NumPy.
+
+    The directory holds a float32 matrix of the L2 normalized embeddings and sidecar
+    arrays with the chunk id, the file id and the tombstone of every row. The rows
+    are only appended, the chunk ids file is written last so its length is the number
+    of complete rows. The files are mapped read-only and shared, all the processes of
+    a host reading the same store share its pages in the OS page cache.
+
+    In the ivf mode, the rows are assigned to the nearest of the centroids trained by
+    train_ivf and a search only scans the rows of the nearest centroids.
+    """
+
+    # number of rows multiplied by the questions at once, bounds the temporary arrays
+    block_rows = 65536
+
+    def __init__(
+        self,
+        directory: str,
+        dimensions: int = 1536,
+        mode: VectorStoreMode = VectorStoreMode.EXACT,
+        ivf_probes: int = 16,
+        exact_scan_max_rows: int = 20000,
+    ):
+        self.directory = directory
+        self.dimensions = dimensions
+        self.mode = mode
+        self.ivf_probes = ivf_probes
+        self.exact_scan_max_rows = exact_scan_max_rows
+        self._lock = threading.Lock()
+        self._state = ()
+        self._centroids_mtime = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def __len__(self) -> int:
+        return _file_rows(self._path("ids.i64"), np.int64)
+
+    def append(
+        self,
+        file_chunk_ids: list[int],
+        file_ids: list[int],
+        embeddings: np.ndarray,
+    ) -> None:
+        """
+        Appends chunk embeddings to the store
+        :param file_chunk_ids: The chunk ids
+        :param file_ids: The file id of each chunk
+        :param embeddings: The embeddings, one row per chunk
+        """
+        if not file_chunk_ids:
+            return
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._write_lock():
+            size = len(self)
+            self._truncate(size)
+            _append_array(self._path("embeddings.f32"), embeddings)
+            _append_array(self._path("file_ids.i64"), np.asarray(file_ids, np.int64))
+            _append_array(
+                self._path("deleted.u8"),
+                np.zeros(len(file_chunk_ids), np.uint8),
+            )
+            centroids = self._load_centroids()
+            if centroids is not None:
+                _append_array(
+                    self._path("ivf_assignments.i32"),
+                    _nearest_centroids(embeddings, centroids),
+                )
+            # the rows are committed once their ids are written
+            _append_array(self._path("ids.i64"), np.asarray(file_chunk_ids, np.int64))
+
+    def delete_file(self, file_id: int) -> None:
+        """
+        Marks the chunks of a file as deleted, their rows are skipped by the searches
+        :param file_id: The file id
+        """
+        self.delete_files([file_id])
+
+    def delete_files(self, file_ids: list[int]) -> None:
+        """
+        Marks the chunks of several files as deleted, with a single scan of the rows
+        :param file_ids: The file ids
+        """
+        with self._write_lock():
+            size = len(self)
+            if size == 0 or not file_ids:
+                return
+            row_file_ids = np.memmap(
+                self._path("file_ids.i64"),
+                np.int64,
+                "r",
+                shape=size,
+            )
+            rows = np.flatnonzero(np.isin(row_file_ids, file_ids))
+            if len(rows) == 0:
+                return
+            deleted = np.memmap(self._path("deleted.u8"), np.uint8, "r+", shape=size)
+            deleted[rows] = 1
+            deleted.flush()
+
+    def search(
+        self,
+        question_embedding: list[float],
+        threshold: float,
+        max_results: int,
+        filtered_file_ids: list[int] | None = None,
+    ) -> list[VectorSearchResult]:
+        return self.search_many(
+            [question_embedding],
+            threshold,
+            max_results,
+            filtered_file_ids,
+        )[0]
+
+    def search_many(
+        self,
+        question_embeddings: list[list[float]],
+        threshold: float,
+        max_results: int,
+        filtered_file_ids: list[int] | None = None,
+    ) -> list[list[VectorSearchResult]]:
+        """
+        Finds the best chunk of each file for several questions, a block of rows is
+        multiplied by all the questions at once
+        :param question_embeddings: The question embeddings
+        :param threshold: The maximum cosine distance of a returned chunk
+        :param max_results: The maximum number of files returned per question
+        :param filtered_file_ids: The files searched, all the files if None
+        :return: The results of each question, ordered by distance
+        """
+        questions = _normalize(np.asarray(question_embeddings, dtype=np.float32))
+        embeddings, file_chunk_ids, file_ids, deleted = self._snapshot()
+        if len(file_chunk_ids) == 0:
+            return [[] for _ in question_embeddings]
+
+        filtered_rows = None
+        if filtered_file_ids is not None:
+            # the rows of the other files are skipped like the deleted ones
+            deleted = deleted.astype(bool) | ~np.isin(file_ids, filtered_file_ids)
+            filtered_rows = np.flatnonzero(~deleted)
+
+        if filtered_rows is not None and len(filtered_rows) <= self.exact_scan_max_rows:
+            # few rows match the filter, they are all compared even in the ivf mode
+            candidates = [
+                _search_rows(embeddings, filtered_rows, question, threshold)
+                for question in questions
+            ]
+        elif self.mode == VectorStoreMode.IVF and self._load_centroids() is not None:
+            candidates = [
+                self._search_ivf(embeddings, deleted, question, threshold)
+                for question in questions
+            ]
+        else:
+            candidates = self._search_exact(embeddings, deleted, questions, threshold)
+
+        return [
+            _best_per_file(rows, distances, file_chunk_ids, file_ids, max_results)
+            for rows, distances in candidates
+        ]
+
+    def _search_exact(
+        self,
+        embeddings: np.ndarray,
+        deleted: np.ndarray,
+        questions: np.ndarray,
+        threshold: float,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        rows = [[] for _ in questions]
+        distances = [[] for _ in questions]
+        for start in range(0, len(embeddings), self.block_rows):
+            end = min(start + self.block_rows, len(embeddings))
+            block_distances = 1 - embeddings[start:end] @ questions.T
+            block_distances[deleted[start:end].astype(bool)] = np.inf
+            block_rows, block_questions = np.nonzero(block_distances < threshold)
+            for question in range(len(questions)):
+                selected = block_questions == question
+                rows[question].append(block_rows[selected] + start)
+                distances[question].append(
+                    block_distances[block_rows[selected], question],
+                )
+        return [
+            (np.concatenate(question_rows), np.concatenate(question_distances))
+            for question_rows, question_distances in zip(rows, distances)
+        ]
+
+    def _search_ivf(
+        self,
+        embeddings: np.ndarray,
+        deleted: np.ndarray,
+        question: np.ndarray,
+        threshold: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        centroids = self._load_centroids()
+        assignments_size = min(
+            _file_rows(self._path("ivf_assignments.i32"), np.int32),
+            len(embeddings),
+        )
+        assignments = (
+            np.memmap(
+                self._path("ivf_assignments.i32"),
+                np.int32,
+                "r",
+                shape=assignments_size,
+            )
+            if assignments_size
+            else np.empty(0, np.int32)
+        )
+        probes = min(self.ivf_probes, len(centroids))
+        nearest_lists = np.argpartition(-(centroids @ question), probes - 1)[:probes]
+        rows = np.flatnonzero(np.isin(assignments, nearest_lists))
+        # rows appended before the centroids were trained have no list yet
+        rows = np.concatenate([rows, np.arange(len(assignments), len(embeddings))])
+        rows = rows[deleted[rows] == 0]
+        return _search_rows(embeddings, rows, question, threshold)
+
+    def train_ivf(self, n_lists: int, iterations: int = 10, sample_size: int = 100_000):
+        """
+        Trains the centroids of the ivf mode with a spherical k-means on a sample of
+        the rows, then assigns every row to its nearest centroid
+        :param n_lists: The number of centroids
+        :param iterations: The number of k-means iterations
+        :param sample_size: The maximum number of rows the centroids are trained on
+        """
+        embeddings, _, _, _ = self._snapshot()
+        if len(embeddings) == 0:
+            return
+        n_lists = min(n_lists, len(embeddings))
+        rng = np.random.default_rng(42)
+        sample_rows = rng.choice(
+            len(embeddings),
+            min(sample_size, len(embeddings)),
+            replace=False,
+        )
+        sample = np.asarray(embeddings[np.sort(sample_rows)])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = _nearest_centroids(sample, centroids)
+            for centroid in range(n_lists):
+                members = sample[assignments == centroid]
+                if len(members):
+                    centroids[centroid] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+
+        with self._write_lock():
+            size = len(self)
+            embeddings = np.memmap(
+                self._path("embeddings.f32"),
+                np.float32,
+                "r",
+                shape=(size, self.dimensions),
+            )
+            assignments = np.concatenate(
+                [
+                    _nearest_centroids(
+                        embeddings[start : start + self.block_rows],
+                        centroids,
+                    )
+                    for start in range(0, size, self.block_rows)
+                ],
+            )
+            _replace_array(self._path("ivf_assignments.i32"), assignments)
+            _replace_array(self._path("ivf_centroids.f32"), centroids)
+        logger.info(f"Trained {n_lists} ivf centroids on {len(sample)} chunks")
+
+    def reset(self) -> None:
+        """Removes all the rows and the ivf centroids of the store."""
+        with self._write_lock():
+            for name in (
+                "ids.i64",
+                "embeddings.f32",
+                "file_ids.i64",
+                "deleted.u8",
+                "ivf_assignments.i32",
+                "ivf_centroids.f32",
+            ):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+
+    def _snapshot(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # the files are mapped again when rows were appended by another process,
+        # or when the store was rebuilt
+        path = self._path("ids.i64")
+        state = (os.stat(path).st_ino, len(self)) if os.path.exists(path) else None
+        with self._lock:
+            if state != self._state:
+                self._mapped = self._map(state[1] if state else 0)
+                self._state = state
+            return self._mapped
+
+    def _map(self, size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if size == 0:
+            return (
+                np.empty((0, self.dimensions), np.float32),
+                np.empty(0, np.int64),
+                np.empty(0, np.int64),
+                np.empty(0, np.uint8),
+            )
+        return (
+            np.memmap(
+                self._path("embeddings.f32"),
+                np.float32,
+                "r",
+                shape=(size, self.dimensions),
+            ),
+            np.memmap(self._path("ids.i64"), np.int64, "r", shape=size),
+            np.memmap(self._path("file_ids.i64"), np.int64, "r", shape=size),
+            np.memmap(self._path("deleted.u8"), np.uint8, "r", shape=size),
+        )
+
+    def _load_centroids(self) -> np.ndarray | None:
+        path = self._path("ivf_centroids.f32")
+        if not os.path.exists(path):
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        if mtime != self._centroids_mtime:
+            self._centroids = np.fromfile(path, np.float32).reshape(-1, self.dimensions)
+            self._centroids_mtime = mtime
+        return self._centroids
+
+    def _truncate(self, size: int) -> None:
+        # drops the rows of an append interrupted before its ids were written
+        for name, dtype, width in (
+            ("embeddings.f32", np.float32, self.dimensions),
+            ("file_ids.i64", np.int64, 1),
+            ("deleted.u8", np.uint8, 1),
+            ("ivf_assignments.i32", np.int32, 1),
+        ):
+            path = self._path(name)
+            if os.path.exists(path):
+                expected_size = size * width * np.dtype(dtype).itemsize
+                if os.path.getsize(path) > expected_size:
+                    os.truncate(path, expected_size)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        # the writers can be the threads of several ingestion worker processes
+        with self._lock, open(self._path(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+def _search_rows(
+    embeddings: np.ndarray,
+    rows: np.ndarray,
+    question: np.ndarray,
+    threshold: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    distances = 1 - embeddings[rows] @ question
+    selected = distances < threshold
+    return rows[selected], distances[selected]
+
+
+def _nearest_centroids(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.argmax(embeddings @ centroids.T, axis=1).astype(np.int32)
+
+
+def _best_per_file(
+    rows: np.ndarray,
+    distances: np.ndarray,
+    file_chunk_ids: np.ndarray,
+    file_ids: np.ndarray,
+    max_results: int,
+) -> list[VectorSearchResult]:
+    order = np.argsort(distances, kind="stable")
+    rows, distances = rows[order], distances[order]
+    # the first row of each file is its nearest chunk
+    _, first_rows = np.unique(file_ids[rows], return_index=True)
+    first_rows = np.sort(first_rows)[:max_results]
+    return [
+        VectorSearchResult(
+            file_chunk_id=int(file_chunk_ids[rows[i]]),
+            file_id=int(file_ids[rows[i]]),
+            distance=float(distances[i]),
+        )
+        for i in first_rows
+    ]
+
+
+def _file_rows(path: str, dtype: type) -> int:
+    if not os.path.exists(path):
+        return 0
+    return os.path.getsize(path) // np.dtype(dtype).itemsize
+
+
+def _append_array(path: str, array: np.ndarray) -> None:
+    with open(path, "ab") as file:
+        file.write(np.ascontiguousarray(array).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _replace_array(path: str, array: np.ndarray) -> None:
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(np.ascontiguousarray(array).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+@functools.lru_cache
+def get_vector_store() -> VectorStore:
+    """
+    Gets the vector store of the settings, opened on first use and shared by all
+    the requests of a worker.
+    """
+    return VectorStore(
+        settings.vector_store_directory,
+        mode=settings.vector_store_mode,
+        ivf_probes=settings.ivf_probes,
+        exact_scan_max_rows=settings.search_exact_scan_max_chunks,
+    )
@@ -0,0 +1,174 @@
+import os
+import time
+from typing import Awaitable, Callable, Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.requests import Request
+from starlette.responses import Response
+
+# the API answers in milliseconds to seconds, the embedding API and the inserts of
+# large files can take tens of seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+PARSE_SECONDS = Histogram(
+    "semantic_search_parse_seconds",
+    "Time to extract the text of a file",
+    ["extension"],
+    buckets=LATENCY_BUCKETS,
+)
+CHUNK_SECONDS = Histogram(
+    "semantic_search_chunk_seconds",
+    "Time to split a text into chunks",
+    buckets=LATENCY_BUCKETS,
+)
+EMBEDDING_REQUEST_SECONDS = Histogram(
+    "semantic_search_embedding_request_seconds",
+    "Latency of a call to the embedding provider",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "semantic_search_embedding_batch_size",
+    "Number of texts of a call to the embedding provider",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048),
+)
+DB_INSERT_SECONDS = Histogram(
+    "semantic_search_db_insert_seconds",
+    "Time to insert the chunks of a file, or of a group of files with COPY",
+    ["method"],
+    buckets=LATENCY_BUCKETS,
+)
+SEARCH_QUERY_SECONDS = Histogram(
+    "semantic_search_search_query_seconds",
+    "Time of the ranking queries of a search, without the question embedding",
+    ["mode", "backend"],
+    buckets=LATENCY_BUCKETS,
+)
+TOKENS_EMBEDDED = Counter(
+    "semantic_search_tokens_embedded",
+    "Tokens of the file chunks sent to the embedding provider",
+)
+CHUNKS_STORED = Counter(
+    "semantic_search_chunks_stored",
+    "File chunks stored with their embedding",
+)
+SEARCH_CACHE_REQUESTS = Counter(
+    "semantic_search_search_cache_requests",
+    "Searches served from the result cache (hit) or run (miss, bypass)",
+    ["result"],
+)
+INGESTION_QUEUE_DEPTH = Gauge(
+    "semantic_search_ingestion_queue_depth",
+    "Ingestion jobs pending or running, read from the database at each scrape",
+    multiprocess_mode="mostrecent",
+)
+REQUEST_SECONDS = Histogram(
+    "semantic_search_request_seconds",
+    "Latency of the API requests",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class DatabasePoolCollector(Collector):
+    """Reads the connection counters of the SQLAlchemy pools at each scrape."""
+
+    def __init__(self):
+        self.engines: dict[str, Engine] = {}
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        checked_out = GaugeMetricFamily(
+            "semantic_search_db_pool_checked_out",
+            "Connections of the pool in use",
+            labels=["engine"],
+        )
+        overflow = GaugeMetricFamily(
+            "semantic_search_db_pool_overflow",
+            "Connections opened beyond the pool size, negative while the pool is not full",
+            labels=["engine"],
+        )
+        for name, engine in self.engines.items():
+            if not isinstance(engine.pool, QueuePool):
+                continue
+            checked_out.add_metric([name], engine.pool.checkedout())
+            overflow.add_metric([name], engine.pool.overflow())
+        yield checked_out
+        yield overflow
+
+
+database_pool_collector = DatabasePoolCollector()
+REGISTRY.register(database_pool_collector)
+
+
+def register_engine_pool(name: str, engine: Engine) -> None:
+    """
+    Exposes the pool counters of an engine
+    :param name: The engine label, sync or async
+    :param engine: The engine, the sync_engine of an async engine
+    """
+    database_pool_collector.engines[name] = engine
+
+
+def render_metrics() -> Response:
+    """
+    Renders the metrics in the Prometheus text format. With several API processes,
+    PROMETHEUS_MULTIPROC_DIR must be set to a directory shared by them and emptied
+    at start, the metrics of all the processes are then aggregated.
+    """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # the pools are read in the scraped process only
+        registry.register(database_pool_collector)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+async def observe_request_latency(
+    request: Request,
+    call_next: Callable[[Request], Awaitable[Response]],
+) -> Response:
+    """Middleware observing the latency of the requests by route template."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(
+            request.method,
+            # the template keeps the label values bounded, unlike the raw paths
+            route.path if route is not None else "unmatched",
+            status,
+        ).observe(time.perf_counter() - start)
@@ -0,0 +1,139 @@
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session
+
+from api.infra.db.model.file import FileChunk
+from api.infra.db.quantization import INDEXES, create_index_statement
+from api.infra.db.repository.file import _candidates_query, _ef_search_query
+from api.settings import EmbeddingStorage, settings
+
+
+@dataclass
+class QuantizationReportRow:
+    """Search quality and cost of a storage precision."""
+
+    storage: EmbeddingStorage
+    recall: float
+    p50_latency_ms: float
+    p95_latency_ms: float
+    index_size_bytes: int
+
+
+def recall_at_k(found_ids: list[int], expected_ids: list[int]) -> float:
+    """
+    Computes the share of the exact nearest chunks found by a search
+    :param found_ids: The chunk ids returned by the search
+    :param expected_ids: The chunk ids of the exact nearest chunks
+    :return: The recall, between 0 and 1
+    """
+    if not expected_ids:
+        return 1.0
+    return len(set(found_ids) & set(expected_ids)) / len(expected_ids)
+
+
+def run_quantization_report(
+    sample_size: int = 100,
+    k: int = 10,
+) -> list[QuantizationReportRow]:
+    """
+    Compares the recall and the latency of the nearest chunks searches of every storage
+    precision against an exact float32 scan, on the chunks of the database. The
+    questions are embeddings of chunks sampled from the corpus, the missing indexes
+    are built first, which can take a while on a large corpus.
+    :param sample_size: The number of questions
+    :param k: The number of nearest chunks of a search
+    :return: The report rows, one per storage precision
+    """
+    engine = create_engine(str(settings.db_url))
+    with Session(engine) as session:
+        questions = [
+            np.asarray(embedding).tolist()
+            for embedding in session.execute(
+                select(FileChunk.embedding_vector)
+                .order_by(func.random())
+                .limit(sample_size),
+            ).scalars()
+        ]
+        expected_ids = _exact_nearest_chunk_ids(session, questions, k)
+        rows = [
+            _measure_storage(session, storage, questions, expected_ids, k)
+            for storage in EmbeddingStorage
+        ]
+    engine.dispose()
+    return rows
+
+
+def _exact_nearest_chunk_ids(
+    session: Session,
+    questions: list[list[float]],
+    k: int,
+) -> list[list[int]]:
+    # without index scans the nearest chunks are found by a sequential scan
+    session.execute(text("SET LOCAL enable_indexscan = off"))
+    expected_ids = [
+        list(
+            session.execute(
+                _candidates_query(question, k, EmbeddingStorage.FULL),
+            ).scalars(),
+        )
+        for question in questions
+    ]
+    session.commit()
+    return expected_ids
+
+
+def _measure_storage(
+    session: Session,
+    storage: EmbeddingStorage,
+    questions: list[list[float]],
+    expected_ids: list[list[int]],
+    k: int,
+) -> QuantizationReportRow:
+    logger.info(f"Building the {storage.value} index if it is missing")
+    session.execute(text(create_index_statement(storage)))
+    session.commit()
+
+    recalls, latencies = [], []
+    for question, question_expected_ids in zip(questions, expected_ids):
+        session.execute(_ef_search_query(k, storage))
+        start = time.perf_counter()
+        found_ids = list(
+            session.execute(_candidates_query(question, k, storage)).scalars(),
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall_at_k(found_ids, question_expected_ids))
+        session.commit()
+
+    index_name, _ = INDEXES[storage]
+    index_size = session.execute(
+        select(func.pg_relation_size(index_name)),
+    ).scalar_one()
+    return QuantizationReportRow(
+        storage=storage,
+        recall=float(np.mean(recalls)) if recalls else 0.0,
+        p50_latency_ms=float(np.percentile(latencies, 50)) if latencies else 0.0,
+        p95_latency_ms=float(np.percentile(latencies, 95)) if latencies else 0.0,
+        index_size_bytes=index_size,
+    )
+
+
+def format_quantization_report(rows: list[QuantizationReportRow], k: int) -> str:
+    """
+    Formats the report rows as a text table
+    :param rows: The report rows
+    :param k: The number of nearest chunks of a search
+    :return: The table
+    """
+    lines = [
+        f"{'storage':<8} {f'recall@{k}':>10} {'p50 ms':>8} {'p95 ms':>8} {'index MiB':>10}",
+    ]
+    for row in rows:
+        lines.append(
+            f"{row.storage.value:<8} {row.recall:>10.3f} {row.p50_latency_ms:>8.2f} "
+            f"{row.p95_latency_ms:>8.2f} {row.index_size_bytes / 2**20:>10.1f}",
+        )
+    return "\n".join(lines)
@@ -15,6 +15,35 @@ class LogLevel(str, enum.Enum):  # noqa: WPS600
     FATAL = "FATAL"
 
 
+class EmbeddingProviderName(str, enum.Enum):  # noqa: WPS600
+    """Possible embedding providers."""
+
+    OPENAI = "openai"
+    LOCAL = "local"
+
+
+class EmbeddingStorage(str, enum.Enum):  # noqa: WPS600
+    """Possible precisions of the chunk embeddings in the vector index."""
+
+    FULL = "full"
+    HALF = "half"
+    BINARY = "binary"
+
+
+class SearchBackendName(str, enum.Enum):  # noqa: WPS600
+    """Possible backends of the similarity searches."""
+
+    PGVECTOR = "pgvector"
+    VECTOR_STORE = "vector_store"
+
+
+class VectorStoreMode(str, enum.Enum):  # noqa: WPS600
+    """Possible scans of the vector store."""
+
+    EXACT = "exact"
+    IVF = "ivf"
+
+
 class Settings(BaseSettings):
     """
     Application settings.
@@ -42,10 +71,151 @@ class Settings(BaseSettings):
     db_pass: str = "postgres"
     db_base: str = "semantic_search"
     db_echo: bool = False
+    # Serve the listing and search endpoints with async handlers, an AsyncSession
+    # on asyncpg and an async embedding client instead of the threadpool
+    db_async: bool = False
+    # Create the tables and indexes when an API worker starts, instead of running
+    # `python -m api migrate` once before starting the workers
+    db_migrate_on_startup: bool = False
 
     # openai api key
     OPENAI_API_KEY: str = ""
 
+    # provider computing the embeddings of the file chunks and the questions
+    embedding_provider: EmbeddingProviderName = EmbeddingProviderName.OPENAI
+    # model used by the openai embedding provider
+    embedding_model: str = "text-embedding-ada-002"
+
+    # Number of tokens of a file chunk
+    chunk_size_tokens: int = 512
+    # Number of tokens shared by consecutive chunks of a file
+    chunk_overlap_tokens: int = 0
+
+    # Number of chunks sent in a single embeddings API request
+    embedding_batch_size: int = 64
+    # Maximum number of embedding batches in flight for one file
+    embedding_max_concurrency: int = 4
+
+    # Maximum cosine distance of a chunk to be returned by a search
+    search_similarity_threshold: float = 0.25
+    # Number of nearest chunks fetched from the vector index per requested file
+    search_candidates_oversampling: int = 4
+    # Upper bound of nearest chunks fetched from the vector index for a search
+    search_max_candidates: int = 1000
+    # Size of the dynamic candidate list of the HNSW index scan,
+    # raised to the number of candidates when it is lower (pgvector allows up to 1000)
+    hnsw_ef_search: int = 100
+    # Precision of the chunk embeddings in the HNSW index, the half and binary indexes
+    # are scanned for candidates which are then reranked with the float32 embeddings
+    embedding_storage: EmbeddingStorage = EmbeddingStorage.FULL
+    # Number of candidates scanned in a half or binary index per reranked candidate
+    search_rerank_oversampling: int = 4
+    # Filtered searches compare the question to all the chunks of the matching files,
+    # without the vector index, when there are at most this number of them
+    search_exact_scan_max_chunks: int = 20000
+    # Factor of the nearest chunks fetched from the vector index by the other filtered
+    # searches, the chunks of the files not matching the filters are discarded
+    search_filter_oversampling: int = 4
+    # Scan the HNSW index until enough chunks match the filters of a search instead of
+    # stopping at ef_search chunks, needs pgvector 0.8 or later
+    hnsw_iterative_scan: bool = False
+    # Constant of the reciprocal rank fusion of the hybrid searches
+    search_rrf_k: int = 60
+
+    # Backend of the similarity searches: pgvector in the database, or the in-process
+    # memory-mapped vector store fed by the ingestion workers
+    search_backend: SearchBackendName = SearchBackendName.PGVECTOR
+    # Directory of the vector store files, shared by the API and the ingestion workers
+    vector_store_directory: str = "vector_store"
+    # Scan of all the chunk embeddings, or of the ones of the nearest ivf lists
+    vector_store_mode: VectorStoreMode = VectorStoreMode.EXACT
+    # Number of lists of the ivf mode, trained by `python -m api build-vector-store`
+    ivf_lists: int = 1024
+    # Number of nearest lists scanned by a search in the ivf mode
+    ivf_probes: int = 16
+
+    # Directory where the uploaded files are stored
+    files_directory: str = "files"
+    # Maximum size in bytes of an uploaded file
+    max_upload_size: int = 100 * 1024 * 1024
+    # Size in bytes of the blocks in which the uploads are written to disk
+    upload_block_size: int = 1024 * 1024
+
+    # Number of characters of the parts in which the texts are read and split into
+    # chunks, the ingestion of a file holds about one part of its text in memory
+    text_block_size: int = 1024 * 1024
+    # gzip level of the texts extracted from the PDFs, stored next to their files
+    text_compress_level: int = 6
+    # Number of chunks of a file embedded and inserted together by an ingestion worker
+    ingestion_chunk_group_size: int = 1024
+
+    # Number of processes extracting the pages of a large PDF
+    pdf_workers: int = 4
+    # Minimum number of pages of a PDF to extract its pages in parallel
+    pdf_parallel_min_pages: int = 32
+    # Number of consecutive pages extracted by a PDF extraction process at a time
+    pdf_pages_per_task: int = 8
+
+    # Number of processes parsing and chunking the files of a bulk ingestion
+    bulk_parse_workers: int = 4
+    # Maximum number of files waiting between two stages of a bulk ingestion
+    bulk_queue_size: int = 64
+    # Maximum number of files inserted in a single transaction by a bulk ingestion
+    bulk_insert_batch_files: int = 100
+    # Files larger than this size in bytes are left to the ingestion workers by a bulk
+    # ingestion, whose stages hold the chunks of whole files
+    bulk_max_file_size: int = 64 * 1024 * 1024
+    # Seconds between two progress logs of a bulk ingestion
+    bulk_progress_interval: float = 10.0
+    # Maximum total size in bytes of the files of an uploaded archive, once extracted
+    bulk_max_archive_size: int = 1024 * 1024 * 1024
+    # Maximum number of members of an uploaded archive
+    bulk_max_archive_members: int = 10000
+    # Maximum number of bulk ingestion requests run at the same time by an API
+    # process, each one runs its pipeline and its pool of parse processes
+    bulk_max_concurrent_requests: int = 1
+
+    # Number of threads of an ingestion worker process (python -m api worker)
+    ingestion_workers: int = 2
+    # Port of the Prometheus metrics of an ingestion worker process, 0 to disable them
+    worker_metrics_port: int = 0
+    # Seconds an idle ingestion worker waits before polling the queue again
+    ingestion_poll_interval: float = 1.0
+    # Maximum number of attempts of an ingestion job before it is marked as failed
+    ingestion_max_attempts: int = 5
+    # Delay in seconds before the first retry of a job, doubled at each attempt
+    ingestion_retry_backoff: int = 10
+    # Seconds after which a running job is considered abandoned and claimed again
+    ingestion_lock_timeout: int = 900
+    # Uploads are rejected while this number of jobs are waiting or running
+    ingestion_max_queue_depth: int = 1000
+
+    # Cache of the question embeddings, in process and shared in the database
+    embedding_cache_enabled: bool = True
+    # Maximum number of question embeddings kept in memory by each worker
+    embedding_cache_size: int = 1024
+    # Time to live in seconds of the question embeddings kept in memory
+    embedding_cache_ttl: int = 3600
+    # Time to live in seconds of the question embeddings shared in the database
+    embedding_cache_shared_ttl: int = 7 * 24 * 3600
+
+    # Cache of the search result pages in process, invalidated by the ingestions
+    search_cache_enabled: bool = True
+    # Maximum number of result pages kept in memory by each worker
+    search_cache_size: int = 1024
+    # Time to live in seconds of the result pages kept in memory, the pages of an
+    # unchanged corpus are valid forever, it only bounds the memory of idle workers
+    search_cache_ttl: int = 24 * 3600
+
+    # Number of files ranked by the first page of a search session, the next pages
+    # are read from its ranking without running the search again
+    search_session_max_files: int = 1000
+    # Time to live in seconds of a search session, counted from its first page
+    search_session_ttl: int = 600
+    # Maximum total size in bytes of the search sessions kept by each worker, a
+    # session takes 24 bytes per ranked file
+    search_session_max_bytes: int = 64 * 1024 * 1024
+
     @property
     def db_url(self) -> URL:
         """
@@ -62,6 +232,15 @@ class Settings(BaseSettings):
             path=f"/{self.db_base}",
         )
 
+    @property
+    def db_async_url(self) -> URL:
+        """
+        Assemble asyncpg database URL from settings.
+
+        :return: asyncpg database URL.
+        """
+        return self.db_url.with_scheme("postgresql+asyncpg")
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
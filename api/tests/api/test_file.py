@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from api.infra.db.model.file import File
+
+
+def test_get_files_pagination(client: TestClient):
+    engine = client.app.state.db_engine
+    File.__table__.create(engine, checkfirst=True)
+    with Session(engine) as session:
+        session.add_all(
+            [
+                File(
+                    name=f"file_{i}.txt",
+                    path=f"files/file_{i}.txt",
+                    size=i,
+                    content="a" * 300,
+                )
+                for i in range(5)
+            ],
+        )
+        session.commit()
+
+    response = client.get("/api/files/", params={"page": 2, "size": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 5
+    assert body["pages"] == 3
+    assert [item["name"] for item in body["items"]] == ["file_2.txt", "file_3.txt"]
+    assert all(len(item["resume_content"]) == 200 for item in body["items"])
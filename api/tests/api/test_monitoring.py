@@ -4,3 +4,17 @@ from fastapi.testclient import TestClient
 def test_monitoring_health_check(client: TestClient):
     response = client.get("/api/health")
     assert response.status_code == 200
+
+
+def test_metrics(client: TestClient):
+    client.get("/api/health")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "semantic_search_embedding_request_seconds" in response.text
+    assert "semantic_search_db_pool_checked_out" in response.text
+    assert (
+        'semantic_search_request_seconds_count{method="GET",route="/api/health",'
+        'status="200"}' in response.text
+    )
@@ -7,7 +7,8 @@ from sqlalchemy import create_engine, StaticPool
 from sqlalchemy.orm import sessionmaker
 from starlette.testclient import TestClient
 
-from api.web.api import api_router
+from api.metrics import observe_request_latency
+from api.web.api import api_router, monitoring
 
 
 def get_test_app() -> FastAPI:
@@ -28,6 +29,8 @@ def get_test_app() -> FastAPI:
 
     # noqa: F821
     app.include_router(router=api_router, prefix="/api")
+    app.include_router(router=monitoring.metrics_router)
+    app.middleware("http")(observe_request_latency)
 
     # set fake environment variable OPENAI_API_KEY to run tests
 
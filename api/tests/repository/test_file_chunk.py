@@ -0,0 +1,396 @@
+import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi_pagination import Params
+
+from sqlalchemy.dialects import postgresql
+
+from api.infra.db.model.file import FileChunk
+from api.infra.db.repository.file import (
+    FileChunkRepository,
+    SearchFilter,
+    SimilarFileChunk,
+    _best_chunk_per_file_query,
+    _best_chunk_per_question_and_file_query,
+    _best_lexical_chunk_per_file_query,
+    _candidates_query,
+    _ef_search_query,
+    _exact_best_chunk_per_file_query,
+)
+from api.web.schema.search_file_result import SearchFileResult
+from api.settings import EmbeddingStorage, settings
+
+
+@pytest.fixture
+def file_chunk_repository():
+    return FileChunkRepository(FileChunk, MagicMock())
+
+
+def make_rows(count: int, candidates_count: int, max_distance: float):
+    return [
+        MagicMock(
+            file_id=i,
+            file_name=f"file_{i}.txt",
+            file_chunk_id=i,
+            chunk_text="text",
+            distance=0.1,
+            candidates_count=candidates_count,
+            max_distance=max_distance,
+        )
+        for i in range(count)
+    ]
+
+
+def test_find_similar_file_chunks_oversamples_candidates(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_candidates_oversampling", 4)
+    file_chunk_repository._find_best_chunk_per_file = MagicMock(
+        return_value=make_rows(10, candidates_count=40, max_distance=0.1),
+    )
+
+    page = file_chunk_repository.find_similar_file_chunks(
+        [0.1, 0.2],
+        Params(page=1, size=10),
+    )
+
+    file_chunk_repository._find_best_chunk_per_file.assert_called_once_with(
+        [0.1, 0.2],
+        40,
+        None,
+    )
+    assert len(page.items) == 10
+
+
+def test_find_similar_file_chunks_widens_candidates_until_page_is_full(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_candidates_oversampling", 4)
+    monkeypatch.setattr(settings, "search_similarity_threshold", 0.25)
+    file_chunk_repository._find_best_chunk_per_file = MagicMock(
+        side_effect=[
+            make_rows(3, candidates_count=40, max_distance=0.1),
+            make_rows(10, candidates_count=80, max_distance=0.2),
+        ],
+    )
+
+    page = file_chunk_repository.find_similar_file_chunks(
+        [0.1, 0.2],
+        Params(page=1, size=10),
+    )
+
+    assert [
+        call.args[1]
+        for call in file_chunk_repository._find_best_chunk_per_file.call_args_list
+    ] == [40, 80]
+    assert len(page.items) == 10
+
+
+def test_find_similar_file_chunks_stops_beyond_threshold(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_similarity_threshold", 0.25)
+    file_chunk_repository._find_best_chunk_per_file = MagicMock(
+        return_value=make_rows(3, candidates_count=40, max_distance=0.5),
+    )
+    file_chunk_repository.session.execute.return_value.scalar_one.return_value = 3
+
+    page = file_chunk_repository.find_similar_file_chunks(
+        [0.1, 0.2],
+        Params(page=1, size=10),
+    )
+
+    file_chunk_repository._find_best_chunk_per_file.assert_called_once()
+    assert page.total == 3
+
+
+def test_find_similar_file_chunks_counts_the_files_beyond_the_page(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_similarity_threshold", 0.25)
+    file_chunk_repository._find_best_chunk_per_file = MagicMock(
+        return_value=make_rows(4, candidates_count=40, max_distance=0.1),
+    )
+    # the files under the threshold, beyond the candidates of the first pages
+    file_chunk_repository.session.execute.return_value.scalar_one.return_value = 25
+
+    page = file_chunk_repository.find_similar_file_chunks(
+        [0.1, 0.2],
+        Params(page=2, size=2),
+    )
+
+    assert [file_chunk.file_id for file_chunk in page.items] == [2, 3]
+    assert page.total == 25
+    count_query = file_chunk_repository.session.execute.call_args[0][0]
+    sql = str(count_query.compile(dialect=postgresql.dialect()))
+    assert "count(DISTINCT file_chunk.file_id)" in sql
+
+
+def test_best_chunk_per_file_query_projects_result_columns_only():
+    query = _best_chunk_per_file_query([0.1, 0.2], 40)
+
+    assert [column.name for column in query.selected_columns] == [
+        "file_id",
+        "file_name",
+        "file_chunk_id",
+        "chunk_text",
+        "distance",
+        "candidates_count",
+        "max_distance",
+    ]
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    select_clause = sql[: sql.index("FROM")]
+    assert "embedding_vector" not in select_clause
+    assert "JOIN file ON" in sql
+
+
+def test_rank_similar_file_chunks_batch_widens_pending_questions_only(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_candidates_oversampling", 4)
+    monkeypatch.setattr(settings, "search_similarity_threshold", 0.25)
+
+    def rows_of_question(question: int, rows: list[MagicMock]) -> list[MagicMock]:
+        for row in rows:
+            row.question = question
+        return rows
+
+    file_chunk_repository._find_best_chunk_per_question_and_file = MagicMock(
+        side_effect=[
+            rows_of_question(0, make_rows(10, candidates_count=40, max_distance=0.1))
+            + rows_of_question(1, make_rows(3, candidates_count=40, max_distance=0.1)),
+            rows_of_question(0, make_rows(10, candidates_count=80, max_distance=0.2)),
+        ],
+    )
+
+    rankings = file_chunk_repository.rank_similar_file_chunks_batch(
+        [[0.1, 0.2], [0.3, 0.4]],
+        10,
+    )
+
+    assert [
+        call.args
+        for call in (
+            file_chunk_repository._find_best_chunk_per_question_and_file.call_args_list
+        )
+    ] == [([[0.1, 0.2], [0.3, 0.4]], 40, None), ([[0.3, 0.4]], 80, None)]
+    assert [len(ranking) for ranking in rankings] == [10, 10]
+
+
+def test_best_chunk_per_question_and_file_query_scans_each_question():
+    query = _best_chunk_per_question_and_file_query([[0.1, 0.2], [0.3, 0.4]], 40)
+    sql = str(query.compile(dialect=postgresql.dialect()))
+
+    assert [column.name for column in query.selected_columns][:2] == [
+        "question",
+        "file_id",
+    ]
+    assert "AS questions (question, embedding) JOIN LATERAL" in sql
+    assert "ORDER BY file_chunk.embedding_vector <=> questions.embedding" in sql
+    assert "PARTITION BY anon_2.question, anon_2.file_id" in sql
+
+
+def test_search_file_result_from_similar_file_chunk():
+    result = SearchFileResult.model_validate(
+        SimilarFileChunk(
+            file_id=1,
+            file_name="file.txt",
+            file_chunk_id=2,
+            chunk_text="text",
+            distance=0.2,
+        ),
+    )
+
+    assert result.model_dump(by_alias=True) == {
+        "file_id": 1,
+        "file_name": "file.txt",
+        "similarity": 0.8,
+        "score": None,
+        "file_chunk_id": 2,
+        "file_chunk_text": "text",
+    }
+
+
+def test_candidates_query_full_storage_scans_float32_index():
+    sql = str(
+        _candidates_query([0.1, 0.2], 40, EmbeddingStorage.FULL).compile(
+            dialect=postgresql.dialect(),
+        ),
+    )
+
+    assert "halfvec" not in sql
+    assert "binary_quantize" not in sql
+
+
+@pytest.mark.parametrize(
+    ("storage", "index_expression"),
+    [
+        (
+            EmbeddingStorage.HALF,
+            "CAST(file_chunk.embedding_vector AS halfvec(1536)) <=>",
+        ),
+        (
+            EmbeddingStorage.BINARY,
+            "CAST(binary_quantize(file_chunk.embedding_vector) AS bit(1536)) <~>",
+        ),
+    ],
+)
+def test_candidates_query_quantized_storage_reranks_candidates(
+    storage: EmbeddingStorage,
+    index_expression: str,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_rerank_oversampling", 4)
+    query = _candidates_query([0.1, 0.2], 40, storage)
+    compiled = query.compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+
+    # the quantized index is scanned for 4 times more candidates
+    prefilter = sql[sql.index("JOIN (") :]
+    assert index_expression in prefilter
+    assert 160 in compiled.params.values()
+    # which are reranked by exact cosine distance
+    assert sql.endswith(
+        "ORDER BY file_chunk.embedding_vector <=> %(embedding_vector_1)s \n LIMIT %(param_3)s",
+    )
+
+
+def test_ef_search_query_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "search_rerank_oversampling", 4)
+    query = _ef_search_query(400, EmbeddingStorage.BINARY)
+
+    assert "1000" in query.compile().params.values()
+
+
+def test_best_lexical_chunk_per_file_query_uses_full_text_index():
+    sql = str(
+        _best_lexical_chunk_per_file_query("invoice 42", 40).compile(
+            dialect=postgresql.dialect(),
+        ),
+    )
+
+    assert "file_chunk.chunk_tsv @@ websearch_to_tsquery(" in sql
+    assert "embedding_vector" not in sql
+
+
+def test_search_filter_file_conditions():
+    search_filter = SearchFilter(
+        file_ids=(1, 2),
+        extension=".PDF",
+        created_after=datetime.datetime(2024, 1, 1),
+        max_size=1000,
+    )
+
+    sql = " AND ".join(
+        str(condition.compile(dialect=postgresql.dialect()))
+        for condition in search_filter.file_conditions()
+    )
+
+    assert "file.id IN (__[POSTCOMPILE_id_1])" in sql
+    assert "lower(SUBSTRING(file.name FROM '\\.([^.]+)$')) = %(lower_1)s" in sql
+    assert "file.created_at >= %(created_at_1)s" in sql
+    assert "file.size <= %(size_1)s" in sql
+    assert SearchFilter(extension=".PDF").file_conditions()[0].right.value == "pdf"
+
+
+def test_filtered_search_scans_few_chunks_exactly(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_exact_scan_max_chunks", 100)
+    file_chunk_repository.session.execute.return_value.scalar_one.return_value = 50
+    file_chunk_repository._find_best_chunk_per_file = MagicMock()
+
+    file_chunk_repository.rank_similar_file_chunks(
+        [0.1, 0.2],
+        10,
+        SearchFilter(extension="pdf"),
+    )
+
+    file_chunk_repository._find_best_chunk_per_file.assert_not_called()
+
+
+def test_filtered_search_widens_candidates_discarded_by_the_filter(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_exact_scan_max_chunks", 100)
+    monkeypatch.setattr(settings, "search_candidates_oversampling", 4)
+    monkeypatch.setattr(settings, "search_filter_oversampling", 2)
+    monkeypatch.setattr(settings, "search_similarity_threshold", 0.25)
+    monkeypatch.setattr(settings, "hnsw_iterative_scan", False)
+    file_chunk_repository.session.execute.return_value.scalar_one.return_value = 101
+    search_filter = SearchFilter(extension="pdf")
+    file_chunk_repository._find_best_chunk_per_file = MagicMock(
+        side_effect=[
+            # the candidates of the other files were discarded after the index scan
+            make_rows(3, candidates_count=10, max_distance=0.1),
+            make_rows(10, candidates_count=40, max_distance=0.2),
+        ],
+    )
+
+    ranking = file_chunk_repository.rank_similar_file_chunks(
+        [0.1, 0.2],
+        10,
+        search_filter,
+    )
+
+    assert [
+        call.args
+        for call in file_chunk_repository._find_best_chunk_per_file.call_args_list
+    ] == [([0.1, 0.2], 80, search_filter), ([0.1, 0.2], 160, search_filter)]
+    assert len(ranking) == 10
+
+
+def test_exact_best_chunk_per_file_query_skips_the_vector_index():
+    sql = str(
+        _exact_best_chunk_per_file_query(
+            [0.1, 0.2],
+            SearchFilter(file_ids=(1,)),
+        ).compile(dialect=postgresql.dialect()),
+    )
+
+    candidates = sql[sql.index("FROM (SELECT file_chunk.id") :]
+    assert "WHERE file_chunk.file_id IN (SELECT file.id" in candidates
+    assert "LIMIT" not in sql
+
+
+def test_collection_search_skips_the_filtered_scans(
+    file_chunk_repository: FileChunkRepository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_candidates_oversampling", 4)
+    search_filter = SearchFilter(collection="legal")
+    file_chunk_repository._find_best_chunk_per_file = MagicMock(
+        return_value=make_rows(10, candidates_count=40, max_distance=0.1),
+    )
+
+    file_chunk_repository.rank_similar_file_chunks([0.1, 0.2], 10, search_filter)
+
+    # the partition of the collection is scanned like a whole table
+    assert not search_filter.selects_files
+    file_chunk_repository._find_best_chunk_per_file.assert_called_once_with(
+        [0.1, 0.2],
+        40,
+        search_filter,
+    )
+
+
+def test_candidates_query_scans_the_partition_of_the_collection():
+    query = _best_chunk_per_file_query(
+        [0.1, 0.2],
+        40,
+        SearchFilter(collection="legal", extension="pdf"),
+    )
+    sql = str(query.compile(dialect=postgresql.dialect()))
+
+    candidates = sql[sql.index("FROM (SELECT file_chunk.id") :]
+    assert "WHERE file_chunk.collection = %(collection_1)s" in candidates
+    assert "AND file_chunk.file_id IN (SELECT file.id" in candidates
+    assert "file_chunk.collection = anon_1.collection" in sql
@@ -0,0 +1,296 @@
+import io
+import os
+import tarfile
+import zipfile
+from concurrent.futures import Future
+from queue import Queue
+from unittest.mock import MagicMock
+
+import pytest
+from prometheus_client import REGISTRY
+
+from api.infra.db.model.ingestion_job import IngestionStatus
+from api.settings import SearchBackendName, settings
+from api.web.service.bulk_ingestion import (
+    _END,
+    BulkIngestionPipeline,
+    EmbeddedFile,
+    ParsedFile,
+    extract_archive,
+    find_ingestible_files,
+)
+from api.web.service.chunker import TextChunk
+from api.web.service.file import FileTooLargeError
+
+
+def parsed_file(name: str, content_hash: str, chunks: int) -> ParsedFile:
+    return ParsedFile(
+        name=name,
+        path=f"files/{content_hash}.txt",
+        size=10,
+        content_hash=content_hash,
+        content="text",
+        chunks=[TextChunk(f"{name} {i}", 2) for i in range(chunks)],
+    )
+
+
+@pytest.fixture
+def repositories(monkeypatch):
+    repositories = {}
+    for name in ("FileRepository", "FileChunkRepository", "IngestionJobRepository"):
+        repositories[name] = MagicMock()
+        monkeypatch.setattr(
+            f"api.web.service.bulk_ingestion.{name}",
+            MagicMock(return_value=repositories[name]),
+        )
+    repositories["FileRepository"].get_ingested_by_content_hash.return_value = None
+    return repositories
+
+
+def make_session() -> MagicMock:
+    session = MagicMock()
+    added_files = []
+    session.add_all.side_effect = added_files.extend
+
+    def flush():
+        for file_id, file in enumerate(added_files, start=1):
+            file.id = file_id
+
+    session.flush.side_effect = flush
+    return session
+
+
+def run_pipeline(
+    parsed_files: list[ParsedFile],
+    file_chunk_service: MagicMock,
+) -> BulkIngestionPipeline:
+    session = make_session()
+    session_factory = MagicMock()
+    session_factory.return_value.__enter__.return_value = session
+    pipeline = BulkIngestionPipeline(
+        session_factory=session_factory,
+        file_chunk_service=file_chunk_service,
+        queue_size=2,
+    )
+
+    def parse(paths, output):
+        for path in paths:
+            output.put(path)
+        output.put(_END)
+
+    pipeline._parse = parse
+    pipeline.run(parsed_files)
+    return pipeline
+
+
+def test_run_embeds_new_files_and_reuses_duplicates(repositories):
+    file_chunk_service = MagicMock()
+    file_chunk_service.embed_chunks.side_effect = lambda chunks, _: [
+        [0.1] for _ in chunks
+    ]
+
+    pipeline = run_pipeline(
+        [
+            parsed_file("a.txt", "a" * 64, 2),
+            parsed_file("b.txt", "b" * 64, 3),
+            parsed_file("a-copy.txt", "a" * 64, 2),
+        ],
+        file_chunk_service,
+    )
+
+    embedded_texts = [
+        chunk.text
+        for call in file_chunk_service.embed_chunks.call_args_list
+        for chunk in call[0][0]
+    ]
+    assert embedded_texts == ["a.txt 0", "a.txt 1", "b.txt 0", "b.txt 1", "b.txt 2"]
+    copied_chunks = [
+        chunk
+        for call in repositories["FileChunkRepository"].copy_in.call_args_list
+        for chunk in call[0][0]
+    ]
+    assert [chunk[1] for chunk in copied_chunks] == embedded_texts
+    repositories["FileChunkRepository"].copy_file_chunks.assert_called_once_with(1, 3)
+    assert pipeline.report.files == 3
+    assert pipeline.report.reused_files == 1
+    assert pipeline.report.chunks == 5
+
+
+def test_insert_group_copies_the_chunks_of_a_file_of_the_same_group(
+    repositories,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_backend", SearchBackendName.PGVECTOR)
+    # the chunks are stored by file id, like in file_chunk
+    stored_chunks: dict[int, list[str]] = {}
+    file_chunk_repository = repositories["FileChunkRepository"]
+    file_chunk_repository.copy_in.side_effect = lambda file_chunks, _: [
+        stored_chunks.setdefault(file_id, []).append(chunk_text)
+        for file_id, chunk_text, _, _ in file_chunks
+    ]
+    file_chunk_repository.copy_file_chunks.side_effect = (
+        lambda source_file_id, file_id: stored_chunks.__setitem__(
+            file_id,
+            list(stored_chunks.get(source_file_id, [])),
+        )
+    )
+    session = make_session()
+    pipeline = BulkIngestionPipeline(
+        session_factory=MagicMock(),
+        file_chunk_service=MagicMock(),
+    )
+    original = parsed_file("a.txt", "a" * 64, 2)
+
+    pipeline._insert_group(
+        session,
+        [
+            EmbeddedFile(original, embeddings=[[0.1], [0.2]]),
+            EmbeddedFile(parsed_file("a-copy.txt", "a" * 64, 2)),
+        ],
+        {},
+    )
+
+    assert stored_chunks == {1: ["a.txt 0", "a.txt 1"], 2: ["a.txt 0", "a.txt 1"]}
+    assert pipeline.report.files == 2
+    assert pipeline.report.reused_files == 1
+
+
+def test_run_enqueues_files_when_embedding_fails(repositories):
+    file_chunk_service = MagicMock()
+    file_chunk_service.embed_chunks.side_effect = RuntimeError("API down")
+
+    pipeline = run_pipeline([parsed_file("a.txt", "a" * 64, 2)], file_chunk_service)
+
+    job_statuses = [
+        call[0][1]
+        for call in repositories["IngestionJobRepository"].add_many.call_args_list
+        if call[0][0]
+    ]
+    assert job_statuses == [IngestionStatus.PENDING]
+    assert pipeline.report.files == 0
+    assert pipeline.report.queued_files == 1
+
+
+def test_run_enqueues_large_files(repositories):
+    file_chunk_service = MagicMock()
+    large_file = parsed_file("large.txt", "a" * 64, 0)
+    large_file.chunks = None
+
+    pipeline = run_pipeline([large_file], file_chunk_service)
+
+    file_chunk_service.embed_chunks.assert_not_called()
+    assert pipeline.report.queued_files == 1
+
+
+def test_run_raises_stage_errors(repositories):
+    repositories["FileChunkRepository"].copy_in.side_effect = RuntimeError("DB down")
+    file_chunk_service = MagicMock()
+    file_chunk_service.embed_chunks.side_effect = lambda chunks, _: [
+        [0.1] for _ in chunks
+    ]
+
+    with pytest.raises(RuntimeError, match="DB down"):
+        run_pipeline([parsed_file("a.txt", "a" * 64, 1)], file_chunk_service)
+
+
+def test_put_parsed_observes_the_times_of_the_parse_processes():
+    pipeline = BulkIngestionPipeline(session_factory=MagicMock())
+    parsed = parsed_file("a.txt", "a" * 64, 2)
+    parsed.parse_seconds, parsed.chunk_seconds = 0.5, 0.25
+    future: Future = Future()
+    future.set_result(parsed)
+    parse_sum = _sample("semantic_search_parse_seconds_sum", {"extension": "txt"})
+    chunk_sum = _sample("semantic_search_chunk_seconds_sum")
+
+    pipeline._put_parsed("a.txt", future, Queue())
+
+    assert _sample(
+        "semantic_search_parse_seconds_sum",
+        {"extension": "txt"},
+    ) == pytest.approx(parse_sum + 0.5)
+    assert _sample("semantic_search_chunk_seconds_sum") == pytest.approx(
+        chunk_sum + 0.25,
+    )
+
+
+def _sample(name: str, labels: dict[str, str] | None = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_extract_archive_refuses_unsafe_paths(tmp_path):
+    archive_path = tmp_path / "upload.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("../escaped.txt", "text")
+
+    with pytest.raises(ValueError, match="Unsafe path"):
+        extract_archive(str(archive_path), str(tmp_path / "out"))
+    assert not os.path.exists(tmp_path / "escaped.txt")
+
+
+def test_extract_archive_checks_tar_members_without_extraction_filters(
+    tmp_path,
+    monkeypatch,
+):
+    monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    archive_path = tmp_path / "upload.tar"
+    with tarfile.open(archive_path, "w") as archive:
+        member = tarfile.TarInfo("docs/a.txt")
+        member.size = 4
+        archive.addfile(member, io.BytesIO(b"text"))
+
+    extract_archive(str(archive_path), str(tmp_path / "out"))
+    assert (tmp_path / "out" / "docs" / "a.txt").read_text() == "text"
+
+    for member in (tarfile.TarInfo("../escaped.txt"), tarfile.TarInfo("link")):
+        if member.name == "link":
+            member.type, member.linkname = tarfile.SYMTYPE, "/etc/passwd"
+        with tarfile.open(archive_path, "w") as archive:
+            archive.addfile(member, io.BytesIO(b""))
+        with pytest.raises(ValueError, match="Unsafe"):
+            extract_archive(str(archive_path), str(tmp_path / "out"))
+    assert not os.path.exists(tmp_path / "escaped.txt")
+    assert not os.path.lexists(tmp_path / "out" / "link")
+
+
+def test_extract_archive_refuses_archives_too_large_once_extracted(
+    tmp_path,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "bulk_max_archive_size", 1000)
+    monkeypatch.setattr(settings, "bulk_max_archive_members", 3)
+    archive_path = tmp_path / "upload.tar.gz"
+    with tarfile.open(archive_path, "w:gz") as archive:
+        # compressed to a few bytes
+        content = b"a" * 1001
+        member = tarfile.TarInfo("large.txt")
+        member.size = len(content)
+        archive.addfile(member, io.BytesIO(content))
+
+    with pytest.raises(FileTooLargeError, match="once extracted"):
+        extract_archive(str(archive_path), str(tmp_path / "out"))
+    assert not os.path.exists(tmp_path / "out" / "large.txt")
+
+    archive_path = tmp_path / "upload.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        for i in range(4):
+            archive.writestr(f"{i}.txt", "text")
+
+    with pytest.raises(ValueError, match="more than 3 members"):
+        extract_archive(str(archive_path), str(tmp_path / "out"))
+
+
+def test_find_ingestible_files_in_archive(tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("docs/b.txt", "text")
+        archive.writestr("docs/a.pdf", "pdf")
+        archive.writestr("docs/image.png", "png")
+    archive_path = tmp_path / "upload.zip"
+    archive_path.write_bytes(buffer.getvalue())
+
+    extract_archive(str(archive_path), str(tmp_path / "out"))
+
+    assert [
+        os.path.relpath(path, tmp_path / "out")
+        for path in find_ingestible_files(str(tmp_path / "out"))
+    ] == ["docs/a.pdf", "docs/b.txt"]
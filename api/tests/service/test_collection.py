@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.infra.db.partition import (
+    create_partition_statement,
+    detach_partition_statement,
+)
+from api.settings import SearchBackendName, settings
+from api.web.service.collection import CollectionNotFoundError, CollectionService
+
+
+@pytest.fixture
+def collection_service():
+    return CollectionService(MagicMock(), MagicMock())
+
+
+def test_delete_collection_removes_the_unused_stored_files(
+    collection_service: CollectionService,
+    tmp_path,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_backend", SearchBackendName.PGVECTOR)
+    unused_path, shared_path = tmp_path / "a.txt", tmp_path / "b.pdf"
+    shared_text_path = tmp_path / "b.pdf.txt.gz"
+    unused_path.write_text("a")
+    shared_path.write_text("b")
+    shared_text_path.write_text("b")
+    unused_pdf_path = tmp_path / "c.pdf"
+    unused_text_path = tmp_path / "c.pdf.txt.gz"
+    unused_pdf_path.write_text("c")
+    unused_text_path.write_text("c")
+    collection_service.collection_repository.drop_collection.return_value = [
+        MagicMock(id=1, path=str(unused_path), text_path=None),
+        MagicMock(id=2, path=str(shared_path), text_path=str(shared_text_path)),
+        MagicMock(id=3, path=str(unused_pdf_path), text_path=str(unused_text_path)),
+    ]
+    # a file of another collection has the same bytes
+    collection_service.file_repository.get_used_paths.return_value = {
+        str(shared_path),
+    }
+
+    collection_service.delete_collection("legal")
+
+    assert not unused_path.exists()
+    assert not unused_pdf_path.exists()
+    assert not unused_text_path.exists()
+    assert shared_path.exists()
+    assert shared_text_path.exists()
+
+
+def test_delete_collection_refuses_unknown_and_default_collections(
+    collection_service: CollectionService,
+):
+    collection_service.collection_repository.get_by_name.return_value = None
+
+    with pytest.raises(CollectionNotFoundError):
+        collection_service.delete_collection("legal")
+    with pytest.raises(ValueError, match="default collection"):
+        collection_service.delete_collection("default")
+    collection_service.collection_repository.drop_collection.assert_not_called()
+
+
+def test_create_partition_statement_validates_the_name():
+    assert create_partition_statement("legal") == (
+        "CREATE TABLE IF NOT EXISTS file_chunk_legal "
+        "PARTITION OF file_chunk FOR VALUES IN ('legal')"
+    )
+    with pytest.raises(ValueError, match="Invalid collection name"):
+        create_partition_statement("legal'); DROP TABLE file; --")
+
+
+def test_detach_partition_statement_does_not_block_file_chunk():
+    assert detach_partition_statement("legal") == (
+        "ALTER TABLE file_chunk DETACH PARTITION file_chunk_legal CONCURRENTLY"
+    )
+    assert detach_partition_statement("legal", finalize=True) == (
+        "ALTER TABLE file_chunk DETACH PARTITION file_chunk_legal FINALIZE"
+    )
@@ -0,0 +1,83 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.web.service.embedding_cache import (
+    EmbeddingCache,
+    EmbeddingCacheStats,
+    LRUCache,
+)
+
+
+@pytest.fixture
+def embedding_cache():
+    repository = MagicMock()
+    repository.get_embedding.return_value = None
+    return EmbeddingCache(
+        repository,
+        local_cache=LRUCache(max_size=2, ttl=60),
+        stats=EmbeddingCacheStats(),
+    )
+
+
+def test_get_or_create_miss_then_local_hit(embedding_cache: EmbeddingCache):
+    create_embedding = MagicMock(return_value=[1.0, 2.0])
+
+    first = embedding_cache.get_or_create(
+        "What is  pgvector?",
+        "model",
+        create_embedding,
+    )
+    second = embedding_cache.get_or_create(
+        " What is pgvector? ",
+        "model",
+        create_embedding,
+    )
+
+    assert first == second == [1.0, 2.0]
+    create_embedding.assert_called_once_with("What is  pgvector?")
+    embedding_cache.repository.save_embedding.assert_called_once()
+    assert embedding_cache.stats.to_dict() == {
+        "local_hits": 1,
+        "shared_hits": 0,
+        "misses": 1,
+    }
+
+
+def test_get_or_create_shared_hit(embedding_cache: EmbeddingCache):
+    embedding_cache.repository.get_embedding.return_value = [3.0, 4.0]
+    create_embedding = MagicMock()
+
+    embedding = embedding_cache.get_or_create("question", "model", create_embedding)
+
+    assert embedding == [3.0, 4.0]
+    create_embedding.assert_not_called()
+    embedding_cache.repository.save_embedding.assert_not_called()
+    assert embedding_cache.stats.shared_hits == 1
+
+
+def test_make_key_depends_on_model():
+    assert EmbeddingCache.make_key("question", "model-a") != EmbeddingCache.make_key(
+        "question",
+        "model-b",
+    )
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(max_size=2, ttl=-1)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from api.settings import EmbeddingProviderName
+from api.web.service.embedding_provider import (
+    EmbeddingProviderFactory,
+    LocalEmbeddingProvider,
+    OpenAIEmbeddingProvider,
+)
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def test_local_provider_embeds_batch():
+    provider = LocalEmbeddingProvider()
+    embeddings = provider.embed_batch(
+        [
+            "Semantic search with pgvector",
+            "semantic   SEARCH with pgvector",
+            "A recipe for chocolate cake",
+            "",
+        ],
+    )
+
+    assert len(embeddings) == 4
+    assert all(len(embedding) == 1536 for embedding in embeddings)
+    assert np.linalg.norm(embeddings[0]) == pytest.approx(1)
+    # case and whitespaces are normalized
+    assert cosine_similarity(embeddings[0], embeddings[1]) == pytest.approx(1)
+    assert cosine_similarity(embeddings[0], embeddings[2]) < 0.5
+    assert not any(embeddings[3])
+
+
+def test_local_provider_is_deterministic():
+    first = LocalEmbeddingProvider().embed_batch(["deterministic embedding"])
+    second = LocalEmbeddingProvider().embed_batch(["deterministic embedding"])
+    assert first == second
+
+
+def test_factory_registers_all_settings_providers():
+    assert sorted(EmbeddingProviderFactory.provider_names()) == sorted(
+        name.value for name in EmbeddingProviderName
+    )
+    assert isinstance(
+        EmbeddingProviderFactory.get_provider("local"),
+        LocalEmbeddingProvider,
+    )
+    assert isinstance(
+        EmbeddingProviderFactory.get_provider("openai"),
+        OpenAIEmbeddingProvider,
+    )
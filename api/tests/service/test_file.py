@@ -1,16 +1,37 @@
+import hashlib
 import io
 import os
-import shutil
-from unittest.mock import MagicMock, mock_open
+from unittest.mock import MagicMock
 
 import pytest
 
-from api.web.service.file import FileService
+from api.settings import settings
+from api.infra.db.model.file import File
+from api.web.service.file import FileService, FileText, FileTooLargeError
+
+CONTENT = b"Test file content"
+CONTENT_HASH = hashlib.sha256(CONTENT).hexdigest()
+CONTENT_PATH = os.path.join(
+    "files",
+    CONTENT_HASH[:2],
+    CONTENT_HASH[2:4],
+    f"{CONTENT_HASH}.txt",
+)
+
+
+@pytest.fixture(autouse=True)
+def files_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "files_directory", "files")
+    monkeypatch.setattr(settings, "upload_block_size", 4)
+    return tmp_path
 
 
 @pytest.fixture
 def file_service():
     file_repository = MagicMock()
+    file_repository.get_by_content_hash.return_value = None
+    file_repository.create.side_effect = lambda file: file
     return FileService(file_repository=file_repository)
 
 
@@ -18,66 +39,105 @@ def file_service():
 def mock_upload_file():
     upload_file = MagicMock()
     upload_file.filename = "test.txt"
-    upload_file.file.read.return_value = b"Test file content"
+    upload_file.file = io.BytesIO(CONTENT)
     return upload_file
 
 
-def test_create_file(file_service: FileService, mock_upload_file, monkeypatch):
-    # Set the return values for the mocked functions
-    # Mock the dependencies
-    mock_exists = MagicMock(return_value=True)
-    mock_mkdir = MagicMock()
-    mock_getsize = MagicMock(return_value=123)
-    mock_shutil_copyfileobj = MagicMock()
-    mock_open_file = mock_open()
+@pytest.fixture
+def mock_file_parser(monkeypatch):
     mock_file_parser_instance = MagicMock()
-    mock_file_parser_instance.parse.return_value = "Parsed file content"
+    mock_file_parser_instance.parser.plain_text = True
+    mock_file_parser_instance.stream.return_value = iter(["Parsed file content"])
     mock_file_parser = MagicMock(return_value=mock_file_parser_instance)
-    mock_file_model_instance = MagicMock()
-
-    # Use monkeypatch to replace the actual functions with mocks
-    monkeypatch.setattr(os.path, "exists", mock_exists)
-    monkeypatch.setattr(os, "mkdir", mock_mkdir)
-    monkeypatch.setattr("builtins.open", mock_open_file)
-    monkeypatch.setattr(
-        io,
-        "BytesIO",
-        MagicMock(return_value=io.BytesIO(b"Test file content")),
-    )
-    monkeypatch.setattr(shutil, "copyfileobj", mock_shutil_copyfileobj)
-    monkeypatch.setattr(os.path, "getsize", mock_getsize)
     monkeypatch.setattr("api.web.service.file.FileParser", mock_file_parser)
-    file_service.file_repository.create = MagicMock(
-        return_value=mock_file_model_instance,
-    )
+    return mock_file_parser
 
-    # Call the function under test
-    result = file_service.create_file(mock_upload_file)
 
-    # Assertions
-    mock_exists.assert_called_once_with("files")  # Corrected line
-    mock_open_file.assert_called_with("files/test.txt", "wb+")
-    mock_shutil_copyfileobj.assert_called_once()
-    mock_file_parser_instance.parse.assert_called_once()
-    mock_getsize.assert_called_once_with("files/test.txt")
-    # assert file_repository.create.assert_called_once_with(mock_file_model_instance)
-    # Assert that file_repository.create was called with an object that has the expected attributes
+def test_create_file(file_service: FileService, mock_upload_file, mock_file_parser):
+    created_file = file_service.create_file(mock_upload_file)
 
-    create_call_args = file_service.file_repository.create.call_args
-    assert create_call_args is not None, "create method was not called."
+    # The file is stored under the hash of its bytes
+    with open(CONTENT_PATH, "rb") as f:
+        assert f.read() == CONTENT
+    assert os.listdir("files") == [CONTENT_HASH[:2]]
+    mock_file_parser.assert_called_once_with(CONTENT_PATH)
 
-    created_file = create_call_args[0][
-        0
-    ]  # This should be the file object passed to the create method
+    file_service.file_repository.create.assert_called_once()
     assert created_file.name == "test.txt", "File name should be 'test.txt'."
-    assert (
-        created_file.path == "files/test.txt"
-    ), "File path should be 'files/test.txt'."
-    assert created_file.size == 123, "File size should be 123."
+    assert created_file.path == CONTENT_PATH
+    assert created_file.size == len(CONTENT)
+    assert created_file.content_hash == CONTENT_HASH
     assert (
         created_file.content == "Parsed file content"
     ), "File content should be 'Parsed file content'."
 
-    assert (
-        result == mock_file_model_instance
-    ), "The result should be the created file model instance."
+
+def test_create_file_duplicate_reuses_content(
+    file_service: FileService,
+    mock_upload_file,
+    mock_file_parser,
+):
+    file_service.create_file(mock_upload_file)
+    mock_file_parser.reset_mock()
+    file_service.file_repository.get_by_content_hash.return_value = MagicMock(
+        content="Existing content",
+    )
+
+    duplicate_upload_file = MagicMock()
+    duplicate_upload_file.filename = "copy.txt"
+    duplicate_upload_file.file = io.BytesIO(CONTENT)
+    created_file = file_service.create_file(duplicate_upload_file)
+
+    mock_file_parser.assert_not_called()
+    assert created_file.name == "copy.txt"
+    assert created_file.path == CONTENT_PATH
+    assert created_file.content == "Existing content"
+    # the temporary file of the upload is removed
+    assert sorted(os.listdir("files")) == [CONTENT_HASH[:2]]
+
+
+def test_create_file_too_large(
+    file_service: FileService,
+    mock_upload_file,
+    mock_file_parser,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "max_upload_size", 8)
+
+    with pytest.raises(FileTooLargeError):
+        file_service.create_file(mock_upload_file)
+
+    assert os.listdir("files") == []
+    file_service.file_repository.create.assert_not_called()
+
+
+def test_create_file_unsupported_extension(file_service: FileService):
+    upload_file = MagicMock()
+    upload_file.filename = "image.png"
+
+    with pytest.raises(ValueError):
+        file_service.create_file(upload_file)
+
+
+def test_file_text_stores_the_extracted_text(monkeypatch):
+    parser = MagicMock()
+    parser.parser.plain_text = False
+    parser.stream.return_value = iter(["a" * 150, "b" * 100])
+    monkeypatch.setattr(
+        "api.web.service.file.FileParser",
+        MagicMock(return_value=parser),
+    )
+    monkeypatch.setattr(settings, "text_block_size", 100)
+
+    file_text = FileText("document.pdf")
+    file_text.store()
+
+    assert file_text.preview == "a" * 150 + "b" * 50
+    assert file_text.text_path == "document.pdf.txt.gz"
+    # the text is read back from the text file, by parts
+    assert list(
+        FileService.stream_text(
+            File(path="document.pdf", text_path="document.pdf.txt.gz"),
+        ),
+    ) == ["a" * 100, "a" * 50 + "b" * 50, "b" * 50]
+    assert not [name for name in os.listdir(".") if name.endswith(".part")]
@@ -1,28 +1,46 @@
-from unittest.mock import MagicMock
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from fastapi_pagination import Params
 from openai.types import CreateEmbeddingResponse
 from openai.types.embedding import Embedding
 
 from api.infra.db.model.file import FileChunk
-from api.web.service.file_chunk import FileChunkService
+from api.infra.db.repository.file import SimilarFileChunk
+from api.settings import settings
+from api.web.service.chunker import (
+    TextChunk,
+    TokenChunker,
+    _encoded_prefix_length,
+    get_encoding,
+)
+from api.web.service.embedding_provider import OpenAIEmbeddingProvider
+from api.web.service.file_chunk import (
+    AsyncFileChunkService,
+    FileChunkService,
+    SearchMode,
+    reciprocal_rank_fusion,
+)
 
 
 @pytest.fixture
 def file_chunk_service():
     file_chunk_repo_mock = MagicMock()
+    file_chunk_repo_mock.get_embeddings_by_content_hash.return_value = {}
     openai_mock = MagicMock()
     return FileChunkService(
         file_chunk_repository=file_chunk_repo_mock,
-        openai=openai_mock,
+        embedding_provider=OpenAIEmbeddingProvider(client=openai_mock),
+        chunker=MagicMock(),
     )
 
 
 def test_create_file_chunks_embedding_single_chunk(
     file_chunk_service: FileChunkService,
 ):
-    file_chunk_service.num_tokens_from_string = MagicMock(return_value=400)
-    file_chunk_service.openai.embeddings.create = MagicMock(
+    file_chunk_service.chunker.split.return_value = [TextChunk("Test content", 2)]
+    file_chunk_service.embedding_provider.client.embeddings.create = MagicMock(
         return_value=CreateEmbeddingResponse(
             data=[Embedding(embedding=[1, 2, 3], index=0, object="embedding")],
             model="text-embedding-ada-002",
@@ -30,109 +48,201 @@ def test_create_file_chunks_embedding_single_chunk(
             usage={"prompt_tokens": 0, "total_tokens": 0},
         ),
     )
-    file_chunk_service.file_chunk_repository.create = MagicMock()
+    file_chunk_service.file_chunk_repository.create_many = MagicMock()
 
     file_chunk_service.create_file_chunks_embedding(
         file_id=1,
         file_text_content="Test content",
     )
 
-    file_chunk_service.num_tokens_from_string.assert_called_once_with("Test content")
-    file_chunk_service.openai.embeddings.create.assert_called_once_with(
+    file_chunk_service.chunker.split.assert_called_once_with("Test content")
+    file_chunk_service.embedding_provider.client.embeddings.create.assert_called_once_with(
         model="text-embedding-ada-002",
-        input="Test content",
+        input=["Test content"],
     )
     expected_file_chunk = FileChunk(
         file_id=1,
         chunk_text="Test content",
         embedding_vector=[1, 2, 3],
     )
-    # Extract the arguments passed to the create method
-    actual_args, _ = file_chunk_service.file_chunk_repository.create.call_args
+    # Extract the arguments passed to the create_many method
+    actual_args, _ = file_chunk_service.file_chunk_repository.create_many.call_args
     # Check if the arguments match the expected FileChunk object
-    assert actual_args[0].file_id == expected_file_chunk.file_id
-    assert actual_args[0].chunk_text == expected_file_chunk.chunk_text
-    assert actual_args[0].embedding_vector == expected_file_chunk.embedding_vector
+    assert len(actual_args[0]) == 1
+    assert actual_args[0][0].file_id == expected_file_chunk.file_id
+    assert actual_args[0][0].chunk_text == expected_file_chunk.chunk_text
+    assert actual_args[0][0].embedding_vector == expected_file_chunk.embedding_vector
 
 
 def test_create_file_chunks_embedding_multiple_chunks(
     file_chunk_service: FileChunkService,
 ):
     # Mocking the behavior for a larger text content that will be split into multiple chunks
-    file_chunk_service.num_tokens_from_string = MagicMock(return_value=600)
-    file_chunk_service.split_text_into_chunks = MagicMock(
-        return_value=["Chunk 1", "Chunk 2"],
-    )
-    file_chunk_service.openai.embeddings.create = MagicMock(
-        side_effect=[
-            CreateEmbeddingResponse(
-                data=[Embedding(embedding=[1, 2, 3], index=0, object="embedding")],
-                model="text-embedding-ada-002",
-                object="list",
-                usage={"prompt_tokens": 0, "total_tokens": 0},
-            ),
-            CreateEmbeddingResponse(
-                data=[Embedding(embedding=[4, 5, 6], index=0, object="embedding")],
-                model="text-embedding-ada-002",
-                object="list",
-                usage={"prompt_tokens": 0, "total_tokens": 0},
-            ),
-        ],
-    )
-    file_chunk_service.file_chunk_repository.create = MagicMock()
+    file_chunk_service.chunker.split.return_value = [
+        TextChunk("Chunk 1", 512),
+        TextChunk("Chunk 2", 88),
+    ]
+    # Both chunks are embedded in a single batched request, returned out of order
+    file_chunk_service.embedding_provider.client.embeddings.create = MagicMock(
+        return_value=CreateEmbeddingResponse(
+            data=[
+                Embedding(embedding=[4, 5, 6], index=1, object="embedding"),
+                Embedding(embedding=[1, 2, 3], index=0, object="embedding"),
+            ],
+            model="text-embedding-ada-002",
+            object="list",
+            usage={"prompt_tokens": 0, "total_tokens": 0},
+        ),
+    )
+    file_chunk_service.file_chunk_repository.create_many = MagicMock()
 
     file_chunk_service.create_file_chunks_embedding(
         file_id=1,
         file_text_content="Large test content to split",
     )
 
-    file_chunk_service.num_tokens_from_string.assert_called_once_with(
-        "Large test content to split",
-    )
-    file_chunk_service.split_text_into_chunks.assert_called_once_with(
+    file_chunk_service.chunker.split.assert_called_once_with(
         "Large test content to split",
     )
-    file_chunk_service.openai.embeddings.create.assert_any_call(
-        model="text-embedding-ada-002",
-        input="Chunk 1",
-    )
-    file_chunk_service.openai.embeddings.create.assert_any_call(
+    file_chunk_service.embedding_provider.client.embeddings.create.assert_called_once_with(
         model="text-embedding-ada-002",
-        input="Chunk 2",
+        input=["Chunk 1", "Chunk 2"],
     )
-    assert file_chunk_service.openai.embeddings.create.call_count == 2
 
-    actual_calls = file_chunk_service.file_chunk_repository.create.call_args_list
-    # Create a list of dictionaries representing expected calls
-    expected_calls = [
+    # All the chunks are inserted with a single call
+    file_chunk_service.file_chunk_repository.create_many.assert_called_once()
+    actual_chunks = file_chunk_service.file_chunk_repository.create_many.call_args[0][0]
+    actual_chunks_dict = [
+        {
+            "file_id": file_chunk.file_id,
+            "chunk_text": file_chunk.chunk_text,
+            "embedding_vector": file_chunk.embedding_vector,
+        }
+        for file_chunk in actual_chunks
+    ]
+    assert actual_chunks_dict == [
         {"file_id": 1, "chunk_text": "Chunk 1", "embedding_vector": [1, 2, 3]},
         {"file_id": 1, "chunk_text": "Chunk 2", "embedding_vector": [4, 5, 6]},
     ]
 
-    # Convert actual calls to dictionaries for comparison
-    actual_calls_dict = [
-        {
-            "file_id": call_args[0][0].file_id,
-            "chunk_text": call_args[0][0].chunk_text,
-            "embedding_vector": call_args[0][0].embedding_vector,
-        }
-        for call_args in actual_calls
-    ]
 
-    # Convert expected calls and check if all expected calls are found in the actual calls
-    for expected_call in expected_calls:
-        assert (
-            expected_call in actual_calls_dict
-        ), f"Expected call not found: {expected_call}"
-    assert len(actual_calls_dict) == len(expected_calls), "Unexpected number of calls"
+def test_create_file_chunks_embedding_by_groups(
+    file_chunk_service: FileChunkService,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "ingestion_chunk_group_size", 2)
+    parts = iter(["Chunk 0 ", "Chunk 1 ..."])
+    file_chunk_service.chunker.split_stream.return_value = iter(
+        [TextChunk(f"Chunk {i}", 2) for i in range(5)],
+    )
+    file_chunk_service.embed_chunks = MagicMock(
+        side_effect=lambda chunks, _: [[0.1] for _ in chunks],
+    )
+
+    on_group_stored = MagicMock()
+
+    file_chunk_service.create_file_chunks_embedding(1, parts, on_group_stored)
+
+    file_chunk_service.chunker.split_stream.assert_called_once_with(parts)
+    assert on_group_stored.call_count == 3
+    # the chunks of a text read by parts are embedded and inserted by groups
+    assert [
+        [chunk.chunk_text for chunk in call[0][0]]
+        for call in file_chunk_service.file_chunk_repository.create_many.call_args_list
+    ] == [["Chunk 0", "Chunk 1"], ["Chunk 2", "Chunk 3"], ["Chunk 4"]]
+
+
+def test_create_embeddings_in_batches(
+    file_chunk_service: FileChunkService,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "embedding_batch_size", 2)
+    monkeypatch.setattr(settings, "embedding_max_concurrency", 2)
+
+    def create_embedding_response(model, input):
+        return CreateEmbeddingResponse(
+            data=[
+                Embedding(embedding=[float(text[-1])], index=i, object="embedding")
+                for i, text in enumerate(input)
+            ],
+            model=model,
+            object="list",
+            usage={"prompt_tokens": 0, "total_tokens": 0},
+        )
+
+    file_chunk_service.embedding_provider.client.embeddings.create = MagicMock(
+        side_effect=create_embedding_response,
+    )
+
+    embeddings = file_chunk_service.create_embeddings(
+        ["Chunk 1", "Chunk 2", "Chunk 3", "Chunk 4", "Chunk 5"],
+    )
+
+    assert embeddings == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert (
+        file_chunk_service.embedding_provider.client.embeddings.create.call_count == 3
+    )
 
 
 def test_split_text_into_chunks():
     test_text = "This is a test sentence for chunk splitting. " * 600
-    # 8 words times 600 repetitions = 4800 words
-    # 4800 words divided by 384 words as ideal size = 13 chunks
+    num_tokens = FileChunkService.num_tokens_from_string(test_text)
     actual_chunks = FileChunkService.split_text_into_chunks(test_text)
-    assert len(actual_chunks) == 13
+    # chunks are cut on token offsets, every chunk but the last one has 512 tokens
+    assert len(actual_chunks) == -(-num_tokens // 512)
+    assert "".join(actual_chunks) == test_text
+    assert all(
+        FileChunkService.num_tokens_from_string(chunk) <= 512 for chunk in actual_chunks
+    )
+
+
+def test_token_chunker_overlap():
+    test_text = "one two three four five six seven eight nine ten eleven twelve"
+    chunks = TokenChunker(chunk_size=5, chunk_overlap=2).split(test_text)
+    encoding = get_encoding()
+    chunk_tokens = [encoding.encode(chunk.text) for chunk in chunks]
+
+    assert [chunk.num_tokens for chunk in chunks] == [5, 5, 5, 3]
+    for previous, current in zip(chunk_tokens, chunk_tokens[1:]):
+        assert previous[-2:] == current[:2]
+
+
+def test_token_chunker_keeps_multi_byte_characters_whole():
+    # the rare characters and the emojis are encoded with several tokens each
+    test_text = "Le café 𝔘𝔫𝔦𝔠𝔬𝔡𝔢 😀🎉 語彙の検索 ✓ " * 20
+    chunks = TokenChunker(chunk_size=5, chunk_overlap=2).split(test_text)
+
+    assert all("\ufffd" not in chunk.text for chunk in chunks)
+    assert all(chunk.text in test_text for chunk in chunks)
+    assert all(chunk.num_tokens <= 5 for chunk in chunks)
+
+
+def test_token_chunker_split_stream_matches_split(monkeypatch):
+    test_text = "One two three, four five.\n\nSix  seven eight nine ten. " * 40
+    chunker = TokenChunker(chunk_size=20, chunk_overlap=5)
+    expected_chunks = chunker.split(test_text)
+    # the text is read by parts of 7 characters and encoded by blocks of 50
+    monkeypatch.setattr(settings, "text_block_size", 50)
+    parts = [test_text[i : i + 7] for i in range(0, len(test_text), 7)]
+
+    chunks = list(chunker.split_stream(parts))
+
+    assert chunks == expected_chunks
+    assert len(chunks) > 10
+
+
+def test_encoded_prefix_length_keeps_the_punctuation_before_newlines():
+    # ".\n\n" is encoded as one token, it could be merged with a following newline
+    assert _encoded_prefix_length("four five.\n\n") == len("four five")
+    assert _encoded_prefix_length("five.\n\nSix") == len("five")
+    assert _encoded_prefix_length("a .\n\nb") == len("a")
+    assert _encoded_prefix_length("one  two") == len("one")
+    assert _encoded_prefix_length("single") == len("single")
+
+
+def test_token_chunker_invalid_overlap():
+    with pytest.raises(ValueError):
+        TokenChunker(chunk_size=5, chunk_overlap=5)
 
 
 def test_num_tokens_from_string():
@@ -149,6 +259,47 @@ def test_get_file_words_length():
     assert actual_word_count == expected_word_count
 
 
+def test_create_file_chunks_embedding_reuses_stored_embeddings(
+    file_chunk_service: FileChunkService,
+):
+    stored, edited = TextChunk("Stored  chunk", 2), TextChunk("Edited chunk", 2)
+    file_chunk_service.chunker.split.return_value = [stored, edited, edited]
+    file_chunk_service.file_chunk_repository.get_embeddings_by_content_hash.return_value = {
+        TextChunk("Stored chunk", 2).content_hash: [7, 8, 9],
+    }
+    file_chunk_service.embedding_provider.client.embeddings.create = MagicMock(
+        return_value=CreateEmbeddingResponse(
+            data=[Embedding(embedding=[1, 2, 3], index=0, object="embedding")],
+            model="text-embedding-ada-002",
+            object="list",
+            usage={"prompt_tokens": 0, "total_tokens": 0},
+        ),
+    )
+
+    file_chunk_service.create_file_chunks_embedding(file_id=1, file_text_content="")
+
+    # the repeated chunk is embedded once, the stored one is not embedded
+    file_chunk_service.embedding_provider.client.embeddings.create.assert_called_once_with(
+        model="text-embedding-ada-002",
+        input=["Edited chunk"],
+    )
+    actual_chunks = file_chunk_service.file_chunk_repository.create_many.call_args[0][0]
+    assert [chunk.embedding_vector for chunk in actual_chunks] == [
+        [7, 8, 9],
+        [1, 2, 3],
+        [1, 2, 3],
+    ]
+    assert actual_chunks[0].content_hash == stored.content_hash
+    # only the embeddings of the model of the provider are reused
+    file_chunk_service.file_chunk_repository.get_embeddings_by_content_hash.assert_called_once_with(
+        {stored.content_hash, edited.content_hash},
+        "text-embedding-ada-002",
+    )
+    assert {chunk.embedding_model for chunk in actual_chunks} == {
+        "text-embedding-ada-002",
+    }
+
+
 def test_calculate_embedding_cost():
     test_file_content = (
         "This is a test file content for embedding cost calculation" * 1000
@@ -158,3 +309,169 @@ def test_calculate_embedding_cost():
     actual_cost = FileChunkService.calculate_embedding_cost(test_file_content)
     # Assert approximately equal due to floating point comparison
     assert round(actual_cost, 4) == expected_cost
+
+
+def test_async_create_embeddings_in_batches(monkeypatch):
+    monkeypatch.setattr(settings, "embedding_batch_size", 2)
+    embedding_provider = MagicMock()
+    embedding_provider.aembed_batch = AsyncMock(
+        side_effect=lambda batch: [[float(text[-1])] for text in batch],
+    )
+    file_chunk_service = AsyncFileChunkService(
+        file_chunk_repository=MagicMock(),
+        embedding_provider=embedding_provider,
+    )
+
+    embeddings = asyncio.run(
+        file_chunk_service.create_embeddings(["Chunk 1", "Chunk 2", "Chunk 3"]),
+    )
+
+    assert embeddings == [[1.0], [2.0], [3.0]]
+    assert embedding_provider.aembed_batch.await_count == 2
+
+
+def test_async_find_similar_file_chunks():
+    file_chunk_repository = MagicMock()
+    file_chunk_repository.find_similar_file_chunks = AsyncMock(return_value="page")
+    file_chunk_service = AsyncFileChunkService(
+        file_chunk_repository=file_chunk_repository,
+        embedding_provider=MagicMock(),
+    )
+
+    page = asyncio.run(file_chunk_service.find_similar_file_chunks([0.1], Params()))
+
+    assert page == "page"
+    file_chunk_repository.find_similar_file_chunks.assert_awaited_once_with(
+        [0.1],
+        Params(),
+        None,
+    )
+
+
+def make_similar_file_chunk(file_id: int, file_chunk_id: int) -> SimilarFileChunk:
+    return SimilarFileChunk(
+        file_id=file_id,
+        file_name=f"file_{file_id}.txt",
+        file_chunk_id=file_chunk_id,
+        chunk_text="text",
+    )
+
+
+def test_reciprocal_rank_fusion():
+    vector_ranking = [make_similar_file_chunk(1, 10), make_similar_file_chunk(2, 20)]
+    lexical_ranking = [make_similar_file_chunk(2, 21), make_similar_file_chunk(3, 30)]
+
+    fused_ranking = reciprocal_rank_fusion(vector_ranking, lexical_ranking, k=60)
+
+    assert [file_chunk.file_chunk_id for file_chunk in fused_ranking] == [20, 10, 30]
+    assert fused_ranking[0].score == pytest.approx(1 / 62 + 1 / 61)
+    assert fused_ranking[1].score == pytest.approx(1 / 61)
+
+
+def test_search_file_chunks_lexical_skips_embedding(
+    file_chunk_service: FileChunkService,
+):
+    file_chunk_service.file_chunk_repository.find_lexical_file_chunks.return_value = (
+        "page"
+    )
+    file_chunk_service.create_question_embedding = MagicMock()
+
+    page = file_chunk_service.search_file_chunks("invoice 42", SearchMode.LEXICAL)
+
+    assert page == "page"
+    file_chunk_service.create_question_embedding.assert_not_called()
+
+
+def test_search_file_chunks_hybrid(file_chunk_service: FileChunkService):
+    file_chunk_repository = file_chunk_service.file_chunk_repository
+    lexical_repository = MagicMock()
+    file_chunk_repository.in_new_session.return_value.__enter__.return_value = (
+        lexical_repository
+    )
+    lexical_repository.rank_lexical_file_chunks.return_value = [
+        make_similar_file_chunk(2, 21),
+    ]
+    file_chunk_repository.rank_similar_file_chunks.return_value = [
+        make_similar_file_chunk(1, 10),
+        make_similar_file_chunk(2, 20),
+    ]
+    file_chunk_service.create_question_embedding = MagicMock(return_value=[0.1])
+
+    page = file_chunk_service.search_file_chunks(
+        "invoice 42",
+        SearchMode.HYBRID,
+        Params(page=1, size=10),
+    )
+
+    lexical_repository.rank_lexical_file_chunks.assert_called_once_with(
+        "invoice 42",
+        10,
+        None,
+    )
+    file_chunk_repository.rank_similar_file_chunks.assert_called_once_with(
+        [0.1],
+        10,
+        None,
+    )
+    assert [file_chunk.file_chunk_id for file_chunk in page.items] == [20, 10]
+
+
+def test_async_rank_hybrid_file_chunks_awaits_both_searches():
+    events = []
+    lexical_repository = MagicMock()
+
+    async def rank_lexical_file_chunks(*_):
+        await asyncio.sleep(0)
+        events.append("lexical")
+        return [make_similar_file_chunk(2, 21)]
+
+    lexical_repository.rank_lexical_file_chunks = rank_lexical_file_chunks
+    file_chunk_repository = MagicMock()
+    session = file_chunk_repository.in_new_session.return_value
+    session.__aenter__ = AsyncMock(return_value=lexical_repository)
+    session.__aexit__ = AsyncMock(side_effect=lambda *_: events.append("closed"))
+    file_chunk_repository.rank_similar_file_chunks = AsyncMock(
+        return_value=[make_similar_file_chunk(1, 10), make_similar_file_chunk(2, 20)],
+    )
+    file_chunk_service = AsyncFileChunkService(
+        file_chunk_repository=file_chunk_repository,
+        embedding_provider=MagicMock(),
+    )
+    file_chunk_service.create_question_embedding = AsyncMock(return_value=[0.1])
+
+    ranking = asyncio.run(
+        file_chunk_service._rank_hybrid_file_chunks("invoice 42", 10, None),
+    )
+
+    assert [file_chunk.file_chunk_id for file_chunk in ranking] == [20, 10]
+    assert events == ["lexical", "closed"]
+
+
+def test_search_file_chunks_batch_embeds_questions_once(
+    file_chunk_service: FileChunkService,
+):
+    file_chunk_repository = file_chunk_service.file_chunk_repository
+    file_chunk_repository.rank_similar_file_chunks_batch.return_value = [
+        [make_similar_file_chunk(1, 10)],
+        [make_similar_file_chunk(2, 20), make_similar_file_chunk(3, 30)],
+    ]
+    file_chunk_service.create_embeddings = MagicMock(return_value=[[0.1], [0.2]])
+
+    pages = file_chunk_service.search_file_chunks_batch(
+        ["invoice", "contract", "invoice"],
+        Params(page=1, size=10),
+    )
+
+    file_chunk_service.create_embeddings.assert_called_once_with(
+        ["invoice", "contract"],
+    )
+    file_chunk_repository.rank_similar_file_chunks_batch.assert_called_once_with(
+        [[0.1], [0.2]],
+        10,
+        None,
+    )
+    assert [[item.file_chunk_id for item in page.items] for page in pages] == [
+        [10],
+        [20, 30],
+        [10],
+    ]
@@ -0,0 +1,80 @@
+import fitz
+import pytest
+from prometheus_client import REGISTRY
+
+from api.settings import settings
+from api.web.service.file_parser import FileParser
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "document.pdf"
+    document = fitz.open()
+    for page_num in range(10):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Content of page {page_num}")
+    document.save(path)
+    document.close()
+    return str(path)
+
+
+def test_parse_pdf_pages_in_order(pdf_path: str, monkeypatch):
+    monkeypatch.setattr(settings, "pdf_parallel_min_pages", 100)
+
+    pages = list(FileParser(pdf_path).stream())
+
+    assert [page.strip() for page in pages] == [
+        f"Content of page {page_num}" for page_num in range(10)
+    ]
+
+
+def test_parse_pdf_pages_in_parallel(pdf_path: str, monkeypatch):
+    monkeypatch.setattr(settings, "pdf_parallel_min_pages", 2)
+    monkeypatch.setattr(settings, "pdf_pages_per_task", 3)
+    monkeypatch.setattr(settings, "pdf_workers", 2)
+
+    content = FileParser(pdf_path).parse()
+
+    assert (
+        content.split()
+        == " ".join(f"Content of page {page_num}" for page_num in range(10)).split()
+    )
+
+
+def test_parse_txt(tmp_path):
+    path = tmp_path / "document.txt"
+    path.write_text("Text file content")
+
+    assert FileParser(str(path)).parse() == "Text file content"
+
+
+def test_stream_txt_by_parts(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "text_block_size", 4)
+    path = tmp_path / "document.txt"
+    path.write_text("0123456789")
+
+    assert list(FileParser(str(path)).stream()) == ["0123", "4567", "89"]
+    assert FileParser(str(path)).parse() == "0123456789"
+
+
+def test_stream_observes_the_parse_time_once_read(tmp_path):
+    path = tmp_path / "document.txt"
+    path.write_text("0123456789")
+    count = _parse_count("txt")
+
+    parts = FileParser(str(path)).stream()
+    next(parts)
+    assert _parse_count("txt") == count
+    list(parts)
+
+    assert _parse_count("txt") == count + 1
+
+
+def _parse_count(extension: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "semantic_search_parse_seconds_count",
+            {"extension": extension},
+        )
+        or 0
+    )
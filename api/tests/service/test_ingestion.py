@@ -0,0 +1,92 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.infra.db.model.file import File
+from api.infra.db.model.ingestion_job import IngestionJob
+from api.infra.db.repository.ingestion_job import IngestionJobRepository
+from api.settings import settings
+from api.web.service.ingestion import IngestionQueueFullError, IngestionService
+
+
+@pytest.fixture
+def ingestion_service():
+    return IngestionService(ingestion_job_repository=MagicMock())
+
+
+def test_ensure_capacity(ingestion_service: IngestionService, monkeypatch):
+    monkeypatch.setattr(settings, "ingestion_max_queue_depth", 10)
+    ingestion_service.ingestion_job_repository.count_unfinished.return_value = 9
+
+    ingestion_service.ensure_capacity()
+
+
+def test_ensure_capacity_queue_full(ingestion_service: IngestionService, monkeypatch):
+    monkeypatch.setattr(settings, "ingestion_max_queue_depth", 10)
+    ingestion_service.ingestion_job_repository.count_unfinished.return_value = 10
+
+    with pytest.raises(IngestionQueueFullError):
+        ingestion_service.ensure_capacity()
+
+
+def test_enqueue_file(ingestion_service: IngestionService, monkeypatch):
+    monkeypatch.setattr(settings, "ingestion_max_queue_depth", 10)
+    file = MagicMock(id=3)
+
+    ingestion_service.enqueue_file(file)
+
+    ingestion_service.ingestion_job_repository.enqueue.assert_called_once_with(
+        file,
+        10,
+    )
+
+
+def test_enqueue_file_queue_full(ingestion_service: IngestionService):
+    ingestion_service.ingestion_job_repository.enqueue.return_value = None
+
+    with pytest.raises(IngestionQueueFullError):
+        ingestion_service.enqueue_file(MagicMock(id=3))
+
+
+def test_enqueue_checks_the_depth_in_the_transaction_of_the_file():
+    session = MagicMock()
+    session.execute.return_value.scalar_one.return_value = 10
+    repository = IngestionJobRepository(IngestionJob, session)
+
+    assert repository.enqueue(File(name="a.txt"), max_queue_depth=10) is None
+
+    # the advisory lock is taken before the depth is counted
+    assert "pg_advisory_xact_lock" in str(session.execute.call_args_list[0][0][0])
+    session.rollback.assert_called_once()
+    session.add.assert_not_called()
+
+    session.execute.return_value.scalar_one.return_value = 9
+    file = File(name="a.txt")
+    job = repository.enqueue(file, max_queue_depth=10)
+
+    # the file is added with its job and committed once
+    assert job.file is file
+    session.add.assert_called_once_with(job)
+    session.commit.assert_called_once()
+
+
+def test_complete_and_fail_leave_a_job_claimed_again():
+    session = MagicMock()
+    session.execute.return_value.rowcount = 0
+    repository = IngestionJobRepository(IngestionJob, session)
+    job = IngestionJob(id=1, attempts=2)
+
+    assert repository.complete(job, 2) is None
+    assert repository.fail(job, 2, "error", max_attempts=3, retry_backoff=5) is None
+    assert repository.extend_lease(job, 2) is None
+
+    # the update only matches the running job of this claim
+    assert "ingestion_job.attempts = :attempts_1" in str(
+        session.execute.call_args[0][0],
+    )
+    assert session.rollback.call_count == 3
+    session.commit.assert_not_called()
+
+    session.execute.return_value.rowcount = 1
+    assert repository.extend_lease(job, 2) is job
+    session.commit.assert_called_once()
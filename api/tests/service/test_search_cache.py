@@ -0,0 +1,103 @@
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi_pagination import Params
+
+from api.infra.db.repository.file import SearchFilter
+from api.web.service.embedding_cache import LRUCache
+from api.web.service.file_chunk import FileChunkService, SearchMode
+from api.web.service.search_cache import SearchResultCache
+
+
+@pytest.fixture
+def search_result_cache():
+    repository = MagicMock()
+    repository.get_generation.return_value = 1
+    return SearchResultCache(repository, LRUCache(max_size=2, ttl=60))
+
+
+def test_get_or_search_caches_pages_of_a_generation(search_result_cache):
+    search = MagicMock(side_effect=["page 1", "page 2"])
+
+    first = search_result_cache.get_or_search("lexical", "a question", Params(), search)
+    second = search_result_cache.get_or_search(
+        "lexical",
+        " a  question ",
+        Params(),
+        search,
+    )
+
+    assert first == second == "page 1"
+    search.assert_called_once()
+
+
+def test_get_or_search_runs_again_after_a_corpus_change(search_result_cache):
+    search = MagicMock(side_effect=["page 1", "page 2"])
+
+    search_result_cache.get_or_search("vector", [0.1, 0.2], Params(), search)
+    search_result_cache.repository.get_generation.return_value = 2
+
+    assert (
+        search_result_cache.get_or_search("vector", [0.1, 0.2], Params(), search)
+        == "page 2"
+    )
+
+
+def test_get_or_search_refresh(search_result_cache):
+    search = MagicMock(side_effect=["page 1", "page 2", "page 3"])
+
+    search_result_cache.get_or_search("lexical", "question", Params(), search)
+    refreshed = search_result_cache.get_or_search(
+        "lexical",
+        "question",
+        Params(),
+        search,
+        refresh=True,
+    )
+
+    assert refreshed == "page 2"
+    # the refreshed page replaces the cached one
+    assert (
+        search_result_cache.get_or_search("lexical", "question", Params(), search)
+        == "page 2"
+    )
+
+
+def test_make_key_depends_on_the_search():
+    key = SearchResultCache.make_key(1, "vector", [0.1, 0.2], Params(page=1, size=10))
+
+    assert key != SearchResultCache.make_key(1, "vector", [0.1, 0.3], Params())
+    assert key != SearchResultCache.make_key(1, "hybrid", [0.1, 0.2], Params())
+    assert key != SearchResultCache.make_key(
+        1,
+        "vector",
+        [0.1, 0.2],
+        Params(page=2, size=10),
+    )
+    assert key != SearchResultCache.make_key(
+        1,
+        "vector",
+        [0.1, 0.2],
+        Params(page=1, size=10),
+        SearchFilter(extension="pdf"),
+    )
+
+
+def test_search_file_chunks_uses_the_cache(search_result_cache):
+    file_chunk_repository = MagicMock()
+    file_chunk_service = FileChunkService(
+        file_chunk_repository,
+        embedding_provider=MagicMock(),
+        chunker=MagicMock(),
+        search_result_cache=search_result_cache,
+    )
+
+    file_chunk_service.search_file_chunks("question", SearchMode.LEXICAL)
+    file_chunk_service.search_file_chunks("question", SearchMode.LEXICAL)
+    file_chunk_service.search_file_chunks(
+        "question",
+        SearchMode.LEXICAL,
+        use_cache=False,
+    )
+
+    assert file_chunk_repository.find_lexical_file_chunks.call_count == 2
@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.infra.db.repository.file import SimilarFileChunk
+from api.web.service.file_chunk import FileChunkService, SearchMode
+from api.web.service.search_session import (
+    SESSION_FILE_NBYTES,
+    SearchSession,
+    SearchSessionExpiredError,
+    SearchSessionStore,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def ranking(files: int) -> list[SimilarFileChunk]:
+    return [
+        SimilarFileChunk(
+            file_id=file_id,
+            file_name=f"{file_id}.txt",
+            file_chunk_id=file_id * 10,
+            chunk_text=f"text {file_id}",
+            distance=file_id / 100,
+        )
+        for file_id in range(1, files + 1)
+    ]
+
+
+def test_store_evicts_the_oldest_sessions_above_the_maximum_size():
+    session = SearchSession.from_ranking(ranking(10), page_size=5)
+    store = SearchSessionStore(max_bytes=2 * session.nbytes, ttl=60)
+
+    first, second, third = (store.add(session) for _ in range(3))
+
+    assert store.get(first) is None
+    assert store.get(second) is session
+    assert store.get(third) is session
+    assert store.nbytes == 2 * session.nbytes
+    assert store.add(SearchSession.from_ranking(ranking(100), page_size=5)) is None
+
+
+def test_store_expires_sessions():
+    store = SearchSessionStore(max_bytes=1024 * 1024, ttl=-1)
+
+    session_id = store.add(SearchSession.from_ranking(ranking(2), page_size=1))
+
+    assert store.get(session_id) is None
+    assert len(store) == 0
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("abc-_1", 50)) == ("abc-_1", 50)
+    for cursor in ("not a cursor", encode_cursor("abc", -1)):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(cursor)
+
+
+def test_session_pages_only_read_their_chunks():
+    repository = MagicMock()
+    repository.rank_similar_file_chunks.return_value = ranking(5)
+    repository.get_file_chunk_rows.side_effect = lambda ids: [
+        SimpleNamespace(file_chunk_id=i, file_name=f"{i // 10}.txt", chunk_text="t")
+        for i in ids
+        # the chunk of file 4 was deleted since the first page
+        if i != 40
+    ]
+    embedding_provider = MagicMock()
+    embedding_provider.embed_batch.return_value = [[0.1]]
+    service = FileChunkService(
+        repository,
+        embedding_provider=embedding_provider,
+        search_session_store=SearchSessionStore(max_bytes=1024 * 1024, ttl=60),
+    )
+
+    first = service.start_search_session("question", SearchMode.VECTOR, size=2)
+    second = service.get_search_session_page(first.next_cursor)
+    third = service.get_search_session_page(second.next_cursor)
+
+    assert [file_chunk.file_id for file_chunk in first.items] == [1, 2]
+    assert [file_chunk.file_id for file_chunk in second.items] == [3]
+    assert second.items[0].distance == pytest.approx(0.03)
+    assert [file_chunk.file_id for file_chunk in third.items] == [5]
+    assert first.total == third.total == 5
+    assert third.next_cursor is None
+    embedding_provider.embed_batch.assert_called_once()
+    repository.rank_similar_file_chunks.assert_called_once()
+    assert [call[0][0] for call in repository.get_file_chunk_rows.call_args_list] == [
+        [30, 40],
+        [50],
+    ]
+
+
+def test_session_ranks_no_more_files_than_the_store_keeps():
+    repository = MagicMock()
+    repository.rank_similar_file_chunks.return_value = ranking(5)
+    repository.get_file_chunk_rows.side_effect = lambda ids: [
+        SimpleNamespace(file_chunk_id=i, file_name=f"{i // 10}.txt", chunk_text="t")
+        for i in ids
+    ]
+    embedding_provider = MagicMock()
+    embedding_provider.embed_batch.return_value = [[0.1]]
+    service = FileChunkService(
+        repository,
+        embedding_provider=embedding_provider,
+        search_session_store=SearchSessionStore(
+            max_bytes=3 * SESSION_FILE_NBYTES,
+            ttl=60,
+        ),
+    )
+
+    first = service.start_search_session("question", SearchMode.VECTOR, size=2)
+    second = service.get_search_session_page(first.next_cursor)
+
+    assert repository.rank_similar_file_chunks.call_args[0][1] == 3
+    assert first.total == 3
+    assert [file_chunk.file_id for file_chunk in second.items] == [3]
+    assert second.next_cursor is None
+
+
+def test_session_page_of_an_expired_session():
+    service = FileChunkService(
+        MagicMock(),
+        embedding_provider=MagicMock(),
+        search_session_store=SearchSessionStore(max_bytes=1024, ttl=60),
+    )
+
+    with pytest.raises(SearchSessionExpiredError):
+        service.get_search_session_page(encode_cursor("unknown", 50))
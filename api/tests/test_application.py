@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+
+def test_app_import_defers_the_parser_and_embedding_libraries():
+    # a fresh interpreter, the test session has imported them already
+    code = (
+        "import sys\n"
+        "before = set(sys.modules)\n"
+        "import api.web.application\n"
+        "print(sorted({'fitz', 'openai', 'PIL', 'pytesseract', 'tiktoken'} "
+        "& (set(sys.modules) - before)))\n"
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    assert result.stdout.strip() == "[]"
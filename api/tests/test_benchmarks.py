@@ -0,0 +1,62 @@
+import numpy as np
+
+from api.benchmarks.corpus import (
+    SyntheticEmbeddingProvider,
+    generate_text,
+    write_pdf_file,
+)
+from api.benchmarks.suite import compare_benchmarks, measure
+from api.web.service.file_parser import FileParser
+
+
+def test_generate_text_is_deterministic():
+    assert generate_text(100, seed=1) == generate_text(100, seed=1)
+    assert generate_text(100, seed=1) != generate_text(100, seed=2)
+    assert len(generate_text(100).split()) == 100
+
+
+def test_write_pdf_file_is_parsable(tmp_path):
+    path = write_pdf_file(str(tmp_path), 1000)
+
+    assert FileParser(path).parse().split() == generate_text(1000).split()
+
+
+def test_synthetic_embeddings_are_deterministic_unit_vectors():
+    provider = SyntheticEmbeddingProvider(dimensions=8)
+
+    first, second = provider.embed_batch(["a", "b"])
+
+    assert provider.embed_batch(["a"]) == [first]
+    assert first != second
+    assert abs(np.linalg.norm(first) - 1) < 1e-6
+
+
+def test_measure():
+    calls = []
+
+    result = measure("append", 10, lambda: calls.append(1), repeat=3)
+
+    assert len(calls) == 4
+    assert result.repeat == 3
+    assert result.min_ms <= result.median_ms
+
+
+def test_compare_benchmarks_reports_slower_medians():
+    baseline = {
+        "results": [
+            {"name": "parse", "size": 10, "median_ms": 10.0},
+            {"name": "search", "size": 10, "median_ms": 10.0},
+        ],
+    }
+    report = {
+        "results": [
+            {"name": "parse", "size": 10, "median_ms": 12.0},
+            {"name": "search", "size": 10, "median_ms": 20.0},
+            {"name": "create", "size": 10, "median_ms": 20.0},
+        ],
+    }
+
+    regressions = compare_benchmarks(baseline, report, tolerance=0.25)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("search at size 10")
@@ -0,0 +1,37 @@
+from api.quantization_report import (
+    QuantizationReportRow,
+    format_quantization_report,
+    recall_at_k,
+)
+from api.settings import EmbeddingStorage
+
+
+def test_recall_at_k():
+    assert recall_at_k([1, 2, 3, 4], [1, 2, 5, 6]) == 0.5
+    assert recall_at_k([], []) == 1.0
+
+
+def test_format_quantization_report():
+    rows = [
+        QuantizationReportRow(
+            storage=EmbeddingStorage.BINARY,
+            recall=0.95,
+            p50_latency_ms=1.5,
+            p95_latency_ms=3.25,
+            index_size_bytes=2 * 2**20,
+        ),
+    ]
+
+    lines = format_quantization_report(rows, k=10).splitlines()
+
+    assert lines[0].split() == [
+        "storage",
+        "recall@10",
+        "p50",
+        "ms",
+        "p95",
+        "ms",
+        "index",
+        "MiB",
+    ]
+    assert lines[1].split() == ["binary", "0.950", "1.50", "3.25", "2.0"]
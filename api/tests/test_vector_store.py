@@ -0,0 +1,139 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from fastapi_pagination import Params
+
+from api.infra.db.model.file import FileChunk
+from api.infra.db.repository.file import VectorStoreFileChunkRepository
+from api.infra.vector_store import VectorStore
+from api.settings import VectorStoreMode, settings
+
+DIMENSIONS = 8
+
+
+def unit(*components: float) -> list[float]:
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    vector[: len(components)] = components
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+@pytest.fixture
+def vector_store(tmp_path):
+    store = VectorStore(str(tmp_path), dimensions=DIMENSIONS)
+    store.append(
+        [10, 11, 20, 30],
+        [1, 1, 2, 3],
+        np.array(
+            [unit(1, 0.1), unit(1, 0.3), unit(1, 0.2), unit(0, 1)],
+        ),
+    )
+    return store
+
+
+def test_search_returns_best_chunk_per_file(vector_store: VectorStore):
+    results = vector_store.search(unit(1), threshold=0.5, max_results=10)
+
+    assert [(result.file_chunk_id, result.file_id) for result in results] == [
+        (10, 1),
+        (20, 2),
+    ]
+    assert results[0].distance == pytest.approx(1 - 1 / np.sqrt(1.01), abs=1e-6)
+
+
+def test_search_skips_deleted_files(vector_store: VectorStore):
+    vector_store.delete_file(1)
+
+    results = vector_store.search(unit(1), threshold=0.5, max_results=10)
+
+    assert [result.file_chunk_id for result in results] == [20]
+
+
+@pytest.mark.parametrize("exact_scan_max_rows", [0, 100])
+def test_search_filtered_file_ids(vector_store: VectorStore, exact_scan_max_rows: int):
+    vector_store.exact_scan_max_rows = exact_scan_max_rows
+
+    results = vector_store.search(
+        unit(1),
+        threshold=0.5,
+        max_results=10,
+        filtered_file_ids=[2, 3],
+    )
+
+    assert [(result.file_chunk_id, result.file_id) for result in results] == [(20, 2)]
+
+
+def test_search_many_matches_search(vector_store: VectorStore):
+    questions = [unit(1), unit(0, 1), unit(1, 1)]
+
+    results = vector_store.search_many(questions, threshold=0.5, max_results=10)
+
+    for question, question_results in zip(questions, results):
+        expected_results = vector_store.search(question, threshold=0.5, max_results=10)
+        assert [result.file_chunk_id for result in question_results] == [
+            result.file_chunk_id for result in expected_results
+        ]
+        assert [result.distance for result in question_results] == pytest.approx(
+            [result.distance for result in expected_results],
+            abs=1e-6,
+        )
+
+
+def test_appends_are_seen_by_other_processes(vector_store: VectorStore, tmp_path):
+    reader = VectorStore(str(tmp_path), dimensions=DIMENSIONS)
+    assert len(reader.search(unit(0, 0, 1), threshold=0.5, max_results=10)) == 0
+
+    vector_store.append([40], [4], np.array([unit(0, 0, 1)]))
+
+    results = reader.search(unit(0, 0, 1), threshold=0.5, max_results=10)
+    assert [result.file_chunk_id for result in results] == [40]
+
+
+def test_ivf_search_scans_nearest_lists(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = np.eye(DIMENSIONS, dtype=np.float32)
+    embeddings = np.repeat(centers, 50, axis=0) + rng.normal(
+        scale=0.05,
+        size=(50 * DIMENSIONS, DIMENSIONS),
+    )
+    store = VectorStore(
+        str(tmp_path),
+        dimensions=DIMENSIONS,
+        mode=VectorStoreMode.IVF,
+        ivf_probes=2,
+    )
+    store.append(
+        list(range(len(embeddings))),
+        list(range(len(embeddings))),
+        embeddings,
+    )
+    exact_results = store.search(unit(1), threshold=0.1, max_results=5)
+
+    store.train_ivf(n_lists=DIMENSIONS)
+    # appended after the training, assigned to their nearest list
+    store.append([1000], [1000], np.array([unit(1)]))
+
+    results = store.search(unit(1), threshold=0.1, max_results=6)
+    assert results[0].file_chunk_id == 1000
+    assert [result.file_chunk_id for result in results[1:]] == [
+        result.file_chunk_id for result in exact_results
+    ]
+
+
+def test_vector_store_repository_reads_texts_of_page(
+    vector_store: VectorStore,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "search_similarity_threshold", 0.5)
+    session = MagicMock()
+    session.execute.return_value.all.return_value = [
+        MagicMock(file_chunk_id=20, file_name="file_2.txt", chunk_text="text 20"),
+    ]
+    repository = VectorStoreFileChunkRepository(FileChunk, session, vector_store)
+
+    page = repository.find_similar_file_chunks(unit(1), Params(page=2, size=1))
+
+    assert page.total == 2
+    assert [(item.file_chunk_id, item.file_name) for item in page.items] == [
+        (20, "file_2.txt"),
+    ]
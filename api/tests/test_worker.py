@@ -0,0 +1,120 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.settings import settings
+from api.worker import IngestionWorker
+
+
+@pytest.fixture
+def job_repository(monkeypatch):
+    repository = MagicMock()
+    monkeypatch.setattr(
+        "api.worker.IngestionJobRepository",
+        MagicMock(return_value=repository),
+    )
+    return repository
+
+
+@pytest.fixture
+def worker():
+    return IngestionWorker(session_factory=MagicMock(), concurrency=1)
+
+
+def test_process_next_job_empty_queue(worker: IngestionWorker, job_repository):
+    job_repository.claim_next.return_value = None
+    worker._ingest_file = MagicMock()
+
+    assert worker.process_next_job() is False
+    worker._ingest_file.assert_not_called()
+
+
+def test_process_next_job_completes_job(worker: IngestionWorker, job_repository):
+    job = MagicMock(file_id=7, attempts=1)
+    job_repository.claim_next.return_value = job
+    worker._ingest_file = MagicMock()
+
+    assert worker.process_next_job() is True
+    assert worker._ingest_file.call_args[0][1] == 7
+    job_repository.complete.assert_called_once_with(job, 1)
+    job_repository.fail.assert_not_called()
+
+
+def test_process_next_job_retries_failed_job(
+    worker: IngestionWorker,
+    job_repository,
+    monkeypatch,
+):
+    monkeypatch.setattr(settings, "ingestion_max_attempts", 3)
+    monkeypatch.setattr(settings, "ingestion_retry_backoff", 5)
+    job = MagicMock(file_id=7, attempts=1)
+    job_repository.claim_next.return_value = job
+    worker._ingest_file = MagicMock(side_effect=RuntimeError("API unavailable"))
+    file_chunk_repository = MagicMock()
+    monkeypatch.setattr(
+        "api.worker.FileChunkRepository",
+        MagicMock(return_value=file_chunk_repository),
+    )
+
+    assert worker.process_next_job() is True
+    # the chunks of the groups inserted before the failure are deleted
+    file_chunk_repository.delete_by_file_id.assert_called_once_with(7)
+    file_chunk_repository.bump_corpus_generation.assert_called_once()
+    job_repository.fail.assert_called_once_with(
+        job,
+        1,
+        "API unavailable",
+        max_attempts=3,
+        retry_backoff=5,
+    )
+    job_repository.complete.assert_not_called()
+
+
+def test_process_next_job_stops_when_the_job_is_claimed_again(
+    worker: IngestionWorker,
+    job_repository,
+    monkeypatch,
+):
+    job = MagicMock(id=3, file_id=7, attempts=1)
+    job_repository.claim_next.return_value = job
+    # another worker claimed the job after the first group of chunks
+    job_repository.extend_lease.return_value = None
+    worker._ingest_file = MagicMock(
+        side_effect=lambda session, file_id, extend_lease: extend_lease(),
+    )
+    file_chunk_repository = MagicMock()
+    monkeypatch.setattr(
+        "api.worker.FileChunkRepository",
+        MagicMock(return_value=file_chunk_repository),
+    )
+
+    assert worker.process_next_job() is True
+    job_repository.extend_lease.assert_called_once_with(job, 1)
+    # the chunks of the other worker are kept, and its job is left running
+    file_chunk_repository.delete_by_file_id.assert_not_called()
+    job_repository.fail.assert_not_called()
+    job_repository.complete.assert_not_called()
+
+
+def test_ingest_file_reuses_chunks_of_duplicate(monkeypatch):
+    file_repository = MagicMock()
+    file_repository.get_by_id.return_value = MagicMock(id=2)
+    file_repository.find_ingested_duplicate.return_value = MagicMock(id=1)
+    file_chunk_repository = MagicMock()
+    file_chunk_service = MagicMock()
+    monkeypatch.setattr(
+        "api.worker.FileRepository",
+        MagicMock(return_value=file_repository),
+    )
+    monkeypatch.setattr(
+        "api.worker.FileChunkRepository",
+        MagicMock(return_value=file_chunk_repository),
+    )
+    monkeypatch.setattr("api.worker.FileChunkService", file_chunk_service)
+    session = MagicMock()
+
+    IngestionWorker._ingest_file(session, 2)
+
+    file_chunk_repository.copy_file_chunks.assert_called_once_with(1, 2)
+    session.commit.assert_called_once()
+    file_chunk_service.assert_not_called()
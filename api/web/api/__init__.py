@@ -1,8 +1,14 @@
 """API for the application."""
 from fastapi.routing import APIRouter
 
-from api.web.api import file, monitoring
+from api.settings import settings
+from api.web.api import collection, file, file_async, monitoring
 
 api_router = APIRouter()
 api_router.include_router(monitoring.router)
 api_router.include_router(file.router)
+api_router.include_router(collection.router)
+if settings.db_async:
+    api_router.include_router(file_async.search_router)
+else:
+    api_router.include_router(file.search_router)
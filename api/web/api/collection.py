@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi_pagination import Page, Params
+
+from api.web.schema.collection import CollectionIn, CollectionOut
+from api.web.service.collection import (
+    CollectionExistsError,
+    CollectionNotFoundError,
+    CollectionService,
+    get_collection_service,
+)
+
+router = APIRouter(prefix="/collections", tags=["collections"])
+
+
+@router.get("/", response_model=Page[CollectionOut])
+def get_collections(
+    collection_service: CollectionService = Depends(get_collection_service),
+    params: Params = Depends(Params),
+):
+    """
+    Gets all collections
+    """
+    return collection_service.get_collections(params)
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=CollectionOut)
+def create_collection(
+    collection: CollectionIn,
+    collection_service: CollectionService = Depends(get_collection_service),
+):
+    """
+    Creates a collection of files, its chunks are stored in their own partition with
+    their own vector index
+    """
+    try:
+        return collection_service.create_collection(collection.name)
+    except CollectionExistsError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+
+
+@router.delete("/{name}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_collection(
+    name: str,
+    collection_service: CollectionService = Depends(get_collection_service),
+):
+    """
+    Deletes a collection with its files, the partition of its chunks is dropped
+    """
+    try:
+        collection_service.delete_collection(name)
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
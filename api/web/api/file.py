@@ -1,52 +1,263 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, status
+import os
+import tempfile
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    status,
+)
 from fastapi_pagination import Page, Params
 
+from api.infra.db.model.collection import DEFAULT_COLLECTION
+from api.infra.db.repository.file import SearchFilter
+from api.settings import settings
 from api.web.schema.file import FileOut
-from api.web.schema.search_file_result import SearchFileResult
-from api.web.service.file import FileService, get_file_service
-from api.web.service.file_chunk import FileChunkService, get_file_chunk_service
+from api.web.schema.ingestion import BulkIngestionOut, IngestionStatusOut
+from api.web.schema.search_file_result import (
+    BatchSearchIn,
+    BatchSearchResultOut,
+    SearchFileResult,
+    SearchSessionPageOut,
+    get_search_filter,
+)
+from api.web.service.bulk_ingestion import (
+    BulkIngestionPipeline,
+    bulk_ingestion_slots,
+    store_uploads,
+)
+from api.web.service.collection import (
+    CollectionNotFoundError,
+    CollectionService,
+    get_collection_service,
+)
+from api.web.service.file import FileService, FileTooLargeError, get_file_service
+from api.web.service.file_chunk import (
+    FileChunkService,
+    SearchMode,
+    get_file_chunk_service,
+)
+from api.web.service.ingestion import (
+    IngestionQueueFullError,
+    IngestionService,
+    get_ingestion_service,
+)
+from api.web.service.search_session import SearchSessionExpiredError
 
 router = APIRouter(prefix="/files", tags=["files"])
+# listing and search endpoints, replaced by the ones of file_async when settings.db_async
+search_router = APIRouter(prefix="/files", tags=["files"])
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=FileOut)
 def create_file(
     file: UploadFile,
-    background_tasks: BackgroundTasks,
+    collection: str = DEFAULT_COLLECTION,
     file_service: FileService = Depends(get_file_service),
-    file_chunk_service: FileChunkService = Depends(get_file_chunk_service),
+    ingestion_service: IngestionService = Depends(get_ingestion_service),
+    collection_service: CollectionService = Depends(get_collection_service),
 ):
     """
-    Creates a file in the files directory and creates its chunks embeddings in background
+    Creates a file of a collection in the files directory and enqueues the creation
+    of its chunks embeddings for the ingestion workers
     """
-    file_db = file_service.create_file(file)
-    background_tasks.add_task(
-        file_chunk_service.create_file_chunks_embedding,
-        file_db.id,
-        file_db.content,
-    )
+    _ensure_collection_exists(collection_service, collection)
+    try:
+        # the uploads are refused before being stored while the queue is full
+        ingestion_service.ensure_capacity()
+        try:
+            file_db = file_service.store_file(file, collection)
+        except FileTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e),
+            ) from e
+        # the file is created with its ingestion job, the depth is checked again
+        ingestion_service.enqueue_file(file_db)
+    except IngestionQueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(settings.ingestion_retry_backoff)},
+        ) from e
     return file_db
 
 
-@router.get("/", response_model=Page[FileOut])
+@router.post(
+    "/batch",
+    status_code=status.HTTP_201_CREATED,
+    response_model=BulkIngestionOut,
+)
+def create_files(
+    files: list[UploadFile],
+    request: Request,
+    collection: str = DEFAULT_COLLECTION,
+    collection_service: CollectionService = Depends(get_collection_service),
+):
+    """
+    Creates many files of a collection, uploaded one by one or in zip and tar
+    archives, and creates their chunks embeddings before responding. The files are
+    parsed, embedded and inserted by overlapping stages, the ones which can not be
+    embedded are enqueued for the ingestion workers. The stages run in the request,
+    with their own pool of parse processes, an API process runs at most
+    settings.bulk_max_concurrent_requests of them and answers 503 to the others.
+    """
+    _ensure_collection_exists(collection_service, collection)
+    if not bulk_ingestion_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many bulk ingestions are running, retry later",
+            headers={"Retry-After": str(settings.ingestion_retry_backoff)},
+        )
+    try:
+        os.makedirs(settings.files_directory, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=settings.files_directory) as directory:
+            try:
+                paths = store_uploads(files, directory)
+            except FileTooLargeError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=str(e),
+                ) from e
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e),
+                ) from e
+            report = BulkIngestionPipeline(
+                request.app.state.db_session_factory,
+                collection=collection,
+            ).run(paths)
+    finally:
+        bulk_ingestion_slots.release()
+    return report.to_dict()
+
+
+@search_router.get("/", response_model=Page[FileOut])
 def get_files(
+    collection: str | None = None,
     file_service: FileService = Depends(get_file_service),
     params: Params = Depends(Params),
 ):
     """
-    Gets all files
+    Gets all files, or the ones of a collection
     """
-    return file_service.get_files(params)
+    return file_service.get_files(params, collection)
 
 
-@router.get("/similar", response_model=Page[SearchFileResult])
+@search_router.get("/similar", response_model=Page[SearchFileResult])
 def get_similar_files(
     question: str,
+    mode: SearchMode = SearchMode.VECTOR,
+    file_chunk_service: FileChunkService = Depends(get_file_chunk_service),
+    params: Params = Depends(Params),
+    search_filter: SearchFilter | None = Depends(get_search_filter),
+    cache_control: str | None = Header(None),
+):
+    """
+    Gets similar files to a question, ranked by embedding similarity (vector), by
+    full-text match (lexical) or by the fusion of both rankings (hybrid). The search
+    can be restricted to a collection, which only scans its partition, to some file
+    ids, to an extension, and to ranges of creation date and size. The result pages
+    are cached until the next ingestion, a Cache-Control: no-cache header runs the
+    search anyway.
+    """
+    return file_chunk_service.search_file_chunks(
+        question,
+        mode,
+        params,
+        use_cache="no-cache" not in (cache_control or "").lower(),
+        search_filter=search_filter,
+    )
+
+
+@search_router.get("/similar/session", response_model=SearchSessionPageOut)
+def get_similar_files_session(
+    question: str | None = None,
+    cursor: str | None = None,
+    mode: SearchMode = SearchMode.VECTOR,
+    size: int = Query(50, ge=1, le=100),
+    file_chunk_service: FileChunkService = Depends(get_file_chunk_service),
+    search_filter: SearchFilter | None = Depends(get_search_filter),
+):
+    """
+    Pages through the files similar to a question without running the search again.
+    The first request, with the question, ranks the files once and returns the first
+    page with the cursor of the next one, the requests with a cursor only read the
+    chunks of their page. A session lives in the worker which created it for
+    settings.search_session_ttl seconds, an expired cursor gets a 410 response.
+    """
+    if cursor is None:
+        if question is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Either a question or a cursor is required",
+            )
+        return file_chunk_service.start_search_session(
+            question,
+            mode,
+            size,
+            search_filter,
+        )
+    try:
+        return file_chunk_service.get_search_session_page(cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
+    except SearchSessionExpiredError as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e)) from e
+
+
+@search_router.post("/similar/batch", response_model=list[BatchSearchResultOut])
+def get_similar_files_batch(
+    batch: BatchSearchIn,
     file_chunk_service: FileChunkService = Depends(get_file_chunk_service),
     params: Params = Depends(Params),
 ):
     """
-    Gets similar files to a question
+    Gets similar files to each of several questions, ranked by embedding similarity.
+    The questions are embedded by one request to the embedding provider and searched
+    by one database statement, the pagination params apply to each question.
+    """
+    pages = file_chunk_service.search_file_chunks_batch(
+        batch.questions,
+        params,
+        batch.collection,
+    )
+    return [
+        {"question": question, "results": page}
+        for question, page in zip(batch.questions, pages)
+    ]
+
+
+def _ensure_collection_exists(
+    collection_service: CollectionService,
+    collection: str,
+) -> None:
+    try:
+        collection_service.get_collection(collection)
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+
+
+@router.get("/{file_id}/ingestion", response_model=IngestionStatusOut)
+def get_file_ingestion(
+    file_id: int,
+    ingestion_service: IngestionService = Depends(get_ingestion_service),
+):
+    """
+    Gets the ingestion state of a file
     """
-    question_embedding = file_chunk_service.create_embedding(question)
-    return file_chunk_service.find_similar_file_chunks(question_embedding, params)
+    ingestion_job = ingestion_service.get_file_ingestion(file_id)
+    if ingestion_job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No ingestion found for file {file_id}",
+        )
+    return ingestion_job
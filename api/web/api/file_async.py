@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi_pagination import Page, Params
+
+from api.infra.db.repository.file import SearchFilter
+from api.web.schema.file import FileOut
+from api.web.schema.search_file_result import (
+    BatchSearchIn,
+    BatchSearchResultOut,
+    SearchFileResult,
+    SearchSessionPageOut,
+    get_search_filter,
+)
+from api.web.service.file import AsyncFileService, get_async_file_service
+from api.web.service.file_chunk import (
+    AsyncFileChunkService,
+    SearchMode,
+    get_async_file_chunk_service,
+)
+from api.web.service.search_session import SearchSessionExpiredError
+
+# async variants of the listing and search endpoints of api.web.api.file
+search_router = APIRouter(prefix="/files", tags=["files"])
+
+
+@search_router.get("/", response_model=Page[FileOut])
+async def get_files(
+    collection: str | None = None,
+    file_service: AsyncFileService = Depends(get_async_file_service),
+    params: Params = Depends(Params),
+):
+    """
+    Gets all files, or the ones of a collection
+    """
+    return await file_service.get_files(params, collection)
+
+
+@search_router.get("/similar", response_model=Page[SearchFileResult])
+async def get_similar_files(
+    question: str,
+    mode: SearchMode = SearchMode.VECTOR,
+    file_chunk_service: AsyncFileChunkService = Depends(get_async_file_chunk_service),
+    params: Params = Depends(Params),
+    search_filter: SearchFilter | None = Depends(get_search_filter),
+    cache_control: str | None = Header(None),
+):
+    """
+    Gets similar files to a question, ranked by embedding similarity (vector), by
+    full-text match (lexical) or by the fusion of both rankings (hybrid). The search
+    can be restricted to a collection, which only scans its partition, to some file
+    ids, to an extension, and to ranges of creation date and size. The result pages
+    are cached until the next ingestion, a Cache-Control: no-cache header runs the
+    search anyway.
+    """
+    return await file_chunk_service.search_file_chunks(
+        question,
+        mode,
+        params,
+        use_cache="no-cache" not in (cache_control or "").lower(),
+        search_filter=search_filter,
+    )
+
+
+@search_router.get("/similar/session", response_model=SearchSessionPageOut)
+async def get_similar_files_session(
+    question: str | None = None,
+    cursor: str | None = None,
+    mode: SearchMode = SearchMode.VECTOR,
+    size: int = Query(50, ge=1, le=100),
+    file_chunk_service: AsyncFileChunkService = Depends(get_async_file_chunk_service),
+    search_filter: SearchFilter | None = Depends(get_search_filter),
+):
+    """
+    Pages through the files similar to a question without running the search again.
+    The first request, with the question, ranks the files once and returns the first
+    page with the cursor of the next one, the requests with a cursor only read the
+    chunks of their page. A session lives in the worker which created it for
+    settings.search_session_ttl seconds, an expired cursor gets a 410 response.
+    """
+    if cursor is None:
+        if question is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Either a question or a cursor is required",
+            )
+        return await file_chunk_service.start_search_session(
+            question,
+            mode,
+            size,
+            search_filter,
+        )
+    try:
+        return await file_chunk_service.get_search_session_page(cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
+    except SearchSessionExpiredError as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e)) from e
+
+
+@search_router.post("/similar/batch", response_model=list[BatchSearchResultOut])
+async def get_similar_files_batch(
+    batch: BatchSearchIn,
+    file_chunk_service: AsyncFileChunkService = Depends(get_async_file_chunk_service),
+    params: Params = Depends(Params),
+):
+    """
+    Gets similar files to each of several questions, ranked by embedding similarity.
+    The questions are embedded by one request to the embedding provider and searched
+    by one database statement, the pagination params apply to each question.
+    """
+    pages = await file_chunk_service.search_file_chunks_batch(
+        batch.questions,
+        params,
+        batch.collection,
+    )
+    return [
+        {"question": question, "results": page}
+        for question, page in zip(batch.questions, pages)
+    ]
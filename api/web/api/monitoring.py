@@ -4,8 +4,14 @@ from sqlalchemy.exc import DatabaseError
 from sqlalchemy.orm import Session
 
 from api.infra.db.dependencies import get_db_session
+from api.infra.db.model.ingestion_job import IngestionJob
+from api.infra.db.repository.ingestion_job import IngestionJobRepository
+from api.metrics import INGESTION_QUEUE_DEPTH, render_metrics
+from api.web.service.embedding_cache import embedding_cache_stats
 
 router = APIRouter()
+# served at the root, where Prometheus scrapes by default
+metrics_router = APIRouter()
 
 
 def is_database_online(session: Session) -> bool:
@@ -31,3 +37,31 @@ def health_check(session: Session = Depends(get_db_session)):
     if is_database_online(session):
         return Response(status_code=200)
     return Response(status_code=500)
+
+
+@router.get("/stats/embedding-cache")
+def embedding_cache_statistics():
+    """
+    Question embedding cache statistics of the worker handling the request.
+
+    :return: the hit and miss counters.
+    """
+    return embedding_cache_stats.to_dict()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def metrics(session: Session = Depends(get_db_session)):
+    """
+    Prometheus metrics of the process handling the request, of all the API processes
+    when PROMETHEUS_MULTIPROC_DIR is set.
+
+    :return: the metrics in the Prometheus text format.
+    """
+    try:
+        INGESTION_QUEUE_DEPTH.set(
+            IngestionJobRepository(IngestionJob, session).count_unfinished(),
+        )
+    except DatabaseError:
+        # the other metrics are still served while the database is down
+        session.rollback()
+    return render_metrics()
@@ -1,3 +1,4 @@
+import time
 from importlib import metadata
 
 from asgi_correlation_id import CorrelationIdMiddleware
@@ -6,7 +7,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import UJSONResponse
 from fastapi_pagination import add_pagination
 
-from api.web.api import api_router
+from api import IMPORTS_STARTED_AT
+from api.metrics import observe_request_latency
+from api.web.api import api_router, monitoring
 from api.web.lifetime import lifespan
 
 
@@ -18,6 +21,7 @@ def get_app() -> FastAPI:
 
     :return: application.
     """
+    start = time.perf_counter()
     app = FastAPI(
         title="semantic search",
         version=metadata.version("api"),
@@ -46,10 +50,18 @@ def get_app() -> FastAPI:
 
     app.add_middleware(CorrelationIdMiddleware)
 
+    app.middleware("http")(observe_request_latency)
+
     add_pagination(app)
 
     # Main router for the API.
     app.include_router(router=api_router, prefix="/api")
+    app.include_router(router=monitoring.metrics_router)
+    # logged with the other startup timings by the lifespan
+    app.state.startup_timings = {
+        "imports": start - IMPORTS_STARTED_AT,
+        "app": time.perf_counter() - start,
+    }
     # # add exception handlers
     # app.add_exception_handler(NotFoundError, not_found_error_handler)
     # app.add_exception_handler(NotCreatedError, not_created_error_handler)
@@ -1,11 +1,13 @@
+import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-from sqlalchemy import create_engine, text
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-from api.infra.db.meta import meta
-from api.infra.db.model import load_all_models
+from api.metrics import register_engine_pool
 from api.settings import settings
 
 
@@ -16,6 +18,7 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
     This function creates SQLAlchemy engine instance,
     session_factory for creating sessions
     and stores them in the application's state property.
+    The engines connect on the first request, not at startup.
 
     :param app: fastAPI application.
     """
@@ -25,36 +28,50 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
         expire_on_commit=False,
     )
     app.state.db_engine = engine
+    register_engine_pool("sync", engine)
     app.state.db_session_factory = session_factory
-    with session_factory() as session:
-        session.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
-        session.commit()
+    if settings.db_async:
+        async_engine = create_async_engine(str(settings.db_async_url))
+        app.state.db_async_engine = async_engine
+        register_engine_pool("async", async_engine.sync_engine)
+        app.state.db_async_session_factory = async_sessionmaker(
+            async_engine,
+            expire_on_commit=False,
+        )
 
 
-def _create_tables() -> None:  # pragma: no cover
-    """Populates tables in the database."""
-    load_all_models()
-    engine = create_engine(str(settings.db_url))
-    with engine.begin() as connection:
-        meta.create_all(connection, checkfirst=True)
-        # create index on vector column
-        connection.execute(
-            text(
-                """
-                CREATE INDEX IF NOT EXISTS idx_vector ON file_chunk USING hnsw (embedding_vector vector_l2_ops);
-                """,
-            ),
-        )
-    engine.dispose()
+def _migrate(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Migrates the database with the engine of the application, only when
+    settings.db_migrate_on_startup is set, `python -m api migrate` does it otherwise.
+
+    :param app: fastAPI application.
+    """
+    from api.infra.db.migration import migrate
+
+    migrate(app.state.db_engine)
 
 
 def _startup(app: FastAPI) -> None:  # noqa: WPS430
+    timings = getattr(app.state, "startup_timings", {})
+    start = time.perf_counter()
     _setup_db(app)
-    _create_tables()
+    timings["database"] = time.perf_counter() - start
+    if settings.db_migrate_on_startup:
+        start = time.perf_counter()
+        _migrate(app)
+        timings["migration"] = time.perf_counter() - start
+    logger.info(
+        f"Worker started in {sum(timings.values()):.3f}s ("
+        + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in timings.items())
+        + ")",
+    )
 
 
-def _shutdown(app: FastAPI) -> None:  # noqa: WPS430
+async def _shutdown(app: FastAPI) -> None:  # noqa: WPS430
     app.state.db_engine.dispose()
+    if settings.db_async:
+        await app.state.db_async_engine.dispose()
 
 
 @asynccontextmanager
@@ -68,4 +85,4 @@ async def lifespan(app: FastAPI) -> None:  # pragma: no cover
     try:
         yield
     finally:
-        _shutdown(app)
+        await _shutdown(app)
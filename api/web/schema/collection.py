@@ -0,0 +1,17 @@
+import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from api.infra.db.model.collection import COLLECTION_NAME_PATTERN
+
+
+class CollectionIn(BaseModel):
+    # the name is part of the name of the partition of the collection chunks
+    name: str = Field(pattern=COLLECTION_NAME_PATTERN)
+
+
+class CollectionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    name: str
+    created_at: datetime.datetime
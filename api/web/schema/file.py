@@ -2,10 +2,13 @@ import datetime
 
 from pydantic import BaseModel, Field, field_validator
 
+from api.infra.db.model.collection import DEFAULT_COLLECTION
+
 
 class FileOut(BaseModel):
     id: int
     name: str
+    collection: str = DEFAULT_COLLECTION
     size: int
     # convert the content field to resume_content, only keeps the first 200 characters
     resume_content: str = Field(
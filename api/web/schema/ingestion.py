@@ -0,0 +1,25 @@
+import datetime
+
+from pydantic import BaseModel, ConfigDict
+
+from api.infra.db.model.ingestion_job import IngestionStatus
+
+
+class IngestionStatusOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    file_id: int
+    status: IngestionStatus
+    attempts: int
+    last_error: str | None = None
+    updated_at: datetime.datetime
+
+
+class BulkIngestionOut(BaseModel):
+    files: int
+    reused_files: int
+    queued_files: int
+    failed_files: int
+    chunks: int
+    elapsed_seconds: float
+    files_per_second: float
+    chunks_per_second: float
@@ -1,16 +1,21 @@
+import datetime
 from typing import Any
 
+from fastapi import Query
+from fastapi_pagination import Page
 from pydantic import BaseModel, ConfigDict, Field, model_validator
-from sqlalchemy import Row
 
-from api.infra.db.model.file import FileChunk
+from api.infra.db.repository.file import SearchFilter, SimilarFileChunk
+from api.settings import settings
 
 
 class SearchFileResult(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     file_id: int
     file_name: str = None
-    similarity: float = None
+    similarity: float | None = None
+    # text rank in lexical mode, reciprocal rank fusion score in hybrid mode
+    score: float | None = None
     file_chunk_id: int = Field(..., alias="id", serialization_alias="file_chunk_id")
     file_chunk_text: str = Field(
         ...,
@@ -20,11 +25,66 @@ class SearchFileResult(BaseModel):
 
     @model_validator(mode="before")
     @classmethod
-    def get_search_result_from_row(cls, data: Row) -> Any:
-        data_file_chunk = data[0]
-        min_distance = data[1]
-        data_dict = data_file_chunk.__dict__
-        if isinstance(data_file_chunk, FileChunk):
-            data_dict["file_name"] = data_file_chunk.file.name
-        data_dict["similarity"] = 1 - min_distance
-        return data_dict
+    def get_search_result_from_similar_file_chunk(cls, data: Any) -> Any:
+        if isinstance(data, SimilarFileChunk):
+            return {
+                "file_id": data.file_id,
+                "file_name": data.file_name,
+                "similarity": None if data.distance is None else 1 - data.distance,
+                "score": data.score,
+                "id": data.file_chunk_id,
+                "chunk_text": data.chunk_text,
+            }
+        return data
+
+
+class BatchSearchIn(BaseModel):
+    # at most one embedding batch, the questions are embedded by a single request
+    questions: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.embedding_batch_size,
+    )
+    # collection of the searched files, all the collections if None
+    collection: str | None = None
+
+
+class BatchSearchResultOut(BaseModel):
+    question: str
+    results: Page[SearchFileResult]
+
+
+class SearchSessionPageOut(BaseModel):
+    items: list[SearchFileResult]
+    # number of files ranked by the session
+    total: int
+    # cursor of the next page, None on the last page
+    next_cursor: str | None = None
+
+
+def get_search_filter(
+    collection: str | None = None,
+    file_ids: list[int] | None = Query(None),
+    extension: str | None = None,
+    created_after: datetime.datetime | None = None,
+    created_before: datetime.datetime | None = None,
+    min_size: int | None = None,
+    max_size: int | None = None,
+) -> SearchFilter | None:
+    """
+    Reads the criteria on the files of a search from the query parameters: the
+    collection, the file ids, the extension of the file names, the creation date
+    from created_after included to created_before excluded, and the size in bytes
+    from min_size to max_size included
+    :return: The criteria, None if no parameter is set
+    """
+    search_filter = SearchFilter(
+        collection=collection,
+        file_ids=None if file_ids is None else tuple(sorted(set(file_ids))),
+        extension=extension,
+        created_after=created_after,
+        created_before=created_before,
+        min_size=min_size,
+        max_size=max_size,
+    )
+    return search_filter if search_filter != SearchFilter() else None
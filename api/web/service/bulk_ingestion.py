@@ -0,0 +1,640 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+
+from fastapi import UploadFile
+from loguru import logger
+from sqlalchemy.orm import Session, sessionmaker
+
+from api.infra.db.model.collection import DEFAULT_COLLECTION
+from api.infra.db.model.file import File, FileChunk
+from api.infra.db.model.ingestion_job import IngestionJob, IngestionStatus
+from api.infra.db.repository.file import (
+    FileChunkRepository,
+    FileRepository,
+    VectorStoreFileChunkRepository,
+)
+from api.infra.db.repository.ingestion_job import IngestionJobRepository
+from api.infra.vector_store import get_vector_store
+from api.metrics import (
+    CHUNK_SECONDS,
+    CHUNKS_STORED,
+    DB_INSERT_SECONDS,
+    PARSE_SECONDS,
+)
+from api.settings import SearchBackendName, settings
+from api.web.service.chunker import TextChunk, TokenChunker
+from api.web.service.file import FileService, FileText, FileTooLargeError
+from api.web.service.file_chunk import FileChunkService
+from api.web.service.file_parser import ParserFactory
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+@dataclass
+class ParsedFile:
+    """File copied to the files directory, parsed and chunked by a parse process."""
+
+    name: str
+    path: str
+    size: int
+    content_hash: str
+    # beginning of the text of the file
+    content: str
+    # None for the files larger than settings.bulk_max_file_size, which are left to
+    # the ingestion workers
+    chunks: list[TextChunk] | None
+    # gzip-compressed text extracted from the file, None for the plain text files
+    text_path: str | None = None
+    # times of the text extraction and of the chunking, the histograms observed by
+    # the parse processes are not exported, the pipeline observes these ones
+    parse_seconds: float = 0.0
+    chunk_seconds: float = 0.0
+
+
+@dataclass
+class EmbeddedFile:
+    """Parsed file with the embeddings of its chunks, or the source of its chunks."""
+
+    parsed_file: ParsedFile
+    embeddings: list[list[float]] | None = None
+    # id of an ingested file with the same bytes, its chunks are copied
+    duplicate_file_id: int | None = None
+    # the file is enqueued for the ingestion workers when its embedding failed
+    error: str | None = None
+
+
+@dataclass
+class BulkIngestionReport:
+    """Counters of a bulk ingestion."""
+
+    files: int = 0
+    reused_files: int = 0
+    queued_files: int = 0
+    failed_files: int = 0
+    chunks: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / max(self.elapsed_seconds, 1e-9)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / max(self.elapsed_seconds, 1e-9)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "files": self.files,
+            "reused_files": self.reused_files,
+            "queued_files": self.queued_files,
+            "failed_files": self.failed_files,
+            "chunks": self.chunks,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "files_per_second": round(self.files_per_second, 2),
+            "chunks_per_second": round(self.chunks_per_second, 2),
+        }
+
+
+# marks the end of the items of a stage queue
+_END = object()
+
+# the bulk ingestions run by the requests of an API process, each one with its own
+# pool of parse processes
+bulk_ingestion_slots = threading.BoundedSemaphore(
+    settings.bulk_max_concurrent_requests,
+)
+
+
+class BulkIngestionPipeline:
+    """
+    Ingests many files with overlapping stages connected by bounded queues:
+
+    - parse: a pool of processes copies each file to the files directory, extracts
+      its text and splits it into chunks
+    - embed: the chunks of consecutive files are embedded together, in concurrent
+      batched calls to the embedding provider
+    - insert: the files and their ingestion jobs are inserted with the ORM and the
+      chunks with COPY, in a transaction per group of files
+
+    A stage blocks when the queue of the next one is full, so the memory is bounded
+    whatever the number of files.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker[Session],
+        file_chunk_service: FileChunkService | None = None,
+        parse_workers: int | None = None,
+        queue_size: int | None = None,
+        collection: str = DEFAULT_COLLECTION,
+    ):
+        self.session_factory = session_factory
+        self.file_chunk_service = file_chunk_service
+        self.parse_workers = parse_workers or settings.bulk_parse_workers
+        self.queue_size = queue_size or settings.bulk_queue_size
+        # collection of all the ingested files
+        self.collection = collection
+        self.report = BulkIngestionReport()
+        self._failed = threading.Event()
+        self._last_progress_log = time.perf_counter()
+
+    def run(self, paths: Iterable[str]) -> BulkIngestionReport:
+        """
+        Ingests files
+        :param paths: The paths of the files, with a supported extension
+        :return: The report of the ingestion
+        """
+        parsed_files: queue.Queue = queue.Queue(self.queue_size)
+        embedded_files: queue.Queue = queue.Queue(self.queue_size)
+        errors: list[BaseException] = []
+        stages = [
+            threading.Thread(
+                target=self._run_stage,
+                args=(self._parse, errors, paths, parsed_files),
+                name="bulk-parse",
+            ),
+            threading.Thread(
+                target=self._run_stage,
+                args=(self._embed, errors, parsed_files, embedded_files),
+                name="bulk-embed",
+            ),
+            threading.Thread(
+                target=self._run_stage,
+                args=(self._insert, errors, embedded_files),
+                name="bulk-insert",
+            ),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+        self.report.elapsed_seconds = time.perf_counter() - self.report.started_at
+        if errors:
+            raise errors[0]
+        self._log_progress()
+        return self.report
+
+    def _run_stage(
+        self,
+        stage: Callable[..., None],
+        errors: list[BaseException],
+        *args: Any,
+    ) -> None:
+        try:
+            stage(*args)
+        except BaseException as e:
+            logger.exception(f"Bulk ingestion stage {stage.__name__} failed")
+            errors.append(e)
+            # the other stages stop instead of waiting on the queues forever
+            self._failed.set()
+
+    def _put(self, output: queue.Queue, item: Any) -> None:
+        while not self._failed.is_set():
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, source: queue.Queue) -> Any:
+        while not self._failed.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _parse(self, paths: Iterable[str], output: queue.Queue) -> None:
+        with ProcessPoolExecutor(
+            max_workers=self.parse_workers,
+            # the pipeline threads make forking unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_process,
+        ) as executor:
+            # a bounded window of files in flight keeps the results in order
+            in_flight: list[tuple[str, Future]] = []
+            for path in paths:
+                if self._failed.is_set():
+                    break
+                in_flight.append(
+                    (path, executor.submit(parse_file, path, settings.files_directory)),
+                )
+                if len(in_flight) >= self.queue_size:
+                    self._put_parsed(*in_flight.pop(0), output)
+            for path, future in in_flight:
+                self._put_parsed(path, future, output)
+        self._put(output, _END)
+
+    def _put_parsed(self, path: str, future: Future, output: queue.Queue) -> None:
+        try:
+            parsed_file = future.result()
+        except Exception as e:
+            logger.error(f"Unable to parse {path}: {e}")
+            self.report.failed_files += 1
+            return
+        PARSE_SECONDS.labels(parsed_file.path.split(".")[-1]).observe(
+            parsed_file.parse_seconds,
+        )
+        if parsed_file.chunks is not None:
+            CHUNK_SECONDS.observe(parsed_file.chunk_seconds)
+        self._put(output, parsed_file)
+
+    def _embed(self, source: queue.Queue, output: queue.Queue) -> None:
+        # enough chunks to keep all the concurrent embedding batches full
+        chunks_per_round = (
+            settings.embedding_batch_size * settings.embedding_max_concurrency
+        )
+        seen_hashes: set[str] = set()
+        pending: list[ParsedFile] = []
+        with self.session_factory() as session:
+            file_repository = FileRepository(File, session)
+            if self.file_chunk_service is None:
+                self.file_chunk_service = FileChunkService(
+                    FileChunkRepository(FileChunk, session),
+                )
+            while (parsed_file := self._get(source)) is not _END:
+                duplicate = None
+                if parsed_file.content_hash not in seen_hashes:
+                    duplicate = file_repository.get_ingested_by_content_hash(
+                        parsed_file.content_hash,
+                    )
+                    session.rollback()
+                if parsed_file.content_hash in seen_hashes or duplicate is not None:
+                    # the chunks are copied from the first file with these bytes
+                    self._flush_embeddings(session, pending, output)
+                    pending = []
+                    self._put(
+                        output,
+                        EmbeddedFile(
+                            parsed_file,
+                            duplicate_file_id=duplicate.id if duplicate else None,
+                        ),
+                    )
+                    continue
+                seen_hashes.add(parsed_file.content_hash)
+                if parsed_file.chunks is None:
+                    # inserted without chunks, the file is enqueued
+                    self._put(output, EmbeddedFile(parsed_file))
+                    continue
+                pending.append(parsed_file)
+                if sum(len(file.chunks) for file in pending) >= chunks_per_round:
+                    self._flush_embeddings(session, pending, output)
+                    pending = []
+            self._flush_embeddings(session, pending, output)
+        self._put(output, _END)
+
+    def _flush_embeddings(
+        self,
+        session: Session,
+        files: list[ParsedFile],
+        output: queue.Queue,
+    ) -> None:
+        if not files:
+            return
+        chunks = [chunk for file in files for chunk in file.chunks]
+        try:
+            embeddings = self.file_chunk_service.embed_chunks(
+                chunks,
+                f"{len(files)} files",
+            )
+        except Exception as e:
+            logger.error(f"Unable to embed {len(files)} files, they are enqueued: {e}")
+            for file in files:
+                self._put(output, EmbeddedFile(file, error=str(e)))
+            return
+        finally:
+            # the stored embeddings are looked up in a transaction closed right away
+            session.rollback()
+        offset = 0
+        for file in files:
+            self._put(
+                output,
+                EmbeddedFile(
+                    file,
+                    embeddings=embeddings[offset : offset + len(file.chunks)],
+                ),
+            )
+            offset += len(file.chunks)
+
+    def _insert(self, source: queue.Queue) -> None:
+        # ids of the files of this ingestion by hash, for the duplicates of the batch
+        file_ids_by_hash: dict[str, int] = {}
+        with self.session_factory() as session:
+            while True:
+                embedded_file = self._get(source)
+                if embedded_file is _END:
+                    return
+                group = [embedded_file]
+                # the files already waiting are inserted in the same transaction
+                while len(group) < settings.bulk_insert_batch_files:
+                    try:
+                        embedded_file = source.get_nowait()
+                    except queue.Empty:
+                        break
+                    if embedded_file is _END:
+                        self._insert_group(session, group, file_ids_by_hash)
+                        return
+                    group.append(embedded_file)
+                self._insert_group(session, group, file_ids_by_hash)
+
+    def _insert_group(
+        self,
+        session: Session,
+        group: list[EmbeddedFile],
+        file_ids_by_hash: dict[str, int],
+    ) -> None:
+        files = [
+            File(
+                name=embedded_file.parsed_file.name,
+                collection=self.collection,
+                path=embedded_file.parsed_file.path,
+                size=embedded_file.parsed_file.size,
+                content_hash=embedded_file.parsed_file.content_hash,
+                content=embedded_file.parsed_file.content,
+                text_path=embedded_file.parsed_file.text_path,
+            )
+            for embedded_file in group
+        ]
+        session.add_all(files)
+        session.flush()
+
+        file_chunk_repository = FileChunkRepository(FileChunk, session)
+        file_chunks, ingested_file_ids, queued_file_ids = [], [], []
+        # (source file id, file id) of the duplicates, copied once the chunks of the
+        # group are inserted, the source file can be one of the group
+        chunk_copies = []
+        for file, embedded_file in zip(files, group):
+            content_hash = embedded_file.parsed_file.content_hash
+            source_file_id = embedded_file.duplicate_file_id or file_ids_by_hash.get(
+                content_hash,
+            )
+            if embedded_file.error is not None or (
+                embedded_file.embeddings is None and source_file_id is None
+            ):
+                # the file, or the file of this ingestion it duplicates, is not embedded,
+                # its embedding failed or it is too large for the stages
+                queued_file_ids.append(file.id)
+                continue
+            ingested_file_ids.append(file.id)
+            if embedded_file.embeddings is None:
+                chunk_copies.append((source_file_id, file.id))
+                continue
+            file_ids_by_hash[content_hash] = file.id
+            file_chunks.extend(
+                (file.id, chunk.text, chunk.content_hash, embedding)
+                for chunk, embedding in zip(
+                    embedded_file.parsed_file.chunks,
+                    embedded_file.embeddings,
+                )
+            )
+        with DB_INSERT_SECONDS.labels("copy").time():
+            file_chunk_repository.copy_in(
+                file_chunks,
+                self.file_chunk_service.embedding_provider.model_name,
+            )
+            for source_file_id, file_id in chunk_copies:
+                file_chunk_repository.copy_file_chunks(source_file_id, file_id)
+            ingestion_job_repository = IngestionJobRepository(IngestionJob, session)
+            ingestion_job_repository.add_many(ingested_file_ids, IngestionStatus.DONE)
+            ingestion_job_repository.add_many(queued_file_ids, IngestionStatus.PENDING)
+            session.commit()
+        CHUNKS_STORED.inc(len(file_chunks))
+
+        if settings.search_backend == SearchBackendName.VECTOR_STORE:
+            vector_store_repository = VectorStoreFileChunkRepository(
+                FileChunk,
+                session,
+                get_vector_store(),
+            )
+            for file_id in ingested_file_ids:
+                vector_store_repository.sync_file_chunks(file_id)
+            session.rollback()
+
+        self.report.files += len(ingested_file_ids)
+        self.report.reused_files += len(chunk_copies)
+        self.report.queued_files += len(queued_file_ids)
+        self.report.chunks += len(file_chunks)
+        if (
+            time.perf_counter() - self._last_progress_log
+            >= settings.bulk_progress_interval
+        ):
+            self._log_progress()
+
+    def _log_progress(self) -> None:
+        self._last_progress_log = time.perf_counter()
+        elapsed = self._last_progress_log - self.report.started_at
+        logger.info(
+            f"Bulk ingestion: {self.report.files} files ({self.report.reused_files} "
+            f"reused), {self.report.chunks} chunks, {self.report.queued_files} queued, "
+            f"{self.report.failed_files} failed in {elapsed:.1f}s "
+            f"({self.report.files / max(elapsed, 1e-9):.1f} files/s, "
+            f"{self.report.chunks / max(elapsed, 1e-9):.1f} chunks/s)",
+        )
+
+
+def _init_parse_process() -> None:
+    # the parse processes already run in parallel, the pages of a PDF are not
+    settings.pdf_workers = 1
+
+
+def parse_file(path: str, folder: str) -> ParsedFile:
+    """
+    Copies a file to the content-addressed files directory, then extracts its text
+    and splits it into chunks, runs in the parse processes. The text is read by parts,
+    the files larger than settings.bulk_max_file_size are not split.
+    :param path: The file path
+    :param folder: The files directory
+    :return: The parsed file
+    """
+    extension = path.split(".")[-1].lower()
+    content_hash = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while block := f.read(settings.upload_block_size):
+            size += len(block)
+            content_hash.update(block)
+    content_path = FileService.get_content_path(
+        folder,
+        content_hash.hexdigest(),
+        extension,
+    )
+    if not os.path.exists(content_path):
+        os.makedirs(os.path.dirname(content_path), exist_ok=True)
+        temporary_path = f"{content_path}.{os.getpid()}.part"
+        shutil.copyfile(path, temporary_path)
+        os.replace(temporary_path, content_path)
+    file_text = FileText(content_path)
+    parse_seconds = [0.0]
+    start = time.perf_counter()
+    if size > settings.bulk_max_file_size:
+        file_text.store()
+        chunks = None
+        parse_seconds[0] = time.perf_counter() - start
+    else:
+        chunks = list(
+            TokenChunker().split_stream(_time_parts(file_text.stream(), parse_seconds)),
+        )
+    return ParsedFile(
+        name=os.path.basename(path),
+        path=content_path,
+        size=size,
+        content_hash=content_hash.hexdigest(),
+        content=file_text.preview,
+        chunks=chunks,
+        text_path=file_text.text_path,
+        parse_seconds=parse_seconds[0],
+        chunk_seconds=(
+            0.0 if chunks is None else time.perf_counter() - start - parse_seconds[0]
+        ),
+    )
+
+
+def _time_parts(parts: Iterator[str], elapsed: list[float]) -> Iterator[str]:
+    """
+    Yields the parts of a text, adding the time spent reading them to elapsed[0]
+    :param parts: The parts of the text
+    :param elapsed: The list holding the elapsed seconds
+    :return: The iterator of the parts
+    """
+    while True:
+        start = time.perf_counter()
+        part = next(parts, None)
+        elapsed[0] += time.perf_counter() - start
+        if part is None:
+            return
+        yield part
+
+
+def find_ingestible_files(directory: str) -> Iterator[str]:
+    """
+    Finds the files of a directory and its subdirectories with a supported extension
+    :param directory: The directory
+    :return: The iterator of the file paths, in a stable order
+    """
+    extensions = tuple(f".{extension}" for extension in ParserFactory.parser_names())
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                yield os.path.join(root, name)
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def extract_archive(archive_path: str, directory: str) -> None:
+    """
+    Extracts a zip or tar archive, the members with absolute paths or paths out of
+    the directory are refused, like the archives with too many members or too large
+    once extracted, checked from their index before anything is extracted
+    :raises ValueError: If the archive is invalid or has unsafe members
+    :raises FileTooLargeError: If the archive is larger than the maximum size once
+    extracted
+    :param archive_path: The archive path
+    :param directory: The directory the members are extracted to
+    """
+    name = os.path.basename(archive_path)
+    try:
+        if archive_path.lower().endswith(".zip"):
+            with zipfile.ZipFile(archive_path) as archive:
+                members = archive.infolist()
+                _check_archive_size(name, [member.file_size for member in members])
+                for member in members:
+                    _check_member_path(directory, member.filename)
+                archive.extractall(directory)
+            return
+        with tarfile.open(archive_path) as archive:
+            _check_archive_size(
+                name,
+                [member.size if member.isfile() else 0 for member in archive],
+            )
+            if hasattr(tarfile, "data_filter"):
+                archive.extractall(directory, filter="data")
+            else:
+                # the extraction filters are missing before Python 3.11.4
+                archive.extractall(directory, members=_data_members(archive, directory))
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ValueError(f"Invalid archive {name}: {e}") from e
+
+
+def _check_member_path(directory: str, member_name: str) -> None:
+    target = os.path.realpath(os.path.join(directory, member_name))
+    if not target.startswith(os.path.realpath(directory) + os.sep):
+        raise ValueError(f"Unsafe path in archive: {member_name}")
+
+
+def _data_members(archive: tarfile.TarFile, directory: str) -> list[tarfile.TarInfo]:
+    """
+    Checks the members of a tar archive like the "data" extraction filter, only
+    the files and directories in the directory are extracted, without the
+    permissions of their owner
+    :param archive: The tar archive
+    :param directory: The directory the members are extracted to
+    :return: The members
+    :raises ValueError: If a member is a link or a special file, or is out of the
+    directory
+    """
+    members = archive.getmembers()
+    for member in members:
+        _check_member_path(directory, member.name)
+        if not (member.isfile() or member.isdir()):
+            raise ValueError(f"Unsafe member in archive: {member.name}")
+        member.mode &= 0o755
+        member.uid = member.gid = None
+        member.uname = member.gname = None
+    return members
+
+
+def _check_archive_size(name: str, member_sizes: list[int]) -> None:
+    if len(member_sizes) > settings.bulk_max_archive_members:
+        raise ValueError(
+            f"Archive {name} has more than {settings.bulk_max_archive_members} members",
+        )
+    if sum(member_sizes) > settings.bulk_max_archive_size:
+        raise FileTooLargeError(
+            f"Archive {name} is larger than {settings.bulk_max_archive_size} bytes "
+            "once extracted",
+        )
+
+
+def store_uploads(files: list[UploadFile], directory: str) -> list[str]:
+    """
+    Streams uploaded files to a directory in fixed-size blocks, the archives are
+    extracted there instead
+    :param files: The uploaded files and archives
+    :param directory: The directory, usually a temporary one
+    :return: The paths of the files with a supported extension
+    """
+    for index, file in enumerate(files):
+        # the uploads of the same name are kept apart
+        upload_directory = os.path.join(directory, str(index))
+        os.makedirs(upload_directory)
+        path = os.path.join(
+            upload_directory,
+            os.path.basename(file.filename or "upload"),
+        )
+        size = 0
+        with open(path, "wb") as f:
+            while block := file.file.read(settings.upload_block_size):
+                size += len(block)
+                if size > settings.max_upload_size:
+                    raise FileTooLargeError(
+                        f"{file.filename} is larger than {settings.max_upload_size} bytes",
+                    )
+                f.write(block)
+        if is_archive(path):
+            extract_archive(path, upload_directory)
+            os.remove(path)
+    return list(find_ingestible_files(directory))
@@ -0,0 +1,200 @@
+import functools
+import hashlib
+import time
+import unicodedata
+from typing import TYPE_CHECKING, Iterable, Iterator, NamedTuple
+
+from api.metrics import CHUNK_SECONDS
+from api.settings import settings
+
+# tiktoken is imported with the first encoding, with its regex and BPE modules
+if TYPE_CHECKING:
+    import tiktoken
+
+
+class TextChunk(NamedTuple):
+    text: str
+    num_tokens: int
+
+    @property
+    def content_hash(self) -> str:
+        return chunk_content_hash(self.text)
+
+
+def chunk_content_hash(text: str) -> str:
+    """
+    Hashes a chunk text, the runs of whitespace are collapsed so that chunks
+    differing by their layout only share their embedding
+    :param text: The chunk text
+    :return: The hexadecimal SHA-256 of the normalized text
+    """
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+@functools.lru_cache
+def get_encoding(encoding_name: str = "cl100k_base") -> "tiktoken.Encoding":
+    """
+    Gets a tiktoken encoding, loaded once per process
+    :param encoding_name: The encoding name
+    :return: The encoding
+    """
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding_name)
+
+
+class TokenChunker:
+    """Splits texts into chunks of a fixed number of tokens."""
+
+    def __init__(
+        self,
+        chunk_size: int | None = None,
+        chunk_overlap: int | None = None,
+        encoding_name: str = "cl100k_base",
+    ):
+        self.chunk_size = chunk_size or settings.chunk_size_tokens
+        self.chunk_overlap = (
+            settings.chunk_overlap_tokens if chunk_overlap is None else chunk_overlap
+        )
+        if not 0 <= self.chunk_overlap < self.chunk_size:
+            raise ValueError(
+                f"Chunk overlap {self.chunk_overlap} must be positive and smaller "
+                f"than the chunk size {self.chunk_size}",
+            )
+        self.encoding_name = encoding_name
+
+    def split(self, text: str) -> list[TextChunk]:
+        """
+        Splits a text into chunks, the text is encoded once and the chunks are cut
+        on token offsets, consecutive chunks share chunk_overlap tokens
+        :param text: The text to be split
+        :return: The chunks with their number of tokens
+        """
+        return list(self.split_stream([text]))
+
+    def split_stream(self, parts: Iterable[str]) -> Iterator[TextChunk]:
+        """
+        Splits a text read by parts into chunks, like split, holding about
+        settings.text_block_size characters of the text and their tokens in memory.
+        The text is encoded by blocks cut before their last run of whitespace and the
+        punctuation before it, which can be encoded with the text following them, so
+        the blocks are encoded like the whole text.
+        :param parts: The parts of the text, in order
+        :return: The iterator of the chunks with their number of tokens
+        """
+        encoding = get_encoding(self.encoding_name)
+        elapsed = 0.0
+        text = ""
+        tokens: list[int] = []
+        for part in parts:
+            text += part
+            if len(text) < settings.text_block_size:
+                continue
+            start = time.perf_counter()
+            end = _encoded_prefix_length(text)
+            # documents can contain special tokens text, it is encoded as regular text
+            tokens.extend(encoding.encode(text[:end], disallowed_special=()))
+            text = text[end:]
+            chunks = self._cut_chunks(encoding, tokens, final=False)
+            elapsed += time.perf_counter() - start
+            yield from chunks
+        start = time.perf_counter()
+        tokens.extend(encoding.encode(text, disallowed_special=()))
+        chunks = self._cut_chunks(encoding, tokens, final=True)
+        CHUNK_SECONDS.observe(elapsed + time.perf_counter() - start)
+        yield from chunks
+
+    def _cut_chunks(
+        self,
+        encoding: "tiktoken.Encoding",
+        tokens: list[int],
+        final: bool,
+    ) -> list[TextChunk]:
+        """
+        Cuts the chunks starting in the first tokens of a text, the tokens which can
+        start the next chunks are left in the list
+        :param encoding: The encoding
+        :param tokens: The tokens not cut yet, consumed in place
+        :param final: Whether the tokens are the last ones of the text
+        :return: The chunks
+        """
+        stride = self.chunk_size - self.chunk_overlap
+        chunks = []
+        # a chunk is cut once the tokens go beyond it, the last one can be shorter
+        while len(tokens) > self.chunk_size or (final and tokens):
+            chunk_tokens = tokens[
+                : _character_boundary(encoding, tokens, self.chunk_size)
+            ]
+            chunk_text = encoding.decode(chunk_tokens)
+            if chunk_text.strip():
+                chunks.append(TextChunk(chunk_text, len(chunk_tokens)))
+            if len(tokens) <= self.chunk_size:
+                tokens.clear()
+                break
+            del tokens[: _character_boundary(encoding, tokens, stride)]
+        return chunks
+
+
+def _character_boundary(
+    encoding: "tiktoken.Encoding",
+    tokens: list[int],
+    offset: int,
+) -> int:
+    """
+    Moves a token offset falling inside a multi-byte UTF-8 character, whose bytes
+    are split between several tokens, back to the first token of the character, or
+    forward when the character starts the tokens
+    :param encoding: The encoding
+    :param tokens: The tokens
+    :param offset: The token offset
+    :return: The offset of a token starting with a whole character
+    """
+    boundary = offset
+    while 0 < boundary < len(tokens) and _starts_inside_character(
+        encoding,
+        tokens[boundary],
+    ):
+        boundary -= 1
+    if boundary > 0:
+        return boundary
+    boundary = offset
+    while boundary < len(tokens) and _starts_inside_character(
+        encoding,
+        tokens[boundary],
+    ):
+        boundary += 1
+    return boundary
+
+
+def _starts_inside_character(encoding: "tiktoken.Encoding", token: int) -> bool:
+    # the continuation bytes of a UTF-8 character are 10xxxxxx
+    return encoding.decode_single_token_bytes(token)[0] & 0xC0 == 0x80
+
+
+def _encoded_prefix_length(text: str) -> int:
+    """
+    Gets the length of the beginning of a text which is encoded like in any longer
+    text, up to its last run of whitespace excluded. The punctuation before the run
+    is excluded too, the encoding keeps the newlines following punctuation with it,
+    like ".\n\n".
+    :param text: The text
+    :return: The length, the whole text when it can not be cut
+    """
+    end = len(text)
+    while end > 0 and not text[end - 1].isspace():
+        end -= 1
+    if end == 0:
+        return len(text)
+    while end > 0 and text[end - 1].isspace():
+        end -= 1
+    while end > 0 and _is_punctuation(text[end - 1]):
+        end -= 1
+    # a space before punctuation is encoded with it
+    if end < len(text) and _is_punctuation(text[end]) and text[end - 1 : end] == " ":
+        end -= 1
+    return end or len(text)
+
+
+def _is_punctuation(character: str) -> bool:
+    # the characters the encoding groups apart from the letters, numbers and spaces
+    return not (character.isspace() or unicodedata.category(character)[0] in ("L", "N"))
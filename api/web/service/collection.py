@@ -0,0 +1,93 @@
+import os
+
+from fastapi import Depends
+from fastapi_pagination import Page, Params
+from loguru import logger
+
+from api.infra.db.model.collection import DEFAULT_COLLECTION, Collection
+from api.infra.db.repository.collection import (
+    CollectionRepository,
+    get_collection_repository,
+)
+from api.infra.db.repository.file import FileRepository, get_file_repository
+from api.infra.vector_store import get_vector_store
+from api.settings import SearchBackendName, settings
+
+
+class CollectionNotFoundError(LookupError):
+    pass
+
+
+class CollectionExistsError(ValueError):
+    pass
+
+
+class CollectionService:
+    def __init__(
+        self,
+        collection_repository: CollectionRepository,
+        file_repository: FileRepository,
+    ):
+        self.collection_repository = collection_repository
+        self.file_repository = file_repository
+
+    def get_collections(self, params: Params = Params()) -> Page[Collection]:
+        """
+        Gets all collections
+        :param params: The pagination params
+        :return: The collections
+        """
+        return self.collection_repository.get_collections(params)
+
+    def get_collection(self, name: str) -> Collection:
+        """
+        Gets a collection by name
+        :param name: The collection name
+        :return: The collection
+        :raise CollectionNotFoundError: If there is no collection with this name
+        """
+        collection = self.collection_repository.get_by_name(name)
+        if collection is None:
+            raise CollectionNotFoundError(f"Collection not found: {name}")
+        return collection
+
+    def create_collection(self, name: str) -> Collection:
+        """
+        Creates a collection, with the partition of its chunks
+        :param name: The collection name
+        :return: The created collection
+        :raise CollectionExistsError: If there is already a collection with this name
+        """
+        if self.collection_repository.get_by_name(name) is not None:
+            raise CollectionExistsError(f"Collection already exists: {name}")
+        return self.collection_repository.create_collection(name)
+
+    def delete_collection(self, name: str) -> None:
+        """
+        Deletes a collection with its files and their chunks, and removes the stored
+        files and their text files which are not used by the files of other collections
+        :param name: The collection name
+        :raise CollectionNotFoundError: If there is no collection with this name
+        """
+        if name == DEFAULT_COLLECTION:
+            raise ValueError("The default collection can not be deleted")
+        files = self.collection_repository.drop_collection(self.get_collection(name))
+        if settings.search_backend == SearchBackendName.VECTOR_STORE:
+            get_vector_store().delete_files([file.id for file in files])
+        paths = {file.path for file in files}
+        unused_paths = paths - self.file_repository.get_used_paths(paths)
+        # a text file is shared like the stored file it is extracted from
+        for file in files:
+            if file.path not in unused_paths:
+                continue
+            for path in (file.path, file.text_path):
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+        logger.info(f"Deleted collection {name} and its {len(files)} files")
+
+
+def get_collection_service(
+    collection_repository: CollectionRepository = Depends(get_collection_repository),
+    file_repository: FileRepository = Depends(get_file_repository),
+) -> CollectionService:
+    return CollectionService(collection_repository, file_repository)
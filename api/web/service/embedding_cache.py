@@ -0,0 +1,250 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from fastapi import Depends
+from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+
+from api.infra.db.repository.embedding_cache import (
+    AsyncEmbeddingCacheRepository,
+    EmbeddingCacheRepository,
+    get_async_embedding_cache_repository,
+    get_embedding_cache_repository,
+)
+from api.settings import settings
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a maximum size and a time to live."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        """
+        Gets a value and marks it as the most recently used
+        :param key: The cache key
+        :return: The value, or None if it is not cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Sets a value, evicting the least recently used ones above the maximum size
+        :param key: The cache key
+        :param value: The value
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class EmbeddingCacheStats:
+    """Hit and miss counters of the question embedding cache of this process."""
+
+    def __init__(self):
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def to_dict(self) -> dict[str, int]:
+        return {
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+        }
+
+
+# the in-process tier and the counters are shared by all the requests of a worker
+question_embeddings = LRUCache(
+    max_size=settings.embedding_cache_size,
+    ttl=settings.embedding_cache_ttl,
+)
+embedding_cache_stats = EmbeddingCacheStats()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of question embeddings: an in-process LRU backed by a table
+    shared by all the workers.
+    """
+
+    def __init__(
+        self,
+        repository: EmbeddingCacheRepository,
+        local_cache: LRUCache = question_embeddings,
+        stats: EmbeddingCacheStats = embedding_cache_stats,
+    ):
+        self.repository = repository
+        self.local_cache = local_cache
+        self.stats = stats
+
+    def get_or_create(
+        self,
+        question: str,
+        model: str,
+        create_embedding: Callable[[str], list[float]],
+    ) -> list[float]:
+        """
+        Gets the embedding of a question from the cache, or creates and caches it
+        :param question: The question
+        :param model: The embedding model name
+        :param create_embedding: The function creating the embedding of a question
+        :return: The embedding float list
+        """
+        key = self.make_key(question, model)
+        embedding = self.local_cache.get(key)
+        if embedding is not None:
+            self.stats.increment("local_hits")
+            return embedding
+
+        embedding = self._get_shared(key)
+        if embedding is not None:
+            self.stats.increment("shared_hits")
+        else:
+            self.stats.increment("misses")
+            embedding = create_embedding(question)
+            self._save_shared(key, model, embedding)
+        self.local_cache.set(key, embedding)
+        return embedding
+
+    def _get_shared(self, key: str) -> list[float] | None:
+        try:
+            return self.repository.get_embedding(
+                key,
+                max_age=settings.embedding_cache_shared_ttl,
+            )
+        except SQLAlchemyError as e:
+            # the shared tier is an optimization, searches must not fail because of it
+            self.repository.session.rollback()
+            logger.warning(f"Unable to read the shared embedding cache: {e}")
+            return None
+
+    def _save_shared(self, key: str, model: str, embedding: list[float]) -> None:
+        try:
+            self.repository.save_embedding(key, model, embedding)
+        except SQLAlchemyError as e:
+            self.repository.session.rollback()
+            logger.warning(f"Unable to write the shared embedding cache: {e}")
+
+    @classmethod
+    def make_key(cls, question: str, model: str) -> str:
+        """
+        Makes the cache key of a question
+        :param question: The question
+        :param model: The embedding model name
+        :return: The hexadecimal SHA-256 of the model name and the normalized question
+        """
+        normalized_question = cls.normalize_question(question)
+        return hashlib.sha256(f"{model}\n{normalized_question}".encode()).hexdigest()
+
+    @classmethod
+    def normalize_question(cls, question: str) -> str:
+        """
+        Normalizes the unicode form and the whitespaces of a question, the case is kept
+        because it changes the embedding
+        :param question: The question
+        :return: The normalized question
+        """
+        return " ".join(unicodedata.normalize("NFKC", question).split())
+
+
+class AsyncEmbeddingCache(EmbeddingCache):
+    """Variant of EmbeddingCache reading and writing the shared tier asynchronously."""
+
+    repository: AsyncEmbeddingCacheRepository
+
+    async def get_or_create(
+        self,
+        question: str,
+        model: str,
+        create_embedding: Callable[[str], Awaitable[list[float]]],
+    ) -> list[float]:
+        """
+        Gets the embedding of a question from the cache, or creates and caches it
+        :param question: The question
+        :param model: The embedding model name
+        :param create_embedding: The coroutine function creating the embedding of a question
+        :return: The embedding float list
+        """
+        key = self.make_key(question, model)
+        embedding = self.local_cache.get(key)
+        if embedding is not None:
+            self.stats.increment("local_hits")
+            return embedding
+
+        embedding = await self._get_shared(key)
+        if embedding is not None:
+            self.stats.increment("shared_hits")
+        else:
+            self.stats.increment("misses")
+            embedding = await create_embedding(question)
+            await self._save_shared(key, model, embedding)
+        self.local_cache.set(key, embedding)
+        return embedding
+
+    async def _get_shared(self, key: str) -> list[float] | None:
+        try:
+            return await self.repository.get_embedding(
+                key,
+                max_age=settings.embedding_cache_shared_ttl,
+            )
+        except SQLAlchemyError as e:
+            await self.repository.session.rollback()
+            logger.warning(f"Unable to read the shared embedding cache: {e}")
+            return None
+
+    async def _save_shared(self, key: str, model: str, embedding: list[float]) -> None:
+        try:
+            await self.repository.save_embedding(key, model, embedding)
+        except SQLAlchemyError as e:
+            await self.repository.session.rollback()
+            logger.warning(f"Unable to write the shared embedding cache: {e}")
+
+
+def get_embedding_cache(
+    repository: EmbeddingCacheRepository = Depends(get_embedding_cache_repository),
+) -> EmbeddingCache | None:
+    if not settings.embedding_cache_enabled:
+        return None
+    return EmbeddingCache(repository)
+
+
+def get_async_embedding_cache(
+    repository: AsyncEmbeddingCacheRepository = Depends(
+        get_async_embedding_cache_repository,
+    ),
+) -> AsyncEmbeddingCache | None:
+    if not settings.embedding_cache_enabled:
+        return None
+    return AsyncEmbeddingCache(repository)
@@ -0,0 +1,185 @@
+import asyncio
+import functools
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, Type
+
+import numpy as np
+
+from api.settings import settings
+
+# the openai client and its pydantic models are imported with the first client, the
+# processes using another provider never import them
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+    from openai.types import CreateEmbeddingResponse
+
+
+# Base Embedding Provider Interface
+class EmbeddingProvider(ABC):
+    @property
+    @abstractmethod
+    def model_name(self) -> str:
+        pass
+
+    @abstractmethod
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds a batch of texts
+        :param texts: The texts to be embedded
+        :return: The embedding float lists, in the same order as the texts
+        """
+        pass
+
+    async def aembed_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds a batch of texts without blocking the event loop
+        :param texts: The texts to be embedded
+        :return: The embedding float lists, in the same order as the texts
+        """
+        return await asyncio.to_thread(self.embed_batch, texts)
+
+
+# Concrete Provider calling the OpenAI embeddings API
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(
+        self,
+        client: "OpenAI | None" = None,
+        model: str | None = None,
+        async_client: "AsyncOpenAI | None" = None,
+    ):
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI(api_key=settings.OPENAI_API_KEY or None)
+        self.client = client
+        self.async_client = async_client
+        self.model = model or settings.embedding_model
+
+    @property
+    def model_name(self) -> str:
+        return self.model
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        response = self.client.embeddings.create(
+            model=self.model,
+            input=[text.replace("\n", " ") for text in texts],
+        )
+        return self._sorted_embeddings(response)
+
+    async def aembed_batch(self, texts: list[str]) -> list[list[float]]:
+        if self.async_client is None:
+            from openai import AsyncOpenAI
+
+            self.async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY or None)
+        response = await self.async_client.embeddings.create(
+            model=self.model,
+            input=[text.replace("\n", " ") for text in texts],
+        )
+        return self._sorted_embeddings(response)
+
+    @classmethod
+    def _sorted_embeddings(
+        cls,
+        response: "CreateEmbeddingResponse",
+    ) -> list[list[float]]:
+        # the API does not guarantee the order of the returned embeddings
+        data = sorted(response.data, key=lambda embedding: embedding.index)
+        return [embedding.embedding for embedding in data]
+
+
+# Concrete Provider computing embeddings on the CPU, without any network call
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeds texts with hashed character n-gram counts projected to the embedding
+    dimensions by a fixed random matrix. The embeddings only capture lexical
+    similarity, they are meant for internal corpora and load tests.
+    """
+
+    ngram_sizes = (3, 4)
+    n_features = 4096
+    fnv_prime = np.uint64(1099511628211)
+    seed = 42
+
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+
+    @property
+    def model_name(self) -> str:
+        return f"local-hashed-ngrams-{self.dimensions}"
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        rows, features = [], []
+        for row, text in enumerate(texts):
+            feature_ids = self._hash_ngrams(text)
+            rows.append(np.full(len(feature_ids), row))
+            features.append(feature_ids)
+        counts = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        if rows:
+            np.add.at(counts, (np.concatenate(rows), np.concatenate(features)), 1)
+        embeddings = np.log1p(counts) @ self._projection(self.dimensions)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return (embeddings / norms).tolist()
+
+    @classmethod
+    def _hash_ngrams(cls, text: str) -> np.ndarray:
+        """
+        Hashes the character n-grams of a text to feature ids
+        :param text: The text
+        :return: The feature id of each n-gram
+        """
+        normalized = f" {' '.join(text.lower().split())} ".encode()
+        data = np.frombuffer(normalized, dtype=np.uint8).astype(np.uint64)
+        feature_ids = []
+        for size in cls.ngram_sizes:
+            if len(data) < size:
+                continue
+            count = len(data) - size + 1
+            # FNV-1 hash of every window of size bytes, computed for all the windows at once
+            hashes = np.full(count, size, dtype=np.uint64)
+            for offset in range(size):
+                hashes = (hashes * cls.fnv_prime) ^ data[offset : offset + count]
+            feature_ids.append(hashes % np.uint64(cls.n_features))
+        if not feature_ids:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(feature_ids).astype(np.int64)
+
+    @classmethod
+    @functools.lru_cache
+    def _projection(cls, dimensions: int) -> np.ndarray:
+        rng = np.random.default_rng(cls.seed)
+        projection = rng.standard_normal((cls.n_features, dimensions), dtype=np.float32)
+        return projection / np.float32(np.sqrt(dimensions))
+
+
+# Provider Factory with Registration System
+class EmbeddingProviderFactory:
+    _providers: Dict[str, Type[EmbeddingProvider]] = {}
+
+    @classmethod
+    def register_provider(cls, name: str, provider: Type[EmbeddingProvider]) -> None:
+        cls._providers[name] = provider
+
+    @classmethod
+    def get_provider(cls, name: str) -> EmbeddingProvider:
+        provider = cls._providers.get(name)
+        if not provider:
+            raise ValueError(f"No embedding provider found for name: {name}")
+        return provider()
+
+    @classmethod
+    def provider_names(cls) -> list[str]:
+        return list(cls._providers.keys())
+
+
+EmbeddingProviderFactory.register_provider("openai", OpenAIEmbeddingProvider)
+EmbeddingProviderFactory.register_provider("local", LocalEmbeddingProvider)
+
+
+@functools.lru_cache
+def get_embedding_provider() -> EmbeddingProvider:
+    """
+    Gets the embedding provider selected in the settings, created on first use
+    and shared by all the requests of a worker.
+    """
+    return EmbeddingProviderFactory.get_provider(settings.embedding_provider.value)
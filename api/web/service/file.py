@@ -1,55 +1,229 @@
-import io
+import gzip
+import hashlib
 import os
-import shutil
+import tempfile
+import threading
+from typing import Any, Iterator
 
 from fastapi import Depends, UploadFile
 from fastapi_pagination import Page, Params
 
+from api.infra.db.model.collection import DEFAULT_COLLECTION
 from api.infra.db.model.file import File
-from api.infra.db.repository.file import FileRepository, get_file_repository
+from api.infra.db.repository.file import (
+    AsyncFileRepository,
+    FileRepository,
+    get_async_file_repository,
+    get_file_repository,
+)
+from api.settings import settings
 from api.web.schema.file import FileOut
 from api.web.service.file_parser import FileParser
 
 
+# number of characters of the beginning of the text of a file kept in its row
+TEXT_PREVIEW_LENGTH = 200
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+class FileText:
+    """
+    Text of a stored file read once by parts, keeping its beginning as a preview.
+    The text extracted from the files which are not plain text is written
+    gzip-compressed next to them while it is read, so that the ingestion workers
+    do not extract it again.
+    """
+
+    def __init__(self, path: str):
+        self.parser = FileParser(path)
+        self.text_path = (
+            None if self.parser.parser.plain_text else FileService.get_text_path(path)
+        )
+        self.preview = ""
+
+    def stream(self) -> Iterator[str]:
+        """
+        Yields the text of the file, the text file is complete once it is consumed
+        :return: The iterator of the text parts
+        """
+        if self.text_path is None:
+            yield from self._read_preview(self.parser.stream())
+            return
+        temporary_path = f"{self.text_path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with gzip.open(
+                temporary_path,
+                "wt",
+                encoding="utf-8",
+                compresslevel=settings.text_compress_level,
+            ) as f:
+                for part in self._read_preview(self.parser.stream()):
+                    f.write(part)
+                    yield part
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        os.replace(temporary_path, self.text_path)
+
+    def store(self) -> None:
+        """Reads the text of the file for its preview and its text file."""
+        for _ in self.stream():
+            pass
+
+    def _read_preview(self, parts: Iterator[str]) -> Iterator[str]:
+        for part in parts:
+            if len(self.preview) < TEXT_PREVIEW_LENGTH:
+                self.preview += part[: TEXT_PREVIEW_LENGTH - len(self.preview)]
+            yield part
+
+
 class FileService:
     def __init__(self, file_repository: FileRepository):
         self.file_repository = file_repository
 
-    def create_file(self, file: UploadFile) -> File:
+    def create_file(
+        self,
+        file: UploadFile,
+        collection: str = DEFAULT_COLLECTION,
+    ) -> File:
         """
-        Creates a file in the files directory
+        Creates a file in the files directory, stored under the hash of its bytes.
+        The content of a file uploaded before with the same bytes is reused.
         :param file: The file to be created
+        :param collection: The collection of the file
         :return: The file path
         """
+        return self.file_repository.create(self.store_file(file, collection))
+
+    def store_file(
+        self,
+        file: UploadFile,
+        collection: str = DEFAULT_COLLECTION,
+    ) -> File:
+        """
+        Stores an uploaded file in the files directory like create_file, without
+        creating its row
+        :param file: The uploaded file
+        :param collection: The collection of the file
+        :return: The file, not added to the database
+        """
         allowed_extensions = ["txt", "pdf"]
         extension = file.filename.split(".")[-1]
         if extension not in allowed_extensions:
             raise ValueError(f"Unsupported file extension: {extension}")
 
-        folder = "files"
-        if not os.path.exists(folder):
-            os.mkdir(folder)
-        file_path = os.path.join(folder, file.filename)
-
-        with open(file_path, "wb+") as f:
-            file_like_object = io.BytesIO(file.file.read())
-            shutil.copyfileobj(file_like_object, f)
-        content_parser = FileParser(file_path)
-        file_text_content = content_parser.parse()
-        file_model = File(
+        folder = settings.files_directory
+        os.makedirs(folder, exist_ok=True)
+        temporary_path, content_hash, size = self._store_upload(file, folder)
+        file_path = self.get_content_path(folder, content_hash, extension)
+
+        duplicate = self.file_repository.get_by_content_hash(content_hash)
+        if duplicate is not None and os.path.exists(file_path):
+            os.remove(temporary_path)
+            preview = (duplicate.content or "")[:TEXT_PREVIEW_LENGTH]
+            text_path = duplicate.text_path
+        else:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(temporary_path, file_path)
+            # the text is read by parts, only its preview is kept in memory
+            file_text = FileText(file_path)
+            file_text.store()
+            preview, text_path = file_text.preview, file_text.text_path
+        return File(
             name=file.filename,
+            collection=collection,
             path=file_path,
-            size=os.path.getsize(file_path),
-            content=file_text_content,
+            size=size,
+            content_hash=content_hash,
+            content=preview,
+            text_path=text_path,
+        )
+
+    @classmethod
+    def _store_upload(cls, file: UploadFile, folder: str) -> tuple[str, str, int]:
+        """
+        Streams an upload to a temporary file in fixed-size blocks, hashing its bytes
+        :param file: The uploaded file
+        :param folder: The folder of the temporary file
+        :return: The temporary file path, the hexadecimal SHA-256 and the size of the file
+        """
+        content_hash = hashlib.sha256()
+        size = 0
+        f = tempfile.NamedTemporaryFile(dir=folder, suffix=".part", delete=False)
+        try:
+            with f:
+                while block := file.file.read(settings.upload_block_size):
+                    size += len(block)
+                    if size > settings.max_upload_size:
+                        raise FileTooLargeError(
+                            f"File is larger than {settings.max_upload_size} bytes",
+                        )
+                    content_hash.update(block)
+                    f.write(block)
+        except BaseException:
+            os.remove(f.name)
+            raise
+        return f.name, content_hash.hexdigest(), size
+
+    @classmethod
+    def get_content_path(cls, folder: str, content_hash: str, extension: str) -> str:
+        """
+        Gets the content-addressed path of a file, files are spread in two levels of
+        directories named after the first characters of their hash
+        :param folder: The files folder
+        :param content_hash: The hexadecimal SHA-256 of the file bytes
+        :param extension: The file extension
+        :return: The file path
+        """
+        return os.path.join(
+            folder,
+            content_hash[:2],
+            content_hash[2:4],
+            f"{content_hash}.{extension}",
         )
-        return self.file_repository.create(file_model)
 
-    def get_files(self, params: Params = Params()) -> Page[File]:
+    @classmethod
+    def get_text_path(cls, path: str) -> str:
+        """
+        Gets the path of the gzip-compressed text extracted from a file
+        :param path: The file path
+        :return: The text file path, next to the file
+        """
+        return f"{path}.txt.gz"
+
+    @classmethod
+    def stream_text(cls, file: File) -> Iterator[str]:
+        """
+        Yields the text of a file by parts, read from its text file when it has one
+        and from the file itself otherwise
+        :param file: The file
+        :return: The iterator of the text parts
+        """
+        if file.text_path is None or not os.path.exists(file.text_path):
+            # the plain text files, and the files stored before their text files
+            yield from FileParser(file.path).stream()
+            return
+        with gzip.open(file.text_path, "rt", encoding="utf-8") as f:
+            while part := f.read(settings.text_block_size):
+                yield part
+
+    def get_files(
+        self,
+        params: Params = Params(),
+        collection: str | None = None,
+    ) -> Page[Any]:
         """
         Gets all files
+        :param collection: The collection of the files, all the collections if None
         :return: The files
         """
-        return self.file_repository.get_many(params=params)
+        return self.file_repository.get_files_overview(
+            params=params,
+            collection=collection,
+        )
 
     def find_file_by_id(self, file_id: int) -> FileOut:
         """
@@ -61,6 +235,7 @@ class FileService:
         return FileOut(
             id=file.id,
             name=file.name,
+            collection=file.collection,
             size=file.size,
             resume_content=file.content[:100],
             created_at=file.created_at,
@@ -68,7 +243,35 @@ class FileService:
         )
 
 
+class AsyncFileService:
+    """Variant of FileService for the async request path."""
+
+    def __init__(self, file_repository: AsyncFileRepository):
+        self.file_repository = file_repository
+
+    async def get_files(
+        self,
+        params: Params = Params(),
+        collection: str | None = None,
+    ) -> Page[Any]:
+        """
+        Gets all files
+        :param collection: The collection of the files, all the collections if None
+        :return: The files
+        """
+        return await self.file_repository.get_files_overview(
+            params=params,
+            collection=collection,
+        )
+
+
 def get_file_service(
     file_repository: FileRepository = Depends(get_file_repository),
 ) -> FileService:
     return FileService(file_repository)
+
+
+def get_async_file_service(
+    file_repository: AsyncFileRepository = Depends(get_async_file_repository),
+) -> AsyncFileService:
+    return AsyncFileService(file_repository)
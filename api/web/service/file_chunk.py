@@ -1,52 +1,176 @@
-from typing import Any
+import asyncio
+import dataclasses
+import enum
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Awaitable, Callable, Iterable
 
-import tiktoken
 from fastapi import Depends
-from fastapi_pagination import Page, Params
+from fastapi_pagination import Page, Params, paginate
 from loguru import logger
-from openai import OpenAI
+from prometheus_client import Histogram
+from prometheus_client.context_managers import Timer
 
 from api.infra.db.model.file import FileChunk
-from api.infra.db.repository.file import FileChunkRepository, get_file_chunk_repository
+from api.infra.db.repository.file import (
+    AsyncFileChunkRepository,
+    FileChunkRepository,
+    SearchFilter,
+    SimilarFileChunk,
+    get_async_file_chunk_repository,
+    get_file_chunk_repository,
+)
+from api.metrics import (
+    CHUNKS_STORED,
+    DB_INSERT_SECONDS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_REQUEST_SECONDS,
+    SEARCH_QUERY_SECONDS,
+    TOKENS_EMBEDDED,
+)
+from api.settings import SearchBackendName, settings
+from api.web.service.chunker import TextChunk, TokenChunker, get_encoding
+from api.web.service.embedding_cache import (
+    AsyncEmbeddingCache,
+    EmbeddingCache,
+    get_async_embedding_cache,
+    get_embedding_cache,
+)
+from api.web.service.embedding_provider import (
+    EmbeddingProvider,
+    get_embedding_provider,
+)
+from api.web.service.search_cache import (
+    AsyncSearchResultCache,
+    SearchResultCache,
+    get_async_search_result_cache,
+    get_search_result_cache,
+)
+from api.web.service.search_session import (
+    SearchSession,
+    SearchSessionExpiredError,
+    SearchSessionPage,
+    SearchSessionStore,
+    decode_cursor,
+    make_search_session_page,
+    search_sessions,
+)
+
+
+class SearchMode(str, enum.Enum):  # noqa: WPS600
+    """Possible ways of ranking the files of a search."""
+
+    VECTOR = "vector"
+    LEXICAL = "lexical"
+    HYBRID = "hybrid"
 
 
 class FileChunkService:
     def __init__(
         self,
         file_chunk_repository: FileChunkRepository,
-        openai: OpenAI = OpenAI(),
+        embedding_provider: EmbeddingProvider | None = None,
+        embedding_cache: EmbeddingCache | None = None,
+        chunker: TokenChunker | None = None,
+        search_result_cache: SearchResultCache | None = None,
+        search_session_store: SearchSessionStore | None = None,
     ):
         self.file_chunk_repository = file_chunk_repository
-        self.openai = openai
+        self.embedding_provider = embedding_provider or get_embedding_provider()
+        self.embedding_cache = embedding_cache
+        self.chunker = chunker or TokenChunker()
+        self.search_result_cache = search_result_cache
+        self.search_session_store = (
+            search_sessions if search_session_store is None else search_session_store
+        )
 
     def create_file_chunks_embedding(
         self,
         file_id: int,
-        file_text_content: str,
+        file_text_content: str | Iterable[str],
+        on_group_stored: Callable[[], None] | None = None,
     ) -> None:
         """
-        Creates chunks embeddings from a file text content
+        Creates chunks embeddings from a file text content. The chunks are embedded
+        and inserted by groups of settings.ingestion_chunk_group_size, the text read
+        by parts is never held whole in memory.
         :param file_id: The file id
-        :param file_text_content: The file text content
+        :param file_text_content: The file text content, or its parts in order
+        :param on_group_stored: Called after each group of chunks is committed, an
+        exception it raises stops the creation
         """
-        chunks = []
-        if self.num_tokens_from_string(file_text_content) <= 512:
-            chunks.append(file_text_content)
-        else:
-            chunks = self.split_text_into_chunks(file_text_content)
-        estimated_cost = self.calculate_embedding_cost(file_text_content)
+        start = time.perf_counter()
+        chunks = iter(
+            self.chunker.split(file_text_content)
+            if isinstance(file_text_content, str)
+            else self.chunker.split_stream(file_text_content),
+        )
+        num_chunks = 0
+        while group := list(islice(chunks, settings.ingestion_chunk_group_size)):
+            embeddings = self.embed_chunks(group, f"file {file_id}")
+            file_chunks = [
+                FileChunk(
+                    file_id=file_id,
+                    chunk_text=chunk.text,
+                    content_hash=chunk.content_hash,
+                    embedding_vector=embedding,
+                    embedding_model=self.embedding_provider.model_name,
+                )
+                for chunk, embedding in zip(group, embeddings)
+            ]
+            with DB_INSERT_SECONDS.labels("orm").time():
+                self.file_chunk_repository.create_many(file_chunks)
+            CHUNKS_STORED.inc(len(file_chunks))
+            num_chunks += len(file_chunks)
+            if on_group_stored is not None:
+                on_group_stored()
+        elapsed = time.perf_counter() - start
         logger.info(
-            f"Embedding file {file_id}, Estimated cost for embedding: {estimated_cost} USD",
-        )
-        for chunk in chunks:
-            embedding = self.create_embedding(chunk)
-            file_chunk = FileChunk(
-                file_id=file_id,
-                chunk_text=chunk,
-                embedding_vector=embedding,
-            )
-            self.file_chunk_repository.create(file_chunk)
-        logger.info(f"Finished embedding file {file_id}")
+            f"Finished embedding file {file_id}: {num_chunks} chunks "
+            f"in {elapsed:.2f}s ({num_chunks / max(elapsed, 1e-9):.1f} chunks/s)",
+        )
+
+    def embed_chunks(
+        self,
+        chunks: list[TextChunk],
+        description: str,
+    ) -> list[list[float]]:
+        """
+        Gets the embeddings of chunks, the stored embeddings of the same model of the
+        chunks with the same content hash are reused and only the other chunks are
+        embedded
+        :param chunks: The chunks
+        :param description: The description of the chunks in the logs, like file 1
+        :return: The embeddings, in the same order as the chunks
+        """
+        content_hashes = [chunk.content_hash for chunk in chunks]
+        embeddings_by_hash = self.file_chunk_repository.get_embeddings_by_content_hash(
+            set(content_hashes),
+            self.embedding_provider.model_name,
+        )
+        hits = sum(
+            content_hash in embeddings_by_hash for content_hash in content_hashes
+        )
+        # the chunks repeated in the text are embedded once
+        missing_chunks = {
+            content_hash: chunk
+            for content_hash, chunk in zip(content_hashes, chunks)
+            if content_hash not in embeddings_by_hash
+        }
+        num_tokens = sum(chunk.num_tokens for chunk in missing_chunks.values())
+        estimated_cost = self.calculate_embedding_cost_from_tokens(num_tokens)
+        logger.info(
+            f"Embedding {description}, {len(chunks)} chunks: {hits} hits, "
+            f"{len(chunks) - hits} misses ({len(missing_chunks)} distinct) "
+            f"of {num_tokens} tokens, Estimated cost for embedding: {estimated_cost} USD",
+        )
+        embeddings = self.create_embeddings(
+            [chunk.text for chunk in missing_chunks.values()],
+        )
+        TOKENS_EMBEDDED.inc(num_tokens)
+        embeddings_by_hash.update(zip(missing_chunks, embeddings))
+        return [embeddings_by_hash[content_hash] for content_hash in content_hashes]
 
     def create_embedding(self, text: str) -> list[float]:
         """
@@ -54,70 +178,337 @@ class FileChunkService:
         :param text: The text to be embedded
         :return: The embedding float list
         """
-        response = self.openai.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text.replace("\n", " "),
+        return self.create_embeddings([text])[0]
+
+    def create_question_embedding(self, question: str) -> list[float]:
+        """
+        Creates the embedding of a search question, reusing the cached one if any
+        :param question: The question
+        :return: The embedding float list
+        """
+        if self.embedding_cache is None:
+            return self.create_embedding(question)
+        return self.embedding_cache.get_or_create(
+            question,
+            self.embedding_provider.model_name,
+            self.create_embedding,
         )
-        return response.data[0].embedding
+
+    def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """
+        Creates embeddings for a list of texts, sending them to the embedding provider
+        in batches with a bounded number of batches in flight
+        :param texts: The texts to be embedded
+        :return: The embedding float lists, in the same order as the texts
+        """
+        batch_size = settings.embedding_batch_size
+        batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+
+        def embed_batch(batch: list[str]) -> list[list[float]]:
+            EMBEDDING_BATCH_SIZE.observe(len(batch))
+            model_name = self.embedding_provider.model_name
+            with EMBEDDING_REQUEST_SECONDS.labels(model_name).time():
+                return self.embedding_provider.embed_batch(batch)
+
+        if len(batches) <= 1:
+            return [embedding for batch in batches for embedding in embed_batch(batch)]
+        max_workers = min(settings.embedding_max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(embed_batch, batches)
+            return [embedding for batch in results for embedding in batch]
 
     def find_similar_file_chunks(
         self,
         question_embedding: list[float],
         params: Params = Params(),
-    ) -> Page[Any]:
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
         """
         Finds similar top k files to a question embedding using file chunks
         :param params:
         :param question_embedding: The question embedding
+        :param search_filter: The criteria on the files, all the files if None
         :return: The similar file chunks
         """
         file_chunks = self.file_chunk_repository.find_similar_file_chunks(
             question_embedding,
             params,
+            search_filter,
         )
 
         return file_chunks
 
+    def search_file_chunks(
+        self,
+        question: str,
+        mode: SearchMode = SearchMode.VECTOR,
+        params: Params = Params(),
+        use_cache: bool = True,
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Finds the best chunk of the files matching a question
+        :param question: The question
+        :param mode: The ranking of the files, by embedding similarity, by full-text
+        match without any embedding call, or by both
+        :param params: The pagination params
+        :param use_cache: Whether to return the cached result page if any
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The best chunk of each file
+        """
+        if mode == SearchMode.VECTOR:
+            # the results only depend on the question embedding, shared by the
+            # questions differing by their whitespaces
+            question_embedding = self.create_question_embedding(question)
+            return self._cached_search(
+                mode,
+                question_embedding,
+                params,
+                use_cache,
+                lambda: self._search_similar_file_chunks(
+                    question_embedding,
+                    params,
+                    search_filter,
+                ),
+                search_filter,
+            )
+        search = (
+            self._search_lexical_file_chunks
+            if mode == SearchMode.LEXICAL
+            else self._search_hybrid_file_chunks
+        )
+        return self._cached_search(
+            mode,
+            question,
+            params,
+            use_cache,
+            lambda: search(question, params, search_filter),
+            search_filter,
+        )
+
+    def search_file_chunks_batch(
+        self,
+        questions: list[str],
+        params: Params = Params(),
+        collection: str | None = None,
+    ) -> list[Page[SimilarFileChunk]]:
+        """
+        Finds the best chunk of the files similar to each of several questions, the
+        questions are embedded together and ranked by a single statement. The caches
+        are bypassed, a batch is usually a set of distinct questions run once.
+        :param questions: The questions
+        :param params: The pagination params of the results of each question
+        :param collection: The collection of the files, all the collections if None
+        :return: The best chunk of each file for each question, in the order of the questions
+        """
+        # the repeated questions are embedded and ranked once
+        unique_questions = list(dict.fromkeys(questions))
+        question_embeddings = self.create_embeddings(unique_questions)
+        with _time_search_query(SearchMode.VECTOR):
+            rankings = self.file_chunk_repository.rank_similar_file_chunks_batch(
+                question_embeddings,
+                params.page * params.size,
+                collection,
+            )
+        pages = {
+            question: paginate(ranking, params=params)
+            for question, ranking in zip(unique_questions, rankings)
+        }
+        return [pages[question] for question in questions]
+
+    def rank_file_chunks(
+        self,
+        question: str,
+        mode: SearchMode,
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        """
+        Ranks the files matching a question, without pagination
+        :param question: The question
+        :param mode: The ranking of the files
+        :param files_needed: The number of files to rank
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The best chunk of each file, best file first
+        """
+        if mode == SearchMode.VECTOR:
+            question_embedding = self.create_question_embedding(question)
+            with _time_search_query(mode):
+                return self.file_chunk_repository.rank_similar_file_chunks(
+                    question_embedding,
+                    files_needed,
+                    search_filter,
+                )
+        if mode == SearchMode.LEXICAL:
+            with _time_search_query(mode):
+                return self.file_chunk_repository.rank_lexical_file_chunks(
+                    question,
+                    files_needed,
+                    search_filter,
+                )
+        return self._rank_hybrid_file_chunks(question, files_needed, search_filter)
+
+    def start_search_session(
+        self,
+        question: str,
+        mode: SearchMode = SearchMode.VECTOR,
+        size: int = 50,
+        search_filter: SearchFilter | None = None,
+    ) -> SearchSessionPage:
+        """
+        Ranks the files matching a question once for all the pages of a search
+        session, the next pages are read with get_search_session_page
+        :param question: The question
+        :param mode: The ranking of the files
+        :param size: The number of files of a page
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The first page, with the cursor of the next one
+        """
+        # a ranking larger than the store could not be paged through
+        files_needed = min(
+            settings.search_session_max_files,
+            self.search_session_store.max_files,
+        )
+        ranking = self.rank_file_chunks(
+            question,
+            mode,
+            files_needed,
+            search_filter,
+        )[:files_needed]
+        session = SearchSession.from_ranking(ranking, size)
+        session_id = self.search_session_store.add(session)
+        return make_search_session_page(session, session_id, 0, ranking[:size])
+
+    def get_search_session_page(self, cursor: str) -> SearchSessionPage:
+        """
+        Reads a page of a search session, only the chunks of the page are queried
+        :param cursor: The cursor of the page
+        :return: The page, with the cursor of the next one
+        :raise ValueError: If the cursor is malformed
+        :raise SearchSessionExpiredError: If the session is expired
+        """
+        session_id, offset = decode_cursor(cursor)
+        session = self.search_session_store.get(session_id)
+        if session is None:
+            raise SearchSessionExpiredError(f"Search session expired: {session_id}")
+        rows = self.file_chunk_repository.get_file_chunk_rows(
+            session.page_file_chunk_ids(offset),
+        )
+        return make_search_session_page(
+            session,
+            session_id,
+            offset,
+            session.page(offset, rows),
+        )
+
+    def _cached_search(
+        self,
+        mode: SearchMode,
+        question: str | list[float],
+        params: Params,
+        use_cache: bool,
+        search: Callable[[], Page[SimilarFileChunk]],
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        if self.search_result_cache is None:
+            return search()
+        return self.search_result_cache.get_or_search(
+            mode.value,
+            question,
+            params,
+            search,
+            refresh=not use_cache,
+            search_filter=search_filter,
+        )
+
+    def _search_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        params: Params,
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        with _time_search_query(SearchMode.VECTOR):
+            return self.find_similar_file_chunks(
+                question_embedding,
+                params,
+                search_filter,
+            )
+
+    def _search_lexical_file_chunks(
+        self,
+        question: str,
+        params: Params,
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        with _time_search_query(SearchMode.LEXICAL):
+            return self.file_chunk_repository.find_lexical_file_chunks(
+                question,
+                params,
+                search_filter,
+            )
+
+    def _search_hybrid_file_chunks(
+        self,
+        question: str,
+        params: Params,
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        return paginate(
+            self._rank_hybrid_file_chunks(
+                question,
+                params.page * params.size,
+                search_filter,
+            ),
+            params=params,
+        )
+
+    def _rank_hybrid_file_chunks(
+        self,
+        question: str,
+        files_needed: int,
+        search_filter: SearchFilter | None,
+    ) -> list[SimilarFileChunk]:
+        # the lexical candidates are fetched on another connection while the question
+        # is embedded and the vector candidates are fetched
+        with self.file_chunk_repository.in_new_session() as lexical_repository:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                lexical_ranking = executor.submit(
+                    lexical_repository.rank_lexical_file_chunks,
+                    question,
+                    files_needed,
+                    search_filter,
+                )
+                question_embedding = self.create_question_embedding(question)
+                with _time_search_query(SearchMode.HYBRID):
+                    vector_ranking = (
+                        self.file_chunk_repository.rank_similar_file_chunks(
+                            question_embedding,
+                            files_needed,
+                            search_filter,
+                        )
+                    )
+                    fused_ranking = reciprocal_rank_fusion(
+                        vector_ranking,
+                        lexical_ranking.result(),
+                    )
+        return fused_ranking
+
     @classmethod
     def split_text_into_chunks(cls, text: str) -> list[str]:
         """
-        Splits a text into chunks
+        Splits a text into chunks of settings.chunk_size_tokens tokens
         :param text: The text to be split
         :return: The chunks
         """
-        start = 0
-        ideal_token_size = 512
-        ideal_size = int(ideal_token_size // (4 / 3))
-        end = ideal_size
-        words = text.split()
-        # remove empty spaces
-        words = [x for x in words if x != " "]
-        total_words = len(words)
-        chunks = []
-
-        nb_chunks = (
-            total_words // ideal_size
-            if total_words % ideal_size == 0
-            else total_words // ideal_size + 1
-        )
-        for i in range(nb_chunks):
-            chunk = words[start:end]
-            chunk = " ".join(chunk)
-            nb_chunk_token = cls.num_tokens_from_string(chunk)
-            if nb_chunk_token > 0:
-                chunks.append(chunk)
-            start += ideal_size
-            end += ideal_size
-        return chunks
+        return [chunk.text for chunk in TokenChunker().split(text)]
 
     @classmethod
     def num_tokens_from_string(cls, string: str, encoding_name="cl100k_base") -> int:
         if not string:
             return 0
         # Returns the number of tokens in a text string
-        encoding = tiktoken.get_encoding(encoding_name)
-        num_tokens = len(encoding.encode(string))
-        return num_tokens
+        encoding = get_encoding(encoding_name)
+        return len(encoding.encode(string, disallowed_special=()))
 
     @classmethod
     def get_file_words_length(cls, file_text_content: str) -> int:
@@ -136,11 +527,433 @@ class FileChunkService:
         :return: The cost
         """
         num_tokens = cls.num_tokens_from_string(file_text_content)
+        return cls.calculate_embedding_cost_from_tokens(num_tokens)
+
+    @classmethod
+    def calculate_embedding_cost_from_tokens(cls, num_tokens: int) -> float:
+        """
+        Calculates the cost of embedding a number of tokens
+        :param num_tokens: The number of tokens
+        :return: The cost
+        """
         cost = num_tokens / 1000 * 0.0001
         return round(cost, 4)
 
 
+class AsyncFileChunkService:
+    """Variant of FileChunkService for the async request path."""
+
+    def __init__(
+        self,
+        file_chunk_repository: AsyncFileChunkRepository,
+        embedding_provider: EmbeddingProvider | None = None,
+        embedding_cache: AsyncEmbeddingCache | None = None,
+        search_result_cache: AsyncSearchResultCache | None = None,
+        search_session_store: SearchSessionStore | None = None,
+    ):
+        self.file_chunk_repository = file_chunk_repository
+        self.embedding_provider = embedding_provider or get_embedding_provider()
+        self.embedding_cache = embedding_cache
+        self.search_result_cache = search_result_cache
+        self.search_session_store = (
+            search_sessions if search_session_store is None else search_session_store
+        )
+
+    async def create_embedding(self, text: str) -> list[float]:
+        """
+        Creates an embedding for a text
+        :param text: The text to be embedded
+        :return: The embedding float list
+        """
+        return (await self.create_embeddings([text]))[0]
+
+    async def create_question_embedding(self, question: str) -> list[float]:
+        """
+        Creates the embedding of a search question, reusing the cached one if any
+        :param question: The question
+        :return: The embedding float list
+        """
+        if self.embedding_cache is None:
+            return await self.create_embedding(question)
+        return await self.embedding_cache.get_or_create(
+            question,
+            self.embedding_provider.model_name,
+            self.create_embedding,
+        )
+
+    async def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """
+        Creates embeddings for a list of texts, sending them to the embedding provider
+        in batches with a bounded number of batches in flight
+        :param texts: The texts to be embedded
+        :return: The embedding float lists, in the same order as the texts
+        """
+        batch_size = settings.embedding_batch_size
+        batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+        semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
+
+        async def embed_batch(batch: list[str]) -> list[list[float]]:
+            async with semaphore:
+                EMBEDDING_BATCH_SIZE.observe(len(batch))
+                model_name = self.embedding_provider.model_name
+                with EMBEDDING_REQUEST_SECONDS.labels(model_name).time():
+                    return await self.embedding_provider.aembed_batch(batch)
+
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    async def find_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        params: Params = Params(),
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Finds similar top k files to a question embedding using file chunks
+        :param params: The pagination params
+        :param question_embedding: The question embedding
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The similar file chunks
+        """
+        return await self.file_chunk_repository.find_similar_file_chunks(
+            question_embedding,
+            params,
+            search_filter,
+        )
+
+    async def search_file_chunks(
+        self,
+        question: str,
+        mode: SearchMode = SearchMode.VECTOR,
+        params: Params = Params(),
+        use_cache: bool = True,
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Finds the best chunk of the files matching a question
+        :param question: The question
+        :param mode: The ranking of the files, by embedding similarity, by full-text
+        match without any embedding call, or by both
+        :param params: The pagination params
+        :param use_cache: Whether to return the cached result page if any
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The best chunk of each file
+        """
+        if mode == SearchMode.VECTOR:
+            question_embedding = await self.create_question_embedding(question)
+            return await self._cached_search(
+                mode,
+                question_embedding,
+                params,
+                use_cache,
+                lambda: self._search_similar_file_chunks(
+                    question_embedding,
+                    params,
+                    search_filter,
+                ),
+                search_filter,
+            )
+        search = (
+            self._search_lexical_file_chunks
+            if mode == SearchMode.LEXICAL
+            else self._search_hybrid_file_chunks
+        )
+        return await self._cached_search(
+            mode,
+            question,
+            params,
+            use_cache,
+            lambda: search(question, params, search_filter),
+            search_filter,
+        )
+
+    async def search_file_chunks_batch(
+        self,
+        questions: list[str],
+        params: Params = Params(),
+        collection: str | None = None,
+    ) -> list[Page[SimilarFileChunk]]:
+        """
+        Finds the best chunk of the files similar to each of several questions, the
+        questions are embedded together and ranked by a single statement
+        :param questions: The questions
+        :param params: The pagination params of the results of each question
+        :param collection: The collection of the files, all the collections if None
+        :return: The best chunk of each file for each question, in the order of the questions
+        """
+        unique_questions = list(dict.fromkeys(questions))
+        question_embeddings = await self.create_embeddings(unique_questions)
+        with _time_search_query(SearchMode.VECTOR):
+            rankings = await self.file_chunk_repository.rank_similar_file_chunks_batch(
+                question_embeddings,
+                params.page * params.size,
+                collection,
+            )
+        pages = {
+            question: paginate(ranking, params=params)
+            for question, ranking in zip(unique_questions, rankings)
+        }
+        return [pages[question] for question in questions]
+
+    async def rank_file_chunks(
+        self,
+        question: str,
+        mode: SearchMode,
+        files_needed: int,
+        search_filter: SearchFilter | None = None,
+    ) -> list[SimilarFileChunk]:
+        """
+        Ranks the files matching a question, without pagination
+        :param question: The question
+        :param mode: The ranking of the files
+        :param files_needed: The number of files to rank
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The best chunk of each file, best file first
+        """
+        if mode == SearchMode.VECTOR:
+            question_embedding = await self.create_question_embedding(question)
+            with _time_search_query(mode):
+                return await self.file_chunk_repository.rank_similar_file_chunks(
+                    question_embedding,
+                    files_needed,
+                    search_filter,
+                )
+        if mode == SearchMode.LEXICAL:
+            with _time_search_query(mode):
+                return await self.file_chunk_repository.rank_lexical_file_chunks(
+                    question,
+                    files_needed,
+                    search_filter,
+                )
+        return await self._rank_hybrid_file_chunks(
+            question,
+            files_needed,
+            search_filter,
+        )
+
+    async def start_search_session(
+        self,
+        question: str,
+        mode: SearchMode = SearchMode.VECTOR,
+        size: int = 50,
+        search_filter: SearchFilter | None = None,
+    ) -> SearchSessionPage:
+        """
+        Ranks the files matching a question once for all the pages of a search
+        session, the next pages are read with get_search_session_page
+        :param question: The question
+        :param mode: The ranking of the files
+        :param size: The number of files of a page
+        :param search_filter: The criteria on the files, all the files if None
+        :return: The first page, with the cursor of the next one
+        """
+        # a ranking larger than the store could not be paged through
+        files_needed = min(
+            settings.search_session_max_files,
+            self.search_session_store.max_files,
+        )
+        ranking = (
+            await self.rank_file_chunks(
+                question,
+                mode,
+                files_needed,
+                search_filter,
+            )
+        )[:files_needed]
+        session = SearchSession.from_ranking(ranking, size)
+        session_id = self.search_session_store.add(session)
+        return make_search_session_page(session, session_id, 0, ranking[:size])
+
+    async def get_search_session_page(self, cursor: str) -> SearchSessionPage:
+        """
+        Reads a page of a search session, only the chunks of the page are queried
+        :param cursor: The cursor of the page
+        :return: The page, with the cursor of the next one
+        :raise ValueError: If the cursor is malformed
+        :raise SearchSessionExpiredError: If the session is expired
+        """
+        session_id, offset = decode_cursor(cursor)
+        session = self.search_session_store.get(session_id)
+        if session is None:
+            raise SearchSessionExpiredError(f"Search session expired: {session_id}")
+        rows = await self.file_chunk_repository.get_file_chunk_rows(
+            session.page_file_chunk_ids(offset),
+        )
+        return make_search_session_page(
+            session,
+            session_id,
+            offset,
+            session.page(offset, rows),
+        )
+
+    async def _cached_search(
+        self,
+        mode: SearchMode,
+        question: str | list[float],
+        params: Params,
+        use_cache: bool,
+        search: Callable[[], Awaitable[Page[SimilarFileChunk]]],
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        if self.search_result_cache is None:
+            return await search()
+        return await self.search_result_cache.get_or_search(
+            mode.value,
+            question,
+            params,
+            search,
+            refresh=not use_cache,
+            search_filter=search_filter,
+        )
+
+    async def _search_similar_file_chunks(
+        self,
+        question_embedding: list[float],
+        params: Params,
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        with _time_search_query(SearchMode.VECTOR):
+            return await self.find_similar_file_chunks(
+                question_embedding,
+                params,
+                search_filter,
+            )
+
+    async def _search_lexical_file_chunks(
+        self,
+        question: str,
+        params: Params,
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        with _time_search_query(SearchMode.LEXICAL):
+            return await self.file_chunk_repository.find_lexical_file_chunks(
+                question,
+                params,
+                search_filter,
+            )
+
+    async def _search_hybrid_file_chunks(
+        self,
+        question: str,
+        params: Params,
+        search_filter: SearchFilter | None,
+    ) -> Page[SimilarFileChunk]:
+        return paginate(
+            await self._rank_hybrid_file_chunks(
+                question,
+                params.page * params.size,
+                search_filter,
+            ),
+            params=params,
+        )
+
+    async def _rank_hybrid_file_chunks(
+        self,
+        question: str,
+        files_needed: int,
+        search_filter: SearchFilter | None,
+    ) -> list[SimilarFileChunk]:
+        async def rank_similar_file_chunks() -> tuple[list[SimilarFileChunk], float]:
+            question_embedding = await self.create_question_embedding(question)
+            # the query time of the search does not count the question embedding
+            start = time.perf_counter()
+            vector_ranking = await self.file_chunk_repository.rank_similar_file_chunks(
+                question_embedding,
+                files_needed,
+                search_filter,
+            )
+            return vector_ranking, start
+
+        # a session runs one statement at a time, the lexical candidates are fetched
+        # on another one while the question is embedded and the vector candidates
+        # are fetched, both are awaited before the lexical session is closed
+        async with self.file_chunk_repository.in_new_session() as lexical_repository:
+            vector_result, lexical_ranking = await asyncio.gather(
+                rank_similar_file_chunks(),
+                lexical_repository.rank_lexical_file_chunks(
+                    question,
+                    files_needed,
+                    search_filter,
+                ),
+                return_exceptions=True,
+            )
+        for result in (vector_result, lexical_ranking):
+            if isinstance(result, BaseException):
+                raise result
+        vector_ranking, start = vector_result
+        fused_ranking = reciprocal_rank_fusion(vector_ranking, lexical_ranking)
+        _search_query_seconds(SearchMode.HYBRID).observe(time.perf_counter() - start)
+        return fused_ranking
+
+
+def _time_search_query(mode: SearchMode) -> Timer:
+    return _search_query_seconds(mode).time()
+
+
+def _search_query_seconds(mode: SearchMode) -> Histogram:
+    # the lexical rankings always run in the database
+    backend = (
+        SearchBackendName.PGVECTOR
+        if mode == SearchMode.LEXICAL
+        else settings.search_backend
+    )
+    return SEARCH_QUERY_SECONDS.labels(mode.value, backend.value)
+
+
+def reciprocal_rank_fusion(
+    *rankings: list[SimilarFileChunk],
+    k: int | None = None,
+) -> list[SimilarFileChunk]:
+    """
+    Merges rankings of files with the reciprocal rank fusion, a file scores the sum
+    of 1 / (k + rank) over the rankings it appears in
+    :param rankings: The best chunk of each file, best file first
+    :param k: The constant damping the weight of the first ranks
+    :return: The best chunk of each file by decreasing fused score, the chunk of a file
+    is the one of the first ranking it appears in
+    """
+    k = k if k is not None else settings.search_rrf_k
+    scores: dict[int, float] = {}
+    file_chunks: dict[int, SimilarFileChunk] = {}
+    for ranking in rankings:
+        for rank, file_chunk in enumerate(ranking, start=1):
+            scores[file_chunk.file_id] = scores.get(file_chunk.file_id, 0) + 1 / (
+                k + rank
+            )
+            file_chunks.setdefault(file_chunk.file_id, file_chunk)
+    return [
+        dataclasses.replace(file_chunks[file_id], score=score)
+        for file_id, score in sorted(
+            scores.items(),
+            key=lambda file_score: file_score[1],
+            reverse=True,
+        )
+    ]
+
+
 def get_file_chunk_service(
     file_chunk_repository: FileChunkRepository = Depends(get_file_chunk_repository),
+    embedding_cache: EmbeddingCache | None = Depends(get_embedding_cache),
+    search_result_cache: SearchResultCache | None = Depends(get_search_result_cache),
 ) -> FileChunkService:
-    return FileChunkService(file_chunk_repository)
+    return FileChunkService(
+        file_chunk_repository,
+        embedding_cache=embedding_cache,
+        search_result_cache=search_result_cache,
+    )
+
+
+def get_async_file_chunk_service(
+    file_chunk_repository: AsyncFileChunkRepository = Depends(
+        get_async_file_chunk_repository,
+    ),
+    embedding_cache: AsyncEmbeddingCache | None = Depends(get_async_embedding_cache),
+    search_result_cache: AsyncSearchResultCache | None = Depends(
+        get_async_search_result_cache,
+    ),
+) -> AsyncFileChunkService:
+    return AsyncFileChunkService(
+        file_chunk_repository,
+        embedding_cache=embedding_cache,
+        search_result_cache=search_result_cache,
+    )
@@ -1,70 +1,164 @@
 import io
 import logging
+import multiprocessing
 import os
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Type
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterator, Type
 
-import fitz  # PyMuPDF
-import PyPDF2
-import pytesseract
-from PIL import Image
+from api.metrics import PARSE_SECONDS
+from api.settings import settings
+
+# the PDF and OCR libraries are imported on first use, they are most of the import
+# time of a process which does not parse PDFs, like an API worker
+if TYPE_CHECKING:
+    import fitz  # PyMuPDF
 
 
 # Base Parser Interface
 class BaseParser(ABC):
+    # the text of a plain text file is the file itself, it is read again from the file
+    # instead of being stored
+    plain_text = False
+
     @abstractmethod
     def parse(self, filepath: str) -> str:
         pass
 
+    def stream(self, filepath: str) -> Iterator[str]:
+        """
+        Yields the text of a file in order, by parts when the format allows it
+        :param filepath: The file path
+        :return: The iterator of the text parts
+        """
+        yield self.parse(filepath)
+
 
 # Concrete Parser for PDF
 class PdfParser(BaseParser):
     def parse(self, filepath: str) -> str:
+        return "".join(self.stream(filepath))
+
+    def stream(self, filepath: str) -> Iterator[str]:
+        """
+        Yields the text of each page of a PDF in order. The pages of large PDFs are
+        extracted by a pool of processes, each opening the document once.
+        :param filepath: The PDF file path
+        :return: The iterator of the page texts
+        """
+        import fitz  # PyMuPDF
+
+        start = time.perf_counter()
+        page_count = 0
         try:
-            content: str = ""
-            with open(filepath, "rb") as file:
-                reader = PyPDF2.PdfReader(file)
-                if reader.is_encrypted:
-                    try:
-                        reader.decrypt("")
-                    except Exception as e:
-                        logging.error(f"Failed to decrypt PDF: {e}")
-                        return "Unable to decrypt PDF"
-
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    page_content = page.extract_text()
-                    if not page_content:  # If text extraction fails, use OCR
-                        page_content = self._ocr_page(filepath, page_num)
-                    content += page_content
-            return content
+            with fitz.open(filepath) as document:
+                if not _authenticate(document):
+                    logging.error("Failed to decrypt PDF")
+                    yield "Unable to decrypt PDF"
+                    return
+                total_pages = document.page_count
+                if (
+                    total_pages < settings.pdf_parallel_min_pages
+                    or settings.pdf_workers <= 1
+                ):
+                    for page in document:
+                        page_count += 1
+                        yield _extract_page_text(page)
+                    return
+
+            pages_per_task = settings.pdf_pages_per_task
+            page_ranges = [
+                (first_page, min(first_page + pages_per_task, total_pages))
+                for first_page in range(0, total_pages, pages_per_task)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=min(settings.pdf_workers, len(page_ranges)),
+                # the parser also runs in multi-threaded processes where forking is unsafe
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_open_worker_document,
+                initargs=(filepath,),
+            ) as executor:
+                for page_texts in executor.map(_extract_page_range, page_ranges):
+                    page_count += len(page_texts)
+                    yield from page_texts
         except Exception as e:
             logging.error(f"Error processing PDF: {e}")
-            return "Error processing PDF file"
+            yield "Error processing PDF file"
+        finally:
+            elapsed = time.perf_counter() - start
+            logging.info(
+                f"Extracted {page_count} pages of {filepath} in {elapsed:.2f}s "
+                f"({page_count / max(elapsed, 1e-9):.1f} pages/s)",
+            )
 
-    def _ocr_page(self, filepath: str, page_num: int) -> str:
-        try:
-            document = fitz.open(filepath)
-            page = document.load_page(page_num)
-            pix = page.get_pixmap()
-            img = Image.open(io.BytesIO(pix.tobytes("png")))
-            ocr_text = pytesseract.image_to_string(img)
-            document.close()
-            return ocr_text
-        except Exception as e:
-            logging.error(f"OCR processing error: {e}")
-            return "Error in OCR processing"
+
+def _authenticate(document: "fitz.Document") -> bool:
+    # encrypted PDFs are often only protected against modifications, with an empty password
+    return not document.needs_pass or bool(document.authenticate(""))
+
+
+def _extract_page_text(page: "fitz.Page") -> str:
+    page_content = page.get_text()
+    if not page_content.strip():  # If text extraction fails, use OCR
+        page_content = _ocr_page(page)
+    return page_content
+
+
+def _ocr_page(page: "fitz.Page") -> str:
+    import pytesseract
+    from PIL import Image
+
+    try:
+        pix = page.get_pixmap()
+        img = Image.open(io.BytesIO(pix.tobytes("png")))
+        return pytesseract.image_to_string(img)
+    except Exception as e:
+        logging.error(f"OCR processing error: {e}")
+        return "Error in OCR processing"
+
+
+# document opened once by each process of the PDF extraction pool
+_worker_document: "fitz.Document | None" = None
+
+
+def _open_worker_document(filepath: str) -> None:
+    import fitz  # PyMuPDF
+
+    global _worker_document
+    _worker_document = fitz.open(filepath)
+    _authenticate(_worker_document)
+
+
+def _extract_page_range(page_range: tuple[int, int]) -> list[str]:
+    first_page, last_page = page_range
+    return [
+        _extract_page_text(_worker_document.load_page(page_num))
+        for page_num in range(first_page, last_page)
+    ]
 
 
 # Concrete Parser for TXT
 class TxtParser(BaseParser):
+    plain_text = True
+
     def parse(self, filepath: str) -> str:
+        return "".join(self.stream(filepath))
+
+    def stream(self, filepath: str) -> Iterator[str]:
+        """
+        Yields the text of a file by parts of settings.text_block_size characters,
+        the file is never read whole
+        :param filepath: The text file path
+        :return: The iterator of the text parts
+        """
         try:
             with open(filepath, "r") as file:
-                return file.read()
+                while part := file.read(settings.text_block_size):
+                    yield part
         except Exception as e:
             logging.error(f"Error reading text file: {e}")
-            return "Error reading text file"
+            yield "Error reading text file"
 
 
 # Parser Factory with Registration System
@@ -106,4 +200,27 @@ class FileParser:
     def parse(self) -> str:
         if not os.path.exists(self.filepath):
             raise FileNotFoundError(f"File not found: {self.filepath}")
-        return self.parser.parse(self.filepath)
+        with PARSE_SECONDS.labels(self.filepath.split(".")[-1]).time():
+            return self.parser.parse(self.filepath)
+
+    def stream(self) -> Iterator[str]:
+        if not os.path.exists(self.filepath):
+            raise FileNotFoundError(f"File not found: {self.filepath}")
+        return self._time_stream(self.parser.stream(self.filepath))
+
+    def _time_stream(self, parts: Iterator[str]) -> Iterator[str]:
+        """
+        Yields the parts of a text, timing their extraction like parse once they are
+        all read, the time spent by the consumer between the parts is not counted
+        :param parts: The parts extracted by the parser
+        :return: The iterator of the parts
+        """
+        elapsed = 0.0
+        while True:
+            start = time.perf_counter()
+            part = next(parts, None)
+            elapsed += time.perf_counter() - start
+            if part is None:
+                break
+            yield part
+        PARSE_SECONDS.labels(self.filepath.split(".")[-1]).observe(elapsed)
@@ -0,0 +1,66 @@
+from fastapi import Depends
+
+from api.infra.db.model.file import File
+from api.infra.db.model.ingestion_job import IngestionJob
+from api.infra.db.repository.ingestion_job import (
+    IngestionJobRepository,
+    get_ingestion_job_repository,
+)
+from api.settings import settings
+
+
+class IngestionQueueFullError(Exception):
+    pass
+
+
+class IngestionService:
+    def __init__(self, ingestion_job_repository: IngestionJobRepository):
+        self.ingestion_job_repository = ingestion_job_repository
+
+    def ensure_capacity(self) -> None:
+        """
+        Checks that the ingestion queue can accept a new file, before its upload is
+        stored, the depth is checked again when the file is enqueued
+        :raise IngestionQueueFullError: If the queue is deeper than the maximum depth
+        """
+        queue_depth = self.ingestion_job_repository.count_unfinished()
+        if queue_depth >= settings.ingestion_max_queue_depth:
+            raise IngestionQueueFullError(
+                f"Ingestion queue is full: {queue_depth} files are waiting",
+            )
+
+    def enqueue_file(self, file: File) -> IngestionJob:
+        """
+        Creates a file and enqueues the chunking and embedding of its file for the
+        ingestion workers, in a single transaction checking the queue depth
+        :param file: The file, not created yet
+        :return: The ingestion job
+        :raise IngestionQueueFullError: If the queue is deeper than the maximum depth,
+        the file is not created then
+        """
+        ingestion_job = self.ingestion_job_repository.enqueue(
+            file,
+            settings.ingestion_max_queue_depth,
+        )
+        if ingestion_job is None:
+            raise IngestionQueueFullError(
+                f"Ingestion queue is full: {settings.ingestion_max_queue_depth} files "
+                "are waiting",
+            )
+        return ingestion_job
+
+    def get_file_ingestion(self, file_id: int) -> IngestionJob | None:
+        """
+        Gets the ingestion job of a file
+        :param file_id: The file id
+        :return: The ingestion job, or None if the file has never been enqueued
+        """
+        return self.ingestion_job_repository.get_by_file_id(file_id)
+
+
+def get_ingestion_service(
+    ingestion_job_repository: IngestionJobRepository = Depends(
+        get_ingestion_job_repository,
+    ),
+) -> IngestionService:
+    return IngestionService(ingestion_job_repository)
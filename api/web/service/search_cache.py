@@ -0,0 +1,161 @@
+import hashlib
+from typing import Awaitable, Callable
+
+import numpy as np
+from fastapi import Depends
+from fastapi_pagination import Page, Params
+
+from api.infra.db.repository.corpus_generation import (
+    AsyncCorpusGenerationRepository,
+    CorpusGenerationRepository,
+    get_async_corpus_generation_repository,
+    get_corpus_generation_repository,
+)
+from api.infra.db.repository.file import SearchFilter, SimilarFileChunk
+from api.metrics import SEARCH_CACHE_REQUESTS
+from api.settings import settings
+from api.web.service.embedding_cache import EmbeddingCache, LRUCache
+
+# the result pages are shared by all the requests of a worker
+search_results = LRUCache(
+    max_size=settings.search_cache_size,
+    ttl=settings.search_cache_ttl,
+)
+
+
+class SearchResultCache:
+    """
+    In-process cache of the search result pages. The keys include the corpus
+    generation, bumped in the transactions changing the chunks, so the pages cached
+    before a change are never returned after it and are evicted as least recently
+    used.
+    """
+
+    def __init__(
+        self,
+        repository: CorpusGenerationRepository,
+        local_cache: LRUCache = search_results,
+    ):
+        self.repository = repository
+        self.local_cache = local_cache
+
+    def get_or_search(
+        self,
+        mode: str,
+        question: str | list[float],
+        params: Params,
+        search: Callable[[], Page[SimilarFileChunk]],
+        refresh: bool = False,
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Gets a result page from the cache, or runs the search and caches its page
+        :param mode: The search mode
+        :param question: The question embedding for the searches depending on it only,
+        the question otherwise
+        :param params: The pagination params
+        :param search: The function running the search
+        :param refresh: Whether to run the search even if its page is cached
+        :param search_filter: The criteria on the files of the search
+        :return: The result page
+        """
+        key = self.make_key(
+            self.repository.get_generation(),
+            mode,
+            question,
+            params,
+            search_filter,
+        )
+        page = None if refresh else self.local_cache.get(key)
+        if page is not None:
+            SEARCH_CACHE_REQUESTS.labels("hit").inc()
+            return page
+        SEARCH_CACHE_REQUESTS.labels("bypass" if refresh else "miss").inc()
+        page = search()
+        self.local_cache.set(key, page)
+        return page
+
+    @classmethod
+    def make_key(
+        cls,
+        generation: int,
+        mode: str,
+        question: str | list[float],
+        params: Params,
+        search_filter: SearchFilter | None = None,
+    ) -> str:
+        """
+        Makes the cache key of a search
+        :param generation: The corpus generation
+        :param mode: The search mode
+        :param question: The question embedding, or the question
+        :param params: The pagination params
+        :param search_filter: The criteria on the files of the search
+        :return: The hexadecimal SHA-256 of the search parameters
+        """
+        if isinstance(question, str):
+            question_hash = EmbeddingCache.normalize_question(question).encode()
+        else:
+            question_hash = np.asarray(question, dtype=np.float32).tobytes()
+        digest = hashlib.sha256(question_hash)
+        digest.update(
+            f"\n{generation}\n{mode}\n{settings.search_similarity_threshold}\n"
+            f"{settings.search_backend.value}\n{params.page}\n{params.size}\n"
+            f"{search_filter!r}".encode(),
+        )
+        return digest.hexdigest()
+
+
+class AsyncSearchResultCache(SearchResultCache):
+    """Variant of SearchResultCache reading the corpus generation asynchronously."""
+
+    repository: AsyncCorpusGenerationRepository
+
+    async def get_or_search(
+        self,
+        mode: str,
+        question: str | list[float],
+        params: Params,
+        search: Callable[[], Awaitable[Page[SimilarFileChunk]]],
+        refresh: bool = False,
+        search_filter: SearchFilter | None = None,
+    ) -> Page[SimilarFileChunk]:
+        """
+        Gets a result page from the cache, or runs the search and caches its page
+        :param mode: The search mode
+        :param question: The question embedding for the searches depending on it only,
+        the question otherwise
+        :param params: The pagination params
+        :param search: The coroutine function running the search
+        :param refresh: Whether to run the search even if its page is cached
+        :param search_filter: The criteria on the files of the search
+        :return: The result page
+        """
+        generation = await self.repository.get_generation()
+        key = self.make_key(generation, mode, question, params, search_filter)
+        page = None if refresh else self.local_cache.get(key)
+        if page is not None:
+            SEARCH_CACHE_REQUESTS.labels("hit").inc()
+            return page
+        SEARCH_CACHE_REQUESTS.labels("bypass" if refresh else "miss").inc()
+        page = await search()
+        self.local_cache.set(key, page)
+        return page
+
+
+def get_search_result_cache(
+    repository: CorpusGenerationRepository = Depends(get_corpus_generation_repository),
+) -> SearchResultCache | None:
+    if not settings.search_cache_enabled:
+        return None
+    return SearchResultCache(repository)
+
+
+def get_async_search_result_cache(
+    repository: AsyncCorpusGenerationRepository = Depends(
+        get_async_corpus_generation_repository,
+    ),
+) -> AsyncSearchResultCache | None:
+    if not settings.search_cache_enabled:
+        return None
+    return AsyncSearchResultCache(repository)
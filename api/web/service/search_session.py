@@ -0,0 +1,272 @@
+import base64
+import binascii
+import math
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import Row
+
+from api.infra.db.repository.file import SimilarFileChunk
+from api.settings import settings
+
+
+# bytes of a file of a session: its file id, chunk id, distance and score
+SESSION_FILE_NBYTES = (
+    2 * np.dtype(np.int64).itemsize + 2 * np.dtype(np.float32).itemsize
+)
+
+
+class SearchSessionExpiredError(LookupError):
+    pass
+
+
+@dataclass(slots=True, frozen=True)
+class SearchSession:
+    """
+    Ranking of the files of a search, stored as packed arrays of 24 bytes per file
+    instead of SimilarFileChunk objects. The chunk texts are not kept, the pages of
+    the session read the ones of their chunks.
+    """
+
+    file_ids: np.ndarray
+    file_chunk_ids: np.ndarray
+    # NaN for the files ranked without a distance, or without a score
+    distances: np.ndarray
+    scores: np.ndarray
+    # number of files of a page of the session
+    page_size: int
+
+    @classmethod
+    def from_ranking(
+        cls,
+        ranking: list[SimilarFileChunk],
+        page_size: int,
+    ) -> "SearchSession":
+        """
+        Packs a ranking of files
+        :param ranking: The best chunk of each file, best file first
+        :param page_size: The number of files of a page
+        :return: The session
+        """
+        return cls(
+            file_ids=np.fromiter(
+                (file_chunk.file_id for file_chunk in ranking),
+                np.int64,
+                len(ranking),
+            ),
+            file_chunk_ids=np.fromiter(
+                (file_chunk.file_chunk_id for file_chunk in ranking),
+                np.int64,
+                len(ranking),
+            ),
+            distances=_pack_floats([file_chunk.distance for file_chunk in ranking]),
+            scores=_pack_floats([file_chunk.score for file_chunk in ranking]),
+            page_size=page_size,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.file_ids.nbytes
+            + self.file_chunk_ids.nbytes
+            + self.distances.nbytes
+            + self.scores.nbytes
+        )
+
+    def __len__(self) -> int:
+        return len(self.file_ids)
+
+    def page_file_chunk_ids(self, offset: int) -> list[int]:
+        """
+        Gets the chunk ids of a page
+        :param offset: The rank of the first file of the page
+        :return: The chunk ids, best file first
+        """
+        return self.file_chunk_ids[offset : offset + self.page_size].tolist()
+
+    def page(self, offset: int, rows: list[Row]) -> list[SimilarFileChunk]:
+        """
+        Unpacks the files of a page with the names and texts read for its chunks
+        :param offset: The rank of the first file of the page
+        :param rows: The rows of file_name, file_chunk_id and chunk_text of the chunks
+        :return: The best chunk of each file of the page, the chunks deleted since the
+        search are left out
+        """
+        rows_by_id = {row.file_chunk_id: row for row in rows}
+        page = []
+        for rank in range(offset, min(offset + self.page_size, len(self))):
+            row = rows_by_id.get(int(self.file_chunk_ids[rank]))
+            if row is None:
+                continue
+            page.append(
+                SimilarFileChunk(
+                    file_id=int(self.file_ids[rank]),
+                    file_name=row.file_name,
+                    file_chunk_id=row.file_chunk_id,
+                    chunk_text=row.chunk_text,
+                    distance=_unpack_float(self.distances[rank]),
+                    score=_unpack_float(self.scores[rank]),
+                ),
+            )
+        return page
+
+    def next_offset(self, offset: int) -> int | None:
+        """
+        Gets the offset of the page after a page
+        :param offset: The rank of the first file of the page
+        :return: The offset, None after the last page
+        """
+        next_offset = offset + self.page_size
+        return next_offset if next_offset < len(self) else None
+
+
+@dataclass(slots=True, frozen=True)
+class SearchSessionPage:
+    """Page of a search session."""
+
+    items: list[SimilarFileChunk]
+    # number of files ranked by the session
+    total: int
+    # cursor of the next page, None on the last page
+    next_cursor: str | None
+
+
+class SearchSessionStore:
+    """
+    Thread-safe in-process store of the search sessions, with a time to live counted
+    from their creation and a maximum total size of their arrays. The sessions
+    expire in the order of their creation, the oldest ones are evicted first.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self._sessions: OrderedDict[str, tuple[float, SearchSession]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_files(self) -> int:
+        """Number of files of the largest session which can be stored."""
+        return self.max_bytes // SESSION_FILE_NBYTES
+
+    def add(self, session: SearchSession) -> str | None:
+        """
+        Stores a session, evicting the expired ones and the oldest ones above the
+        maximum size
+        :param session: The session
+        :return: The session id, None if the session is larger than the maximum size
+        """
+        if session.nbytes > self.max_bytes:
+            return None
+        session_id = secrets.token_urlsafe(16)
+        with self._lock:
+            now = time.monotonic()
+            while self._sessions and (
+                self.nbytes + session.nbytes > self.max_bytes
+                or next(iter(self._sessions.values()))[0] < now
+            ):
+                _, (_, evicted) = self._sessions.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+            self._sessions[session_id] = (now + self.ttl, session)
+            self.nbytes += session.nbytes
+        return session_id
+
+    def get(self, session_id: str) -> SearchSession | None:
+        """
+        Gets a session
+        :param session_id: The session id
+        :return: The session, or None if it is expired, evicted or unknown
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, session = entry
+            if expires_at < time.monotonic():
+                del self._sessions[session_id]
+                self.nbytes -= session.nbytes
+                return None
+            return session
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# the sessions are kept by the worker which created them
+search_sessions = SearchSessionStore(
+    max_bytes=settings.search_session_max_bytes,
+    ttl=settings.search_session_ttl,
+)
+
+
+def make_search_session_page(
+    session: SearchSession,
+    session_id: str | None,
+    offset: int,
+    items: list[SimilarFileChunk],
+) -> SearchSessionPage:
+    """
+    Makes a page of a session, with the cursor of the next page
+    :param session: The session
+    :param session_id: The session id, None if the session could not be stored
+    :param offset: The rank of the first file of the page
+    :param items: The best chunk of each file of the page
+    :return: The page
+    """
+    next_offset = session.next_offset(offset)
+    return SearchSessionPage(
+        items=items,
+        total=len(session),
+        next_cursor=(
+            None
+            if session_id is None or next_offset is None
+            else encode_cursor(session_id, next_offset)
+        ),
+    )
+
+
+def encode_cursor(session_id: str, offset: int) -> str:
+    """
+    Makes the opaque cursor of a page of a session
+    :param session_id: The session id
+    :param offset: The rank of the first file of the page
+    :return: The URL-safe cursor
+    """
+    return base64.urlsafe_b64encode(f"{session_id}:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """
+    Reads a cursor made by encode_cursor
+    :param cursor: The cursor
+    :return: The session id and the offset of the page
+    :raise ValueError: If the cursor is malformed
+    """
+    try:
+        session_id, offset = base64.urlsafe_b64decode(cursor).decode().split(":")
+        if int(offset) < 0:
+            raise ValueError(offset)
+        return session_id, int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _pack_floats(values: list[float | None]) -> np.ndarray:
+    return np.array(
+        [math.nan if value is None else value for value in values],
+        dtype=np.float32,
+    )
+
+
+def _unpack_float(value: np.float32) -> float | None:
+    return None if math.isnan(value) else float(value)
@@ -0,0 +1,169 @@
+import signal
+import threading
+from typing import Callable
+
+from loguru import logger
+from prometheus_client import start_http_server
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from api.infra.db.model.file import File, FileChunk
+from api.infra.db.model.ingestion_job import IngestionJob
+from api.infra.db.repository.file import (
+    FileChunkRepository,
+    FileRepository,
+    VectorStoreFileChunkRepository,
+)
+from api.infra.db.repository.ingestion_job import IngestionJobRepository
+from api.infra.vector_store import get_vector_store
+from api.metrics import register_engine_pool
+from api.settings import SearchBackendName, settings
+from api.web.service.file import FileService
+from api.web.service.file_chunk import FileChunkService
+
+
+class IngestionLeaseLostError(RuntimeError):
+    pass
+
+
+class IngestionWorker:
+    """
+    Pool of threads claiming the ingestion jobs from the database queue and
+    creating the chunks embeddings of their files.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker[Session],
+        concurrency: int = settings.ingestion_workers,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        """Runs the worker threads until the worker is stopped."""
+        threads = [
+            threading.Thread(target=self._run_loop, name=f"ingestion-{i}")
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(f"Ingestion worker started with {self.concurrency} threads")
+        for thread in threads:
+            thread.join()
+        logger.info("Ingestion worker stopped")
+
+    def stop(self) -> None:
+        """Stops the worker threads once their current job is finished."""
+        self._stopping.set()
+
+    def _run_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                processed = self.process_next_job()
+            except Exception:
+                logger.exception("Unable to process the ingestion queue")
+                processed = False
+            if not processed:
+                self._stopping.wait(settings.ingestion_poll_interval)
+
+    def process_next_job(self) -> bool:
+        """
+        Claims the next ingestion job and creates the chunks embeddings of its file
+        :return: True if a job was processed, False if the queue was empty
+        """
+        with self.session_factory() as session:
+            ingestion_job_repository = IngestionJobRepository(IngestionJob, session)
+            job = ingestion_job_repository.claim_next(settings.ingestion_lock_timeout)
+            if job is None:
+                return False
+            # the attributes of the job are loaded again after a rollback, the
+            # attempt identifies this claim once another worker claimed the job
+            attempt = job.attempts
+            logger.info(f"Processing ingestion job {job.id}, attempt {attempt}")
+
+            def extend_lease() -> None:
+                # a file embedded for longer than the lock timeout keeps its job
+                if ingestion_job_repository.extend_lease(job, attempt) is None:
+                    raise IngestionLeaseLostError(
+                        f"Ingestion job {job.id} was claimed by another worker",
+                    )
+
+            try:
+                self._ingest_file(session, job.file_id, extend_lease)
+            except IngestionLeaseLostError as e:
+                session.rollback()
+                logger.warning(f"Stopped the ingestion of file {job.file_id}: {e}")
+            except Exception as e:
+                session.rollback()
+                logger.exception(f"Ingestion of file {job.file_id} failed")
+                # the groups of chunks committed before the failure are not searched,
+                # unless the job was claimed again, the deletion is rolled back then
+                file_chunk_repository = FileChunkRepository(FileChunk, session)
+                file_chunk_repository.delete_by_file_id(job.file_id)
+                file_chunk_repository.bump_corpus_generation()
+                failed_job = ingestion_job_repository.fail(
+                    job,
+                    attempt,
+                    str(e),
+                    max_attempts=settings.ingestion_max_attempts,
+                    retry_backoff=settings.ingestion_retry_backoff,
+                )
+                if failed_job is None:
+                    logger.warning(f"Ingestion job {job.id} was claimed again")
+            else:
+                if ingestion_job_repository.complete(job, attempt) is None:
+                    logger.warning(f"Ingestion job {job.id} was claimed again")
+            return True
+
+    @classmethod
+    def _ingest_file(
+        cls,
+        session: Session,
+        file_id: int,
+        extend_lease: Callable[[], None] | None = None,
+    ) -> None:
+        file_repository = FileRepository(File, session)
+        file = file_repository.get_by_id(file_id)
+        file_chunk_repository = FileChunkRepository(FileChunk, session)
+        # chunks left by an interrupted attempt are deleted with the first group
+        file_chunk_repository.delete_by_file_id(file_id)
+        duplicate = file_repository.find_ingested_duplicate(file)
+        if duplicate is not None:
+            file_chunk_repository.copy_file_chunks(duplicate.id, file.id)
+            session.commit()
+            logger.info(f"Reused the chunks of file {duplicate.id} for file {file.id}")
+        else:
+            file_chunk_service = FileChunkService(file_chunk_repository)
+            file_chunk_service.create_file_chunks_embedding(
+                file.id,
+                FileService.stream_text(file),
+                on_group_stored=extend_lease,
+            )
+        if settings.search_backend == SearchBackendName.VECTOR_STORE:
+            # appended once committed, a failed append is retried with the job
+            VectorStoreFileChunkRepository(
+                FileChunk,
+                session,
+                get_vector_store(),
+            ).sync_file_chunks(file.id)
+
+
+def run_worker() -> None:  # pragma: no cover
+    """Runs an ingestion worker process until it receives SIGINT or SIGTERM."""
+    engine = create_engine(
+        str(settings.db_url),
+        pool_size=settings.ingestion_workers,
+    )
+    session_factory = sessionmaker(engine, expire_on_commit=False)
+    if settings.worker_metrics_port:
+        register_engine_pool("worker", engine)
+        start_http_server(settings.worker_metrics_port)
+    worker = IngestionWorker(session_factory)
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: worker.stop())
+    try:
+        worker.run()
+    finally:
+        engine.dispose()